@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Compare requests/sec and latency of the WSGI (Flask on gevent) and ASGI (uvicorn) serving modes.
+
+Starts image/src/main.py locally in each mode and drives it with keep-alive connections:
+  ./benchmark.py --connections 50 --duration 10 --path /api/status --path /api/version
+"""
+
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'image', 'src')
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(mode, port):
+    env = dict(os.environ, SERVER=mode, PORT=str(port), ALIVE_TIMEOUT='1', VERSION='blue')
+    server = subprocess.Popen(
+        [sys.executable, 'main.py'], cwd=SRC, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            return server
+        except OSError:
+            time.sleep(0.1)
+    server.kill()
+    raise RuntimeError(f'{mode} server did not start on port {port}')
+
+
+async def read_response(reader):
+    head = await reader.readuntil(b'\r\n\r\n')
+    status = int(head.split(b' ', 2)[1])
+    length = 0
+    for line in head.split(b'\r\n'):
+        if line.lower().startswith(b'content-length:'):
+            length = int(line.split(b':', 1)[1])
+    await reader.readexactly(length)
+    return status
+
+
+async def connection(port, path, until, latencies, errors):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    request = f'GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n'.encode()
+    try:
+        while time.perf_counter() < until:
+            started = time.perf_counter()
+            writer.write(request)
+            status = await read_response(reader)
+            if status == 200:
+                latencies.append(time.perf_counter() - started)
+            else:
+                errors.append(status)
+    finally:
+        writer.close()
+
+
+async def load(port, path, connections, duration):
+    latencies, errors = [], []
+    # Warm up, then measure
+    await asyncio.gather(*[connection(port, path, time.perf_counter() + 1, [], []) for _ in range(connections)])
+    started = time.perf_counter()
+    until = started + duration
+    await asyncio.gather(*[connection(port, path, until, latencies, errors) for _ in range(connections)])
+    return latencies, errors, time.perf_counter() - started
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))] if values else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mode', action='append', choices=['wsgi', 'asgi'], help='Serving modes (default: both)')
+    parser.add_argument('--path', action='append', help='Paths to load (default: /api/status)')
+    parser.add_argument('--connections', type=int, default=50)
+    parser.add_argument('--duration', type=float, default=10, help='Seconds per mode and path')
+    args = parser.parse_args()
+
+    print(f'{"mode":<6} {"path":<14} {"requests":>9} {"req/s":>9} {"p50 ms":>8} {"p99 ms":>8} {"errors":>7}')
+    for mode in args.mode or ['wsgi', 'asgi']:
+        port = free_port()
+        server = start_server(mode, port)
+        try:
+            for path in args.path or ['/api/status']:
+                latencies, errors, elapsed = asyncio.run(load(port, path, args.connections, args.duration))
+                print(
+                    f'{mode:<6} {path:<14} {len(latencies):>9} {len(latencies) / elapsed:>9.0f} '
+                    f'{percentile(latencies, 50) * 1000:>8.2f} {percentile(latencies, 99) * 1000:>8.2f} {len(errors):>7}'
+                )
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == '__main__':
+    main()
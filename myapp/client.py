@@ -1,13 +1,31 @@
 #!/usr/bin/env python3
+"""
+Load generator and rollout meter for myapp.
 
-import requests
-import threading
-import json, sys, os
-from time import sleep
+Sends GET requests over a pool of keep-alive connections, either at a fixed rate (--rate, requests/sec)
+or with a fixed number of requests in flight (--concurrency), for --duration seconds or until Ctrl-C.
+Prints one line per --bucket seconds with the requests, errors and the `version` field of the responses,
+then latency percentiles, the errors, and the switchover: the time from the first response of the new
+version to the last response of any other version.
 
-threads = 10
+  ./client.py --rate 500 --duration 120 --csv rollout.csv --json rollout.json
+  ./client.py --concurrency 50 --duration 30 --url http://localhost:8080/api/status
 
-url = 'http://myapp.local.k3d/api/status'
+At a fixed rate, latency is measured from the time each request was scheduled, not sent, so that waiting
+for a connection of a stalled pool counts (no coordinated omission).
+"""
+
+import argparse
+import asyncio
+import csv
+import json
+import math
+import signal
+import ssl
+import sys
+import time
+from collections import Counter
+from urllib.parse import urlsplit
 
 color = {
     'reset': '\033[0m',
@@ -16,31 +34,385 @@ color = {
     'green': '\033[92m'
 }
 
-def get_status():
-    global file
+PERCENTILES = [50, 90, 99, 99.9]
+
+
+class Histogram:
+    """
+    Latencies in microseconds, HdrHistogram style: exact below 2048 us, then 1024 sub-buckets per power
+    of two (3 significant digits), so percentiles take constant memory however many requests are recorded.
+    """
+
+    SUB_BUCKETS = 1024
+
+    def __init__(self):
+        self.counts = Counter()
+        self.total = 0
+        self.sum = 0
+        self.max = 0
+
+    def record(self, seconds):
+        value = max(0, int(seconds * 1_000_000))
+        if value < 2 * self.SUB_BUCKETS:
+            index = value
+        else:
+            shift = value.bit_length() - 11
+            index = (shift + 1) * self.SUB_BUCKETS + (value >> shift) - self.SUB_BUCKETS
+        self.counts[index] += 1
+        self.total += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def merge(self, other):
+        self.counts.update(other.counts)
+        self.total += other.total
+        self.sum += other.sum
+        self.max = max(self.max, other.max)
+
+    def _value(self, index):
+        """Highest value of a bucket."""
+        if index < 2 * self.SUB_BUCKETS:
+            return index
+        shift = index // self.SUB_BUCKETS - 1
+        return ((index % self.SUB_BUCKETS + self.SUB_BUCKETS) << shift) + (1 << shift) - 1
+
+    def percentile(self, p):
+        """Latency in milliseconds."""
+        if not self.total:
+            return 0
+        rank = max(1, math.ceil(self.total * p / 100))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(self._value(index), self.max) / 1000
+        return self.max / 1000
+
+    def summary(self):
+        latency = {f'p{p:g}': round(self.percentile(p), 3) for p in PERCENTILES}
+        latency['max'] = self.max / 1000
+        latency['mean'] = round(self.sum / self.total / 1000, 3) if self.total else 0
+        return latency
+
+
+class Connection:
+    """A keep-alive HTTP/1.1 connection, reopened on the next request after an error or a Connection: close."""
+
+    def __init__(self, url, timeout):
+        parts = urlsplit(url)
+        self.tls = ssl.create_default_context() if parts.scheme == 'https' else None
+        self.host = parts.hostname
+        self.port = parts.port or (443 if self.tls else 80)
+        self.timeout = timeout
+        path = (parts.path or '/') + (f'?{parts.query}' if parts.query else '')
+        self.request = f'GET {path} HTTP/1.1\r\nHost: {parts.netloc}\r\nAccept: application/json\r\n\r\n'.encode()
+        self.reader = self.writer = None
+        self.opened = 0
+
+    async def get(self):
+        """Return the status and the body of one request."""
+        try:
+            return await asyncio.wait_for(self._get(), self.timeout)
+        except BaseException:
+            self.close()
+            raise
+
+    async def _get(self):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port, ssl=self.tls)
+            self.opened += 1
+        self.writer.write(self.request)
+        head = await self.reader.readuntil(b'\r\n\r\n')
+        lines = head.split(b'\r\n')
+        status = int(lines[0].split(b' ', 2)[1])
+        headers = dict(line.lower().split(b':', 1) for line in lines[1:] if b':' in line)
+        if headers.get(b'transfer-encoding', b'').strip() == b'chunked':
+            body = b''
+            while size := int((await self.reader.readline()).split(b';')[0], 16):
+                body += await self.reader.readexactly(size + 2)
+            await self.reader.readline()
+        else:
+            body = await self.reader.readexactly(int(headers.get(b'content-length', b'0')))
+        if headers.get(b'connection', b'').strip() == b'close':
+            self.close()
+        return status, body
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+class Bucket:
+    def __init__(self):
+        self.requests = 0
+        self.errors = Counter()
+        self.versions = Counter()
+        self.latency = Histogram()
+
+
+class Meter:
+    """Responses and errors per time bucket, and when each version and error was first and last seen."""
+
+    def __init__(self, bucket):
+        self.bucket = bucket
+        self.started = time.perf_counter()
+        self.buckets: dict[int, Bucket] = {}
+        self.seen: dict[str, list[float]] = {}
+        self.error_window: list[float] = []
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def _bucket(self, at):
+        return self.buckets.setdefault(int(at / self.bucket), Bucket())
+
+    def response(self, status, body, latency):
+        at = self.elapsed()
+        bucket = self._bucket(at)
+        bucket.requests += 1
+        bucket.latency.record(latency)
+        if status != 200:
+            self._error(bucket, f'http {status}', at)
+            return
+        try:
+            version = str(json.loads(body).get('version'))
+        except (ValueError, AttributeError):
+            version = '-'
+        bucket.versions[version] += 1
+        seen = self.seen.setdefault(version, [at, at])
+        seen[1] = at
+
+    def error(self, kind):
+        """A request without a response: timeout, refused or reset connection."""
+        at = self.elapsed()
+        bucket = self._bucket(at)
+        bucket.requests += 1
+        self._error(bucket, kind, at)
+
+    def _error(self, bucket, kind, at):
+        bucket.errors[kind] += 1
+        if not self.error_window:
+            self.error_window = [at, at]
+        self.error_window[1] = at
+
+    def line(self, index):
+        bucket = self.buckets.get(index, Bucket())
+        versions = ' '.join(
+            f'{color.get(version, "")}{version} {count}{color["reset"] if version in color else ""}'
+            for version, count in sorted(bucket.versions.items())
+        )
+        errors = sum(bucket.errors.values())
+        return (
+            f'{index * self.bucket:>7.1f}s {bucket.requests:>7} req {errors:>5} err '
+            f'p99 {bucket.latency.percentile(99):>8.2f} ms  {versions}'
+        )
+
+    def report(self, args, elapsed):
+        latency, errors = Histogram(), Counter()
+        for bucket in self.buckets.values():
+            latency.merge(bucket.latency)
+            errors.update(bucket.errors)
+        requests = sum(bucket.requests for bucket in self.buckets.values())
+        versions = sorted(self.seen, key=lambda version: self.seen[version][0])
+        switchover = None
+        if len(versions) > 1:
+            # Between the first response of the newest version and the last response of any other version:
+            # both were served if the old one was last seen after, none of them if before
+            first_new = self.seen[versions[-1]][0]
+            last_old = max(self.seen[version][1] for version in versions[:-1])
+            switchover = {
+                'from': versions[:-1],
+                'to': versions[-1],
+                'started_s': round(min(first_new, last_old), 3),
+                'ended_s': round(max(first_new, last_old), 3),
+                'seconds': round(abs(last_old - first_new), 3),
+                'mixed': last_old > first_new,
+            }
+        return {
+            'url': args.url,
+            'rate': args.rate,
+            'concurrency': args.concurrency,
+            'connections': args.connections,
+            'duration': round(elapsed, 3),
+            'requests': requests,
+            'rps': round(requests / elapsed, 1) if elapsed else 0,
+            'errors': dict(errors),
+            'latency_ms': latency.summary(),
+            'versions': {
+                version: {'first_s': round(self.seen[version][0], 3), 'last_s': round(self.seen[version][1], 3)}
+                for version in versions
+            },
+            'switchover': switchover,
+            'error_window': {
+                'first_s': round(self.error_window[0], 3),
+                'last_s': round(self.error_window[1], 3),
+                'seconds': round(self.error_window[1] - self.error_window[0], 3),
+            } if self.error_window else None,
+            'buckets': [self.row(index, versions) for index in range(max(self.buckets, default=-1) + 1)],
+        }
+
+    def row(self, index, versions):
+        bucket = self.buckets.get(index, Bucket())
+        row = {'t': round(index * self.bucket, 3), 'requests': bucket.requests, 'errors': sum(bucket.errors.values())}
+        row.update({version: bucket.versions[version] for version in versions})
+        row.update({f'p{p:g}_ms': round(bucket.latency.percentile(p), 3) for p in (50, 99)})
+        row['max_ms'] = bucket.latency.max / 1000
+        return row
+
+
+async def request(meter, pool, scheduled):
+    """Return False if no response was received."""
+    connection = await pool.get()
     try:
-        while True:
-            response = json.loads(requests.get(url).text)
-            print(response, file=file)
-            if color.get(response["version"]):
-                print(f'{color.get(response["version"])}{response}{color["reset"]}')
-            else: 
-                print(response)
-    except KeyboardInterrupt:
-        pass
+        status, body = await connection.get()
+    except asyncio.TimeoutError:
+        meter.error('timeout')
+        return False
+    except (OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError, IndexError) as e:
+        meter.error(type(e).__name__)
+        return False
+    else:
+        meter.response(status, body, time.perf_counter() - scheduled)
+        return True
+    finally:
+        pool.put_nowait(connection)
+
+
+async def at_rate(meter, pool, rate, stop):
+    """Schedule requests every 1/rate seconds, whether or not the previous ones have completed."""
+    tasks = set()
+    started = time.perf_counter()
+    sent = 0
+    while not stop.is_set():
+        scheduled = started + sent / rate
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            try:
+                await asyncio.wait_for(stop.wait(), delay)
+                break
+            except asyncio.TimeoutError:
+                pass
+        task = asyncio.create_task(request(meter, pool, scheduled))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+        sent += 1
+    if tasks:
+        await asyncio.wait(tasks)
+
+
+async def with_concurrency(meter, pool, stop):
+    """Send the next request of each worker as soon as its previous one completes."""
+    async def worker():
+        while not stop.is_set():
+            if not await request(meter, pool, time.perf_counter()):
+                # Don't spin on refused connections while no pod listens
+                await asyncio.sleep(0.01)
+    await asyncio.gather(*[worker() for _ in range(pool.qsize())])
+
+
+async def report_buckets(meter, stop, done):
+    index = 0
+    while not stop.is_set():
+        try:
+            await asyncio.wait_for(stop.wait(), (index + 1) * meter.bucket - meter.elapsed())
+        except asyncio.TimeoutError:
+            print(meter.line(index), flush=True)
+            index += 1
+    # The last buckets, once their requests have completed
+    await done.wait()
+    for index in range(index, max(meter.buckets, default=-1) + 1):
+        print(meter.line(index))
+
+
+async def run(args):
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    if args.duration:
+        loop.call_later(args.duration, stop.set)
+
+    connections = args.connections if args.rate else args.concurrency
+    pool = asyncio.Queue()
+    opened = [Connection(args.url, args.timeout) for _ in range(connections)]
+    for connection in opened:
+        pool.put_nowait(connection)
+    meter = Meter(args.bucket)
+    done = asyncio.Event()
+    reporter = asyncio.create_task(report_buckets(meter, stop, done))
+    if args.rate:
+        await at_rate(meter, pool, args.rate, stop)
+    else:
+        await with_concurrency(meter, pool, stop)
+    elapsed = meter.elapsed()
+    done.set()
+    await reporter
+    for connection in opened:
+        connection.close()
+    report = meter.report(args, elapsed)
+    # More than --connections when the server closed or reset them, e.g. when pods are replaced
+    report['connections_opened'] = sum(connection.opened for connection in opened)
+    return report
+
+
+def print_report(report):
+    latency = report['latency_ms']
+    print(
+        f'\n{report["requests"]} requests in {report["duration"]:.1f}s, {report["rps"]:.0f} req/s, '
+        f'{report["connections_opened"]} connections opened'
+    )
+    print('latency ms: ' + '  '.join(f'{name} {value:.2f}' for name, value in latency.items()))
+    for version, seen in report['versions'].items():
+        print(f'version {version}: first {seen["first_s"]:.3f}s, last {seen["last_s"]:.3f}s')
+    if report['switchover']:
+        switchover = report['switchover']
+        print(
+            f'switchover {", ".join(switchover["from"])} -> {switchover["to"]}: {switchover["seconds"]:.3f}s '
+            f'from {switchover["started_s"]:.3f}s, {"mixed versions" if switchover["mixed"] else "no version served"}'
+        )
+    if report['errors']:
+        window = report['error_window']
+        errors = ', '.join(f'{kind} {count}' for kind, count in sorted(report['errors'].items()))
+        print(f'errors: {errors} between {window["first_s"]:.3f}s and {window["last_s"]:.3f}s')
+    else:
+        print('errors: none')
+
+
+def write_csv(report, path):
+    rows = report['buckets']
+    fields = ['t', 'requests', 'errors', *report['versions'], 'p50_ms', 'p99_ms', 'max_ms']
+    with open(path, 'w', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://myapp.local.k3d/api/status')
+    load = parser.add_mutually_exclusive_group()
+    load.add_argument('--rate', type=float, help='Requests per second')
+    load.add_argument('--concurrency', type=int, default=10, help='Requests in flight (default: %(default)s)')
+    parser.add_argument('--connections', type=int, default=100, help='Keep-alive connections at a fixed rate (default: %(default)s)')
+    parser.add_argument('--duration', type=float, default=0, help='Seconds (default: until Ctrl-C)')
+    parser.add_argument('--bucket', type=float, default=1, help='Seconds per bucket (default: %(default)s)')
+    parser.add_argument('--timeout', type=float, default=5, help='Seconds per request (default: %(default)s)')
+    parser.add_argument('--csv', help='Write the buckets to this CSV file')
+    parser.add_argument('--json', help='Write the report to this JSON file')
+    args = parser.parse_args()
+    if args.rate:
+        args.concurrency = None
+
+    report = asyncio.run(run(args))
+    print_report(report)
+    if args.csv:
+        write_csv(report, args.csv)
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(report, file, indent=2)
+    return 1 if report['errors'] else 0
 
 
 if __name__ == '__main__':
-    filename = "out.txt"
-    if os.path.exists(filename): os.remove(filename)
-    file = open(filename, "a")
-
-    for _ in range(threads):
-        thread = threading.Thread(target=get_status, daemon=True)
-        thread.start()
-
-    while True:
-        try: sleep(1)
-        except KeyboardInterrupt:
-            file.close()
-            sys.exit()
\ No newline at end of file
+    sys.exit(main())
@@ -1,16 +1,31 @@
+import json
 from datetime import datetime
+from time import time
+from flask import Response
 from flask_restful import Resource
 from config import Config
 
-class Status(Resource):
-    def get(self):
+VERSION_BODY = (json.dumps({"version": Config.version}) + "\n").encode()
+
+_status = {"tick": None, "body": b""}
+
+def status_body():
+    """Status response, serialized once per tick of Config.status_tick seconds."""
+    tick = int(time() / Config.status_tick)
+    if tick != _status["tick"]:
         resp = {
             "date": datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f"),
             "timeout": Config.alive_timeout,
             "version": Config.version
         }
-        return resp, 200
+        _status["tick"] = tick
+        _status["body"] = (json.dumps(resp) + "\n").encode()
+    return _status["body"]
+
+class Status(Resource):
+    def get(self):
+        return Response(status_body(), mimetype='application/json')
 
 class Version(Resource):
     def get(self):
-        return {"version": Config.version}, 200
\ No newline at end of file
+        return Response(VERSION_BODY, mimetype='application/json')
@@ -0,0 +1,80 @@
+"""
+ASGI application serving the same routes as the Flask application with pre-serialized responses,
+selected with SERVER=asgi and served by uvicorn.
+"""
+
+import asyncio
+
+from alive import CHECK_BODY
+from apis import VERSION_BODY, status_body
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, lag_task, metrics_body, request_finished, request_started
+
+ROUTES = {
+    '/alive': lambda: CHECK_BODY,
+    '/api/version': lambda: VERSION_BODY,
+    '/api/status': status_body,
+    '/metrics': metrics_body,
+}
+CONTENT_TYPES = {'/metrics': METRICS_CONTENT_TYPE.encode()}
+NOT_FOUND_BODY = b'{"message": "Not Found"}\n'
+METHOD_NOT_ALLOWED_BODY = b'{"message": "Method Not Allowed"}\n'
+ALLOW = b'OPTIONS, GET, HEAD'
+# Same CORS policy as the Flask application (flask-cors defaults): any origin on /api/*
+CORS_METHODS = b'DELETE, GET, HEAD, OPTIONS, PATCH, POST, PUT'
+
+
+def cors_headers(scope):
+    """The requesting origin is echoed, '*' without one; preflight requests also get the allowed methods and headers."""
+    request_headers = dict(scope['headers'])
+    origin = request_headers.get(b'origin')
+    if not origin:
+        return [(b'access-control-allow-origin', b'*')]
+    headers = [(b'access-control-allow-origin', origin), (b'vary', b'Origin')]
+    if scope['method'] == 'OPTIONS' and b'access-control-request-method' in request_headers:
+        headers.append((b'access-control-allow-methods', CORS_METHODS))
+        if b'access-control-request-headers' in request_headers:
+            headers.append((b'access-control-allow-headers', request_headers[b'access-control-request-headers']))
+    return headers
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        lag = None
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                lag = asyncio.create_task(lag_task())
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if lag:
+                    lag.cancel()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+    if scope['type'] != 'http':
+        return
+
+    started = request_started()
+    path = scope['path']
+    handler = ROUTES.get(path)
+    if handler is None:
+        status, body = 404, NOT_FOUND_BODY
+    elif scope['method'] == 'OPTIONS':
+        status, body = 200, b''
+    elif scope['method'] not in ('GET', 'HEAD'):
+        status, body = 405, METHOD_NOT_ALLOWED_BODY
+    else:
+        status, body = 200, handler()
+
+    headers = [
+        (b'content-type', CONTENT_TYPES.get(path, b'application/json')),
+        (b'content-length', str(len(body)).encode()),
+    ]
+    if status == 405 or (handler is not None and scope['method'] == 'OPTIONS'):
+        headers.append((b'allow', ALLOW))
+    if path.startswith('/api/'):
+        headers += cors_headers(scope)
+    try:
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': b'' if scope['method'] == 'HEAD' else body})
+    finally:
+        request_finished(path, scope['method'], status, started)
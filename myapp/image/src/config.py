@@ -6,3 +6,12 @@ class Config:
     debug = getenv('DEBUG') == "true"
     alive_timeout = randrange(0, int(getenv('ALIVE_TIMEOUT', 60)), 5)
     version = getenv('VERSION', 'red')
+    # wsgi: Flask on gevent, asgi: pre-serialized handlers on uvicorn
+    server = getenv('SERVER', 'wsgi')
+    # Seconds the Status date is reused for
+    status_tick = float(getenv('STATUS_TICK', 0.01))
+    log_level = getenv('LOG_LEVEL', 'DEBUG')
+    # Records waiting for the log writer thread; more are dropped
+    log_queue_size = int(getenv('LOG_QUEUE_SIZE', 10000))
+    # Share of access log lines written, e.g. 0.01 for 1%
+    access_log_sample = float(getenv('ACCESS_LOG_SAMPLE', 1))
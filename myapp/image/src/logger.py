@@ -1,10 +1,57 @@
+import atexit
 import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
+from random import random
 from pythonjsonlogger import jsonlogger
 
+from config import Config
+
+# Loggers of the request access logs: gevent (see main.py) and uvicorn
+ACCESS_LOGGERS = ('access', 'uvicorn.access')
+
+
+class LogStats:
+    """Counters of the log pipeline."""
+    queued = 0
+    dropped = 0
+    sampled_out = 0
+    filtered = 0
+
+
+# Probes and scrapes, not logged
+QUIET_PATHS = ('/alive', '/metrics')
+
 
 class HealthCheckFilter(logging.Filter):
+    """Drops the access log lines of QUIET_PATHS without formatting them."""
+    def filter(self, record):
+        if record.args:
+            # uvicorn: the path is one of the arguments
+            keep = not any(path in record.args for path in QUIET_PATHS)
+        else:
+            message = str(record.msg)
+            keep = not any(path in message for path in QUIET_PATHS)
+        if not keep:
+            LogStats.filtered += 1
+        return keep
+
+class AccessLogSampler(logging.Filter):
+    """Keeps a random Config.access_log_sample share of the access log lines."""
     def filter(self, record):
-        return '/alive' not in record.getMessage()
+        if record.name not in ACCESS_LOGGERS or random() < Config.access_log_sample:
+            return True
+        LogStats.sampled_out += 1
+        return False
+
+class NonBlockingQueueHandler(QueueHandler):
+    """Queues records for the writer thread, and drops them when the queue is full."""
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+            LogStats.queued += 1
+        except queue.Full:
+            LogStats.dropped += 1
 
 class CustomJsonFormatter(jsonlogger.JsonFormatter):
     def add_fields(self, log_record, record, message_dict):
@@ -13,12 +60,31 @@ class CustomJsonFormatter(jsonlogger.JsonFormatter):
 
 
 appLogger = logging.getLogger()
-appLogger.setLevel(logging.DEBUG)
-appLogger.addFilter(HealthCheckFilter())
+appLogger.setLevel(Config.log_level)
 
+# Records are filtered and sampled on the request path, formatted and written by a thread
 logHandler = logging.StreamHandler()
-
 formatter = CustomJsonFormatter("%(message)s", timestamp=True)
 logHandler.setFormatter(formatter)
 
-appLogger.addHandler(logHandler)
+queueHandler = NonBlockingQueueHandler(queue.Queue(Config.log_queue_size))
+# On the handler, so that they also filter records propagated by other loggers (uvicorn)
+queueHandler.addFilter(HealthCheckFilter())
+queueHandler.addFilter(AccessLogSampler())
+appLogger.addHandler(queueHandler)
+
+logListener = QueueListener(queueHandler.queue, logHandler)
+logListener.start()
+
+
+def stop_logging():
+    """Log the pipeline counters, then write the queued records and stop the writer thread."""
+    appLogger.info(
+        f'Log lines: {LogStats.queued} queued, {LogStats.dropped} dropped (queue full), '
+        f'{LogStats.sampled_out} sampled out, {LogStats.filtered} filtered'
+    )
+    logListener.stop()
+
+atexit.register(stop_logging)
+
+accessLogger = logging.getLogger('access')
@@ -1,24 +1,36 @@
 #!/usr/bin/env python3
 
 from flask import Flask
-from gevent.pywsgi import WSGIServer
+import socket
+from gevent.pywsgi import WSGIServer, WSGIHandler
 from flask_cors import CORS
 from flask_restful import Api
 from time import sleep
 
-from logger import appLogger
+from logger import appLogger, accessLogger
 from config import Config
 from alive import Check
 from apis import Version, Status
+from metrics import Metrics, MetricsMiddleware, lag_greenlet
 
 app = Flask(__name__)
 app.logger = appLogger
+app.wsgi_app = MetricsMiddleware(app.wsgi_app)
 cors = CORS(app, resources={r"/api/*": {"origins": "*"}})
 api = Api(app)
 
 api.add_resource(Check, '/alive')
 api.add_resource(Version, '/api/version')
 api.add_resource(Status, '/api/status')
+api.add_resource(Metrics, '/metrics')
+
+
+class NoDelayHandler(WSGIHandler):
+    """Sends the response body right after the headers, which gevent writes separately, instead of after the client's delayed ACK."""
+    def handle(self):
+        self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        super().handle()
+
 
 if __name__ == '__main__':
     port = Config.port
@@ -30,7 +42,14 @@ if __name__ == '__main__':
 
     if debug:
         app.run(host='0.0.0.0', port=port, debug=debug)
+    elif Config.server == 'asgi':
+        import uvicorn
+        appLogger.info(f"ASGI server running on port: {port}")
+        # log_config=None: uvicorn logs through the JSON root logger
+        uvicorn.run('asgi:app', host='0.0.0.0', port=port, log_config=None)
     else:
-        http_server = WSGIServer(('', port), app, log=app.logger)
+        import gevent
+        gevent.spawn(lag_greenlet)
+        http_server = WSGIServer(('', port), app, log=accessLogger, handler_class=NoDelayHandler)
         appLogger.info(f"Server running on port: {port}")        
         http_server.serve_forever()
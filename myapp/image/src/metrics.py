@@ -0,0 +1,129 @@
+"""
+Request metrics in the Prometheus text format on /metrics, to autoscale on traffic instead of CPU.
+Plain counters: both servers run the requests on one thread, as greenlets or asyncio tasks.
+"""
+
+import asyncio
+from bisect import bisect_left
+from time import perf_counter
+from flask import Response
+from flask_restful import Resource
+
+from config import Config
+from logger import LogStats, queueHandler
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+# Routes with their own series, the others are counted as "other"
+ROUTES = ('/alive', '/api/version', '/api/status', '/metrics')
+METHODS = ('GET', 'HEAD', 'OPTIONS', 'POST', 'PUT', 'PATCH', 'DELETE')
+# Upper bounds of the latency buckets, in seconds
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+# Seconds between two measures of the event loop lag
+LAG_INTERVAL = 0.1
+
+
+class RequestStats:
+    """Counters of the requests."""
+    in_flight = 0
+    # (route, method, status): requests
+    requests = {}
+    # route: [requests per bucket, the last one above BUCKETS], seconds
+    durations = {}
+    # Seconds a ready greenlet or task waits for the event loop
+    loop_lag = 0.0
+
+
+def request_started():
+    RequestStats.in_flight += 1
+    return perf_counter()
+
+def request_finished(path, method, status, started):
+    duration = perf_counter() - started
+    RequestStats.in_flight -= 1
+    route = path if path in ROUTES else 'other'
+    key = (route, method if method in METHODS else 'other', status)
+    RequestStats.requests[key] = RequestStats.requests.get(key, 0) + 1
+    histogram = RequestStats.durations.get(route)
+    if histogram is None:
+        histogram = RequestStats.durations[route] = [[0] * (len(BUCKETS) + 1), 0.0]
+    histogram[0][bisect_left(BUCKETS, duration)] += 1
+    histogram[1] += duration
+
+
+class MetricsMiddleware:
+    """Counts the requests of a WSGI application."""
+    def __init__(self, app):
+        self.app = app
+
+    def __call__(self, environ, start_response):
+        started = request_started()
+        status = [500]
+        def start(status_line, headers, exc_info=None):
+            status[0] = int(status_line[:3])
+            return start_response(status_line, headers, exc_info)
+        try:
+            return self.app(environ, start)
+        finally:
+            request_finished(environ['PATH_INFO'], environ['REQUEST_METHOD'], status[0], started)
+
+
+def lag_greenlet():
+    """Measures the loop lag of the gevent server."""
+    import gevent
+    while True:
+        started = perf_counter()
+        gevent.sleep(LAG_INTERVAL)
+        RequestStats.loop_lag = perf_counter() - started - LAG_INTERVAL
+
+async def lag_task():
+    """Measures the loop lag of the asyncio server."""
+    while True:
+        started = perf_counter()
+        await asyncio.sleep(LAG_INTERVAL)
+        RequestStats.loop_lag = perf_counter() - started - LAG_INTERVAL
+
+
+def metrics_body():
+    lines = [
+        '# HELP myapp_info Version and serving mode.',
+        '# TYPE myapp_info gauge',
+        f'myapp_info{{version="{Config.version}",server="{Config.server}"}} 1',
+        '# HELP myapp_requests_total Requests by route, method and status.',
+        '# TYPE myapp_requests_total counter',
+    ]
+    for (route, method, status), count in sorted(RequestStats.requests.items()):
+        lines.append(f'myapp_requests_total{{route="{route}",method="{method}",status="{status}"}} {count}')
+    lines += [
+        '# HELP myapp_requests_in_flight Requests being served, this scrape included.',
+        '# TYPE myapp_requests_in_flight gauge',
+        f'myapp_requests_in_flight {RequestStats.in_flight}',
+        '# HELP myapp_request_duration_seconds Request latency by route.',
+        '# TYPE myapp_request_duration_seconds histogram',
+    ]
+    for route, (counts, seconds) in sorted(RequestStats.durations.items()):
+        total = 0
+        for le, count in zip(BUCKETS + ('+Inf',), counts):
+            total += count
+            lines.append(f'myapp_request_duration_seconds_bucket{{route="{route}",le="{le}"}} {total}')
+        lines.append(f'myapp_request_duration_seconds_sum{{route="{route}"}} {seconds:.6f}')
+        lines.append(f'myapp_request_duration_seconds_count{{route="{route}"}} {total}')
+    # LOG_QUEUE_SIZE=0: unbounded queue
+    queue_usage = queueHandler.queue.qsize() / Config.log_queue_size if Config.log_queue_size else 0
+    lines += [
+        '# HELP myapp_loop_lag_seconds Delay of the event loop in running a ready greenlet or task.',
+        '# TYPE myapp_loop_lag_seconds gauge',
+        f'myapp_loop_lag_seconds {max(0.0, RequestStats.loop_lag):.6f}',
+        '# HELP myapp_log_queue_usage Share of the log queue waiting for the writer thread.',
+        '# TYPE myapp_log_queue_usage gauge',
+        f'myapp_log_queue_usage {queue_usage:.4f}',
+        '# HELP myapp_log_records_total Log records by outcome.',
+        '# TYPE myapp_log_records_total counter',
+    ]
+    for outcome in ('queued', 'dropped', 'sampled_out', 'filtered'):
+        lines.append(f'myapp_log_records_total{{outcome="{outcome}"}} {getattr(LogStats, outcome)}')
+    return ('\n'.join(lines) + '\n').encode()
+
+
+class Metrics(Resource):
+    def get(self):
+        return Response(metrics_body(), content_type=CONTENT_TYPE)
@@ -0,0 +1,89 @@
+"""
+ASGI application tests: responses and CORS headers, matching the Flask application.
+"""
+
+import asyncio
+
+import asgi
+
+
+def request(method, path, headers=None):
+    """Run one HTTP request through the ASGI application: (status, headers, body)."""
+    scope = {
+        'type': 'http',
+        'method': method,
+        'path': path,
+        'headers': [(name.lower().encode(), value.encode()) for name, value in (headers or {}).items()],
+    }
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(asgi.app(scope, receive, send))
+    start, body = messages
+    return start['status'], {name.decode(): value.decode() for name, value in start['headers']}, body['body']
+
+
+class TestRoutes:
+
+    def test_get(self):
+        status, headers, body = request('GET', '/api/version')
+        assert status == 200
+        assert headers['content-type'] == 'application/json'
+        assert int(headers['content-length']) == len(body)
+
+    def test_head_has_no_body(self):
+        status, headers, body = request('HEAD', '/alive')
+        assert status == 200
+        assert body == b''
+        assert int(headers['content-length']) > 0
+
+    def test_not_found(self):
+        status, headers, _ = request('GET', '/nope')
+        assert status == 404
+        assert 'allow' not in headers
+
+    def test_method_not_allowed(self):
+        status, headers, _ = request('POST', '/api/status')
+        assert status == 405
+        assert headers['allow'] == 'OPTIONS, GET, HEAD'
+
+
+class TestCors:
+
+    def test_any_origin_without_origin_header(self):
+        _, headers, _ = request('GET', '/api/version')
+        assert headers['access-control-allow-origin'] == '*'
+
+    def test_origin_is_echoed(self):
+        _, headers, _ = request('GET', '/api/version', {'Origin': 'https://ui.example'})
+        assert headers['access-control-allow-origin'] == 'https://ui.example'
+        assert headers['vary'] == 'Origin'
+
+    def test_no_cors_outside_api(self):
+        _, headers, _ = request('GET', '/alive', {'Origin': 'https://ui.example'})
+        assert 'access-control-allow-origin' not in headers
+
+    def test_preflight(self):
+        status, headers, body = request('OPTIONS', '/api/status', {
+            'Origin': 'https://ui.example',
+            'Access-Control-Request-Method': 'GET',
+            'Access-Control-Request-Headers': 'X-Request-Id, Content-Type',
+        })
+        assert status == 200
+        assert body == b''
+        assert headers['allow'] == 'OPTIONS, GET, HEAD'
+        assert headers['access-control-allow-origin'] == 'https://ui.example'
+        assert headers['access-control-allow-methods'] == 'DELETE, GET, HEAD, OPTIONS, PATCH, POST, PUT'
+        assert headers['access-control-allow-headers'] == 'X-Request-Id, Content-Type'
+        assert headers['vary'] == 'Origin'
+
+    def test_options_without_preflight(self):
+        status, headers, _ = request('OPTIONS', '/api/version')
+        assert status == 200
+        assert headers['access-control-allow-origin'] == '*'
+        assert 'access-control-allow-methods' not in headers
@@ -0,0 +1,184 @@
+"""
+Client tests against httpx.MockTransport: retries and backoff, Idempotency-Key headers and batches.
+"""
+
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from vmclient import ApiError, AsyncClient, Client
+from vmclient import client as client_module
+
+
+class Server:
+    """Mock transport handler: answers with the queued responses, then 200 with the request body, recording requests."""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        if self.responses:
+            response = self.responses.pop(0)
+            if isinstance(response, Exception):
+                raise response
+            return response
+        return httpx.Response(200, json=json.loads(request.content) if request.content else {})
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Record the backoff delays instead of sleeping."""
+    delays = []
+    monkeypatch.setattr(client_module.time, "sleep", delays.append)
+    return delays
+
+
+def client(server, **kwargs):
+    return Client("http://vm", transport=httpx.MockTransport(server), actor=None, **kwargs)
+
+
+class TestRoutes:
+
+    def test_routes_are_abstract(self):
+        with pytest.raises(TypeError):
+            client_module._Routes()
+
+
+class TestRetries:
+
+    def test_retry_then_success(self, sleeps):
+        server = Server(httpx.Response(503), httpx.Response(429), httpx.Response(200, json={"status": "ok"}))
+        with client(server) as vm:
+            assert vm.health() == {"status": "ok"}
+        assert len(server.requests) == 3
+        assert len(sleeps) == 2
+
+    def test_retry_after_is_honored(self, sleeps):
+        server = Server(httpx.Response(429, headers={"Retry-After": "3"}))
+        with client(server) as vm:
+            vm.health()
+        assert sleeps[0] >= 3
+
+    def test_backoff_grows_and_is_capped(self, monkeypatch):
+        monkeypatch.setattr(client_module.random, "uniform", lambda low, high: high)
+        delays = [client_module._backoff(attempt) for attempt in range(8)]
+        assert delays[:3] == [0.2, 0.4, 0.8]
+        assert delays[-1] == client_module.BACKOFF_MAX
+
+    def test_retries_exhausted(self, sleeps):
+        server = Server(*[httpx.Response(500, json={"detail": "boom"})] * 3)
+        with client(server, retries=2) as vm, pytest.raises(ApiError) as error:
+            vm.health()
+        assert error.value.status_code == 500
+        assert error.value.detail == "boom"
+        assert len(server.requests) == 3
+
+    def test_client_error_not_retried(self, sleeps):
+        server = Server(httpx.Response(404, json={"detail": "Domain not found"}))
+        with client(server) as vm, pytest.raises(ApiError) as error:
+            vm.get_domain("missing")
+        assert error.value.status_code == 404
+        assert len(server.requests) == 1
+        assert sleeps == []
+
+    def test_expected_status_not_retried(self, sleeps):
+        server = Server(httpx.Response(503, json={"status": "not ready"}))
+        with client(server) as vm:
+            assert vm.ready() == {"status": "not ready"}
+        assert len(server.requests) == 1
+
+    def test_transport_error_retried(self, sleeps):
+        server = Server(httpx.ConnectError("refused"), httpx.Response(200, json={"status": "ok"}))
+        with client(server) as vm:
+            assert vm.health() == {"status": "ok"}
+        assert len(server.requests) == 2
+
+    def test_transport_error_raised_after_retries(self, sleeps):
+        server = Server(*[httpx.ConnectError("refused")] * 2)
+        with client(server, retries=1) as vm, pytest.raises(httpx.ConnectError):
+            vm.health()
+
+    def test_async_retry_then_success(self, monkeypatch):
+        monkeypatch.setattr(client_module, "_backoff", lambda attempt, response=None: 0)
+        server = Server(httpx.Response(502), httpx.Response(200, json={"status": "ok"}))
+
+        async def run():
+            async with AsyncClient("http://vm", transport=httpx.MockTransport(server), actor=None) as vm:
+                return await vm.health()
+
+        assert asyncio.run(run()) == {"status": "ok"}
+        assert len(server.requests) == 2
+
+
+class TestIdempotencyKey:
+
+    def test_mutation_keeps_key_across_retries(self, sleeps):
+        server = Server(httpx.Response(503))
+        with client(server) as vm:
+            vm.create_domain("webapp", "2025-01-01")
+        keys = [request.headers.get("Idempotency-Key") for request in server.requests]
+        assert len(keys) == 2
+        assert keys[0] and keys[0] == keys[1]
+
+    def test_mutations_get_distinct_keys(self, sleeps):
+        server = Server()
+        with client(server) as vm:
+            vm.create_domain("webapp", "2025-01-01")
+            vm.delete_domain("webapp")
+        keys = {request.headers.get("Idempotency-Key") for request in server.requests}
+        assert len(keys) == 2 and None not in keys
+
+    def test_no_key_on_lookups_and_reads(self, sleeps):
+        server = Server()
+        with client(server) as vm:
+            vm.lookup_active_domains([{"name": "webapp", "env": "dev"}])
+            vm.lookup_image_versions([{"name": "frontend", "version": "1.0"}])
+            vm.list_domains()
+        assert [request.method for request in server.requests] == ["POST", "POST", "GET"]
+        assert all("Idempotency-Key" not in request.headers for request in server.requests)
+
+
+class TestBatch:
+
+    ITEMS = [{"name": "webapp", "version": f"2025-01-0{i}"} for i in range(1, 6)]
+
+    def test_batch_is_chunked(self, sleeps):
+        server = Server()
+        with client(server, batch_size=2) as vm:
+            results = vm.set_domains_active(self.ITEMS)
+        assert results == self.ITEMS
+        assert [json.loads(request.content) for request in server.requests] == [
+            self.ITEMS[0:2], self.ITEMS[2:4], self.ITEMS[4:5]
+        ]
+        assert all(request.method == "PUT" for request in server.requests)
+        assert all(request.url.path == "/v1/domains/active" for request in server.requests)
+        # Each chunk is a request of its own, with its own key
+        assert len({request.headers["Idempotency-Key"] for request in server.requests}) == 3
+
+    def test_single_item_is_wrapped(self, sleeps):
+        server = Server()
+        with client(server) as vm:
+            assert vm.promote_domains(self.ITEMS[0]) == [self.ITEMS[0]]
+        assert json.loads(server.requests[0].content) == [self.ITEMS[0]]
+
+    def test_failed_chunk_raises(self, sleeps):
+        server = Server(httpx.Response(200, json=self.ITEMS[0:2]), httpx.Response(404, json={"detail": "not found"}))
+        with client(server, batch_size=2) as vm, pytest.raises(ApiError) as error:
+            vm.set_domains_tested(self.ITEMS)
+        assert error.value.status_code == 404
+        assert len(server.requests) == 2
+
+    def test_async_batch_is_chunked(self):
+        server = Server()
+
+        async def run():
+            async with AsyncClient("http://vm", transport=httpx.MockTransport(server), actor=None,
+                                   batch_size=3) as vm:
+                return await vm.update_domains(self.ITEMS)
+
+        assert asyncio.run(run()) == self.ITEMS
+        assert [len(json.loads(request.content)) for request in server.requests] == [3, 2]
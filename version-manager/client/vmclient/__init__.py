@@ -0,0 +1,7 @@
+"""
+Python client for the Version Manager API.
+"""
+
+from vmclient.client import ApiError, AsyncClient, Client
+
+__all__ = ["ApiError", "AsyncClient", "Client"]
@@ -0,0 +1,141 @@
+"""
+Command line interface for CI runner steps.
+
+Examples:
+  vm image register backend 2025-01-03-16-52-27
+  vm image tested backend 2025-01-03-16-52-27
+  vm domain promote webapp 2025-01-03-20-12-33
+  vm manifest prod --domain webapp --format json
+
+The server URL is taken from --url or VERSION_MANAGER_URL. Results are printed as JSON.
+"""
+
+import argparse
+import json
+import sys
+
+import httpx
+
+from vmclient.client import DEFAULT_ACTOR, DEFAULT_RETRIES, DEFAULT_URL, ApiError, Client
+
+
+def _range_options(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--since", help="Only versions at or after this version")
+    parser.add_argument("--until", help="Only versions at or before this version")
+    parser.add_argument("--latest", type=int, help="Only the N newest versions")
+
+
+def _parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="vm", description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=DEFAULT_URL, help="Version Manager URL (default: %(default)s)")
+    parser.add_argument("--retries", type=int, default=DEFAULT_RETRIES, help="Retries on 429 and 5xx responses")
+    parser.add_argument("--actor", default=DEFAULT_ACTOR, help="Author of the changes in the audit log (default: %(default)s)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    image = commands.add_parser("image", help="Images").add_subparsers(dest="action", required=True)
+    p = image.add_parser("create", help="Create an image in a domain")
+    p.add_argument("name")
+    p.add_argument("domain")
+    p.set_defaults(run=lambda c, a: c.create_image(a.name, a.domain))
+    p = image.add_parser("register", help="Register an image version, pinned in the active dev domain version")
+    p.add_argument("name")
+    p.add_argument("version")
+    p.set_defaults(run=lambda c, a: c.create_image_version(a.name, a.version))
+    p = image.add_parser("tested", help="Set an image version as tested")
+    p.add_argument("name")
+    p.add_argument("version")
+    p.add_argument("--untested", action="store_true", help="Clear the tested flag instead")
+    p.set_defaults(run=lambda c, a: c.set_image_tested(a.name, a.version, not a.untested))
+    p = image.add_parser("get", help="Get image versions")
+    p.add_argument("name")
+    _range_options(p)
+    p.set_defaults(run=lambda c, a: c.get_image(a.name, a.since, a.until, a.latest))
+    p = image.add_parser("domains", help="Domain versions that contain an image version")
+    p.add_argument("name")
+    p.add_argument("version")
+    p.set_defaults(run=lambda c, a: c.get_image_version_domains(a.name, a.version))
+
+    domain = commands.add_parser("domain", help="Domains").add_subparsers(dest="action", required=True)
+    p = domain.add_parser("create", help="Create a domain version with the tested images")
+    p.add_argument("name")
+    p.add_argument("version")
+    p.set_defaults(run=lambda c, a: c.create_domain(a.name, a.version))
+    p = domain.add_parser("get", help="Get domain versions")
+    p.add_argument("name")
+    _range_options(p)
+    p.set_defaults(run=lambda c, a: c.get_domain(a.name, a.since, a.until, a.latest))
+    p = domain.add_parser("active", help="Active domain versions")
+    p.add_argument("name", nargs="?", help="Only this domain")
+    p.add_argument("--env", help="Only this environment: dev, staging, prod")
+    p.add_argument("--at", help="Active versions at this time (ISO 8601), all domains only")
+    p.set_defaults(run=lambda c, a: c.get_active_domain(a.name, a.env) if a.name else c.list_active_domains(a.env, a.at))
+    p = domain.add_parser("current", help="Current state of a domain in an environment")
+    p.add_argument("name")
+    p.add_argument("--env", default="dev")
+    p.set_defaults(run=lambda c, a: c.get_current_state(a.name, a.env))
+    p = domain.add_parser("tested", help="Set a domain version as tested")
+    p.add_argument("name")
+    p.add_argument("version")
+    p.add_argument("--untested", action="store_true", help="Clear the tested flag instead")
+    p.set_defaults(run=lambda c, a: c.set_domains_tested({"name": a.name, "version": a.version, "tested": not a.untested}))
+    p = domain.add_parser("activate", help="Set a domain version as active")
+    p.add_argument("name")
+    p.add_argument("version")
+    p.set_defaults(run=lambda c, a: c.set_domains_active({"name": a.name, "version": a.version}))
+    p = domain.add_parser("promote", help="Promote a domain version to the next environment")
+    p.add_argument("name")
+    p.add_argument("version")
+    p.set_defaults(run=lambda c, a: c.promote_domains({"name": a.name, "version": a.version}))
+    p = domain.add_parser("diff", help="Image differences between two domain versions")
+    p.add_argument("name")
+    p.add_argument("from_version")
+    p.add_argument("to_version")
+    p.set_defaults(run=lambda c, a: c.diff_domain_versions(a.name, a.from_version, a.to_version))
+    p = domain.add_parser("env-diff", help="Active domains that differ between two environments")
+    p.add_argument("from_env")
+    p.add_argument("to_env")
+    p.set_defaults(run=lambda c, a: c.diff_environments(a.from_env, a.to_env))
+
+    p = commands.add_parser("manifest", help="Print the manifest of an environment")
+    p.add_argument("env")
+    p.add_argument("--domain", help="Only this domain")
+    p.add_argument("--format", choices=["yaml", "json"], default="yaml")
+    p.set_defaults(run=lambda c, a: c.get_manifest(a.env, a.domain, a.format)[0])
+    p = commands.add_parser("search", help="Search image and domain names")
+    p.add_argument("q")
+    p.add_argument("--type", choices=["image", "domain"])
+    p.add_argument("--limit", type=int, default=20)
+    p.set_defaults(run=lambda c, a: c.search(a.q, a.type, a.limit))
+    p = commands.add_parser("snapshot", help="Download a catalog snapshot")
+    p.add_argument("path")
+    p.set_defaults(run=lambda c, a: c.download_snapshot(a.path))
+    p = commands.add_parser("audit", help="Audit events, newest first")
+    p.add_argument("entity", nargs="?", help="Only this image or domain")
+    p.add_argument("--action", help="Only this action, e.g. promote")
+    p.add_argument("--since", help="Only events at or after this time (ISO 8601)")
+    p.add_argument("--limit", type=int, default=50)
+    p.set_defaults(run=lambda c, a: c.list_audit_events(entity=a.entity, action=a.action, since=a.since, limit=a.limit))
+    p = commands.add_parser("job", help="Get a background job")
+    p.add_argument("job_id")
+    p.set_defaults(run=lambda c, a: c.get_job(a.job_id))
+    p = commands.add_parser("ready", help="Readiness of the server, exits with 1 when not ready")
+    p.set_defaults(run=lambda c, a: c.ready())
+    return parser
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = _parser().parse_args(argv)
+    try:
+        with Client(args.url, retries=args.retries, actor=args.actor) as client:
+            result = args.run(client, args)
+    except (ApiError, httpx.HTTPError) as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        return 1
+    print(result if isinstance(result, str) else json.dumps(result, indent=2))
+    if args.command == "ready" and result["status"] != "ready":
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,375 @@
+"""
+Version Manager API clients.
+Client and AsyncClient expose the same methods, one per API route. Both keep connections alive
+in a pool, retry 429 and 5xx responses with jittered exponential backoff (honoring Retry-After),
+and split long lists sent to the batch domain endpoints into chunks.
+Mutating requests carry an Idempotency-Key header, so that a retried request is applied once.
+"""
+
+import os
+import abc
+import asyncio
+import random
+import time
+import uuid
+from typing import Any, Callable, Iterable, Optional
+
+import httpx
+
+DEFAULT_URL = os.getenv("VERSION_MANAGER_URL", "http://localhost:8080")
+# Recorded in the audit log as the author of the changes
+DEFAULT_ACTOR = os.getenv("VERSION_MANAGER_ACTOR") or os.getenv("GITHUB_ACTOR")
+DEFAULT_TIMEOUT = 30.0
+DEFAULT_RETRIES = 5
+DEFAULT_BATCH_SIZE = 100
+BACKOFF_BASE = 0.2
+BACKOFF_MAX = 10.0
+RETRY_STATUS = {429, 500, 502, 503, 504}
+MUTATING_METHODS = {"POST", "PUT", "DELETE"}
+# Lookups are POST requests only to send a list, they don't change data
+LOOKUP_SUFFIX = "/lookup"
+API_PREFIX = "/v1"
+
+
+class ApiError(Exception):
+    """Raised for an error response, after the retries for 429 and 5xx are exhausted."""
+
+    def __init__(self, status_code: int, detail: Any, method: str, path: str):
+        super().__init__(f"{method} {path} failed with {status_code}: {detail}")
+        self.status_code = status_code
+        self.detail = detail
+
+
+def _json(response: httpx.Response) -> Any:
+    return response.json()
+
+
+def _params(**params) -> dict:
+    """Query parameters without the unset ones; booleans as true/false."""
+    return {
+        key: str(value).lower() if isinstance(value, bool) else value
+        for key, value in params.items()
+        if value is not None
+    }
+
+
+def _async(run_async: bool) -> dict:
+    return {"async": "true"} if run_async else {}
+
+
+def _write(path: str, content: bytes) -> str:
+    with open(path, "wb") as f:
+        f.write(content)
+    return path
+
+
+def _chunks(items: dict | list[dict], size: int) -> list[list[dict]]:
+    items = [items] if isinstance(items, dict) else list(items)
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def _headers(method: str, path: str, headers: dict | None) -> dict:
+    """Request headers: the same Idempotency-Key is sent on every retry of a mutating request."""
+    headers = dict(headers or {})
+    if method in MUTATING_METHODS and not path.endswith(LOOKUP_SUFFIX):
+        headers.setdefault("Idempotency-Key", uuid.uuid4().hex)
+    return headers
+
+
+def _backoff(attempt: int, response: httpx.Response | None = None) -> float:
+    """Full jitter exponential backoff, at least the Retry-After of the response."""
+    delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after and retry_after.isdigit():
+        delay = max(delay, float(retry_after))
+    return delay
+
+
+def _retry(response: httpx.Response, expect: Iterable[int]) -> bool:
+    return response.status_code in RETRY_STATUS and response.status_code not in expect
+
+
+def _result(response: httpx.Response, method: str, path: str, parse: Callable, expect: Iterable[int]) -> Any:
+    if response.status_code < 400 or response.status_code in expect:
+        return parse(response)
+    try:
+        detail = response.json().get("detail")
+    except ValueError:
+        detail = response.text
+    raise ApiError(response.status_code, detail, method, path)
+
+
+class _Routes(abc.ABC):
+    """
+    The API routes, shared by both clients: methods return what _request and _batch return,
+    the result for Client and an awaitable for AsyncClient.
+    Long-running renames and deletes accept run_async=True, which returns the background job to poll with get_job.
+    """
+
+    @abc.abstractmethod
+    def _request(self, method: str, path: str, *, params: dict | None = None, json: Any = None,
+                 headers: dict | None = None, parse: Callable[[httpx.Response], Any] = _json,
+                 expect: Iterable[int] = ()):
+        """Send a request with retries. Statuses in expect are parsed like successes and not retried."""
+
+    @abc.abstractmethod
+    def _batch(self, path: str, items: dict | list[dict]):
+        """Send the items in chunks of batch_size and return the concatenated results."""
+
+    # =========================================================================
+    # Health
+    # =========================================================================
+
+    def health(self):
+        """Liveness of the server."""
+        return self._request("GET", "/health")
+
+    def ready(self):
+        """Readiness report of the server: database latency, pool usage and event loop lag."""
+        return self._request("GET", "/ready", expect=(503,))
+
+    # =========================================================================
+    # Images
+    # =========================================================================
+
+    def list_images(self):
+        return self._request("GET", f"{API_PREFIX}/images/list")
+
+    def list_image_versions(self):
+        return self._request("GET", f"{API_PREFIX}/images/list/versions")
+
+    def list_tested_images(self, tested: bool = True):
+        return self._request("GET", f"{API_PREFIX}/images/list/tested", params=_params(tested=tested))
+
+    def lookup_image_versions(self, images: list[dict]):
+        """Look up many {"name", "version"} pairs at once."""
+        return self._request("POST", f"{API_PREFIX}/images/versions/lookup", json=images)
+
+    def get_image(self, name: str, since: Optional[str] = None, until: Optional[str] = None,
+                  latest: Optional[int] = None):
+        return self._request(
+            "GET", f"{API_PREFIX}/images/{name}/list", params=_params(since=since, until=until, latest=latest)
+        )
+
+    def get_image_version_domains(self, name: str, version: str):
+        """Domain versions that contain an image version, with their environment and status."""
+        return self._request("GET", f"{API_PREFIX}/images/{name}/{version}/domains")
+
+    def get_tested_image(self, name: str, tested: bool = True):
+        return self._request("GET", f"{API_PREFIX}/images/{name}/tested", params=_params(tested=tested))
+
+    def create_image(self, name: str, domain: str):
+        return self._request("POST", f"{API_PREFIX}/images/create", json={"name": name, "domain": domain})
+
+    def create_image_version(self, name: str, version: str):
+        return self._request("POST", f"{API_PREFIX}/images/{name}/create", json={"version": version})
+
+    def set_image_tested(self, name: str, version: str, tested: bool = True):
+        return self._request(
+            "PUT", f"{API_PREFIX}/images/{name}/tested", json={"version": version, "tested": tested}
+        )
+
+    def update_image_domain(self, name: str, domain: str, run_async: bool = False):
+        return self._request(
+            "PUT", f"{API_PREFIX}/images/{name}/domain", params=_async(run_async), json={"domain": domain}
+        )
+
+    def rename_image(self, name: str, new_name: str, run_async: bool = False):
+        return self._request(
+            "PUT", f"{API_PREFIX}/images/{name}/rename", params=_async(run_async), json={"name": new_name}
+        )
+
+    def delete_image(self, name: str, run_async: bool = False):
+        return self._request("DELETE", f"{API_PREFIX}/images/{name}", params=_async(run_async))
+
+    # =========================================================================
+    # Domains
+    # =========================================================================
+
+    def list_domains(self):
+        return self._request("GET", f"{API_PREFIX}/domains/list")
+
+    def list_active_domains(self, env: Optional[str] = None, at: Optional[str] = None):
+        """Active domain versions, now or at an ISO 8601 time."""
+        return self._request("GET", f"{API_PREFIX}/domains/active", params=_params(env=env, at=at))
+
+    def lookup_active_domains(self, domains: list[dict]):
+        """Look up the current state of many {"name", "env"} pairs at once."""
+        return self._request("POST", f"{API_PREFIX}/domains/active/lookup", json=domains)
+
+    def diff_environments(self, from_env: str, to_env: str):
+        return self._request("GET", f"{API_PREFIX}/domains/diff", params=_params(from_env=from_env, to_env=to_env))
+
+    def get_domain(self, name: str, since: Optional[str] = None, until: Optional[str] = None,
+                   latest: Optional[int] = None):
+        return self._request(
+            "GET", f"{API_PREFIX}/domains/{name}", params=_params(since=since, until=until, latest=latest)
+        )
+
+    def get_active_domain(self, name: str, env: Optional[str] = None):
+        return self._request("GET", f"{API_PREFIX}/domains/{name}/active", params=_params(env=env))
+
+    def get_current_state(self, name: str, env: str = "dev"):
+        return self._request("GET", f"{API_PREFIX}/domains/{name}/current", params=_params(env=env))
+
+    def diff_domain_versions(self, name: str, from_version: str, to_version: str):
+        return self._request(
+            "GET", f"{API_PREFIX}/domains/{name}/diff", params={"from": from_version, "to": to_version}
+        )
+
+    def create_domain(self, name: str, version: str):
+        return self._request("POST", f"{API_PREFIX}/domains/{name}/create", json={"version": version})
+
+    def update_domains(self, domains: dict | list[dict]):
+        """Set the images of domain versions: {"name", "version", "images": [{"name", "version"}]}."""
+        return self._batch("/domains/update", domains)
+
+    def set_domains_tested(self, domains: dict | list[dict]):
+        """Set the tested flag of domain versions: {"name", "version", "tested"}."""
+        return self._batch("/domains/tested", domains)
+
+    def set_domains_active(self, domains: dict | list[dict]):
+        """Activate domain versions: {"name", "version"}."""
+        return self._batch("/domains/active", domains)
+
+    def promote_domains(self, domains: dict | list[dict]):
+        """Promote domain versions to the next environment: {"name", "version"}."""
+        return self._batch("/domains/promote", domains)
+
+    def rename_domain(self, name: str, new_name: str, run_async: bool = False):
+        return self._request(
+            "PUT", f"{API_PREFIX}/domains/{name}/rename", params=_async(run_async), json={"name": new_name}
+        )
+
+    def delete_domain(self, name: str):
+        return self._request("DELETE", f"{API_PREFIX}/domains/{name}")
+
+    def delete_domain_version(self, name: str, version: str):
+        return self._request("DELETE", f"{API_PREFIX}/domains/{name}/{version}")
+
+    # =========================================================================
+    # Manifests, Snapshots, Search, Audit and Jobs
+    # =========================================================================
+
+    def get_manifest(self, env: str, domain: Optional[str] = None, format: str = "yaml",
+                     etag: Optional[str] = None):
+        """
+        Manifest of an environment as (body, etag). Passing the etag of the previous call
+        returns (None, etag) when the manifest didn't change.
+        """
+        return self._request(
+            "GET", f"{API_PREFIX}/manifests/{env}", params=_params(domain=domain, format=format),
+            headers={"If-None-Match": etag} if etag else None,
+            parse=lambda r: (None if r.status_code == 304 else r.text, r.headers.get("ETag")),
+            expect=(304,),
+        )
+
+    def download_snapshot(self, path: str):
+        """Save a snapshot archive of the catalog to path."""
+        return self._request("GET", f"{API_PREFIX}/snapshot", parse=lambda r: _write(path, r.content))
+
+    def search(self, q: str, type: Optional[str] = None, limit: int = 20, offset: int = 0):
+        return self._request(
+            "GET", f"{API_PREFIX}/search", params=_params(q=q, type=type, limit=limit, offset=offset)
+        )
+
+    def list_audit_events(self, entity_type: Optional[str] = None, entity: Optional[str] = None,
+                          action: Optional[str] = None, actor: Optional[str] = None, since: Optional[str] = None,
+                          until: Optional[str] = None, cursor: Optional[int] = None, limit: int = 50):
+        """A page of audit events, newest first; pass next_cursor of the page as cursor for the next one."""
+        return self._request("GET", f"{API_PREFIX}/audit", params=_params(
+            entity_type=entity_type, entity=entity, action=action, actor=actor,
+            since=since, until=until, cursor=cursor, limit=limit,
+        ))
+
+    def get_job(self, job_id: str):
+        return self._request("GET", f"{API_PREFIX}/jobs/{job_id}")
+
+
+class Client(_Routes):
+    """Synchronous client with a keep-alive connection pool. Use as a context manager or call close()."""
+
+    def __init__(self, url: str = DEFAULT_URL, timeout: float = DEFAULT_TIMEOUT, retries: int = DEFAULT_RETRIES,
+                 batch_size: int = DEFAULT_BATCH_SIZE, max_connections: int = 10, actor: Optional[str] = DEFAULT_ACTOR,
+                 transport: Optional[httpx.BaseTransport] = None):
+        self.retries = retries
+        self.batch_size = batch_size
+        self._http = httpx.Client(
+            base_url=url, timeout=timeout, limits=httpx.Limits(max_connections=max_connections),
+            headers={"X-Actor": actor} if actor else None, transport=transport,
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self) -> None:
+        self._http.close()
+
+    def _request(self, method, path, *, params=None, json=None, headers=None, parse=_json, expect=()):
+        headers = _headers(method, path, headers)
+        for attempt in range(self.retries + 1):
+            try:
+                response = self._http.request(method, path, params=params, json=json, headers=headers)
+            except httpx.TransportError:
+                if attempt == self.retries:
+                    raise
+                time.sleep(_backoff(attempt))
+                continue
+            if attempt < self.retries and _retry(response, expect):
+                time.sleep(_backoff(attempt, response))
+                continue
+            return _result(response, method, path, parse, expect)
+
+    def _batch(self, path, items):
+        results = []
+        for chunk in _chunks(items, self.batch_size):
+            results.extend(self._request("PUT", f"{API_PREFIX}{path}", json=chunk))
+        return results
+
+
+class AsyncClient(_Routes):
+    """Asynchronous client with a keep-alive connection pool. Use as an async context manager or await aclose()."""
+
+    def __init__(self, url: str = DEFAULT_URL, timeout: float = DEFAULT_TIMEOUT, retries: int = DEFAULT_RETRIES,
+                 batch_size: int = DEFAULT_BATCH_SIZE, max_connections: int = 10, actor: Optional[str] = DEFAULT_ACTOR,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.retries = retries
+        self.batch_size = batch_size
+        self._http = httpx.AsyncClient(
+            base_url=url, timeout=timeout, limits=httpx.Limits(max_connections=max_connections),
+            headers={"X-Actor": actor} if actor else None, transport=transport,
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        await self._http.aclose()
+
+    async def _request(self, method, path, *, params=None, json=None, headers=None, parse=_json, expect=()):
+        headers = _headers(method, path, headers)
+        for attempt in range(self.retries + 1):
+            try:
+                response = await self._http.request(method, path, params=params, json=json, headers=headers)
+            except httpx.TransportError:
+                if attempt == self.retries:
+                    raise
+                await asyncio.sleep(_backoff(attempt))
+                continue
+            if attempt < self.retries and _retry(response, expect):
+                await asyncio.sleep(_backoff(attempt, response))
+                continue
+            return _result(response, method, path, parse, expect)
+
+    async def _batch(self, path, items):
+        # Chunks are sent one after the other, so that a large batch doesn't fill the write admission queue
+        results = []
+        for chunk in _chunks(items, self.batch_size):
+            results.extend(await self._request("PUT", f"{API_PREFIX}{path}", json=chunk))
+        return results
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Contention benchmark for concurrent image registrations.
+
+Many CI jobs register image versions of the same domain at once. Every registration
+rewrites the images list of the active dev domain version, so all requests compete
+for the same Domain row. The benchmark measures throughput and latency of these
+writes, then checks that no update was lost.
+
+Usage: ./domain_contention.py [--url http://localhost:8080/v1] [--images 20] [--versions 5] [--workers 20]
+"""
+
+import argparse
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+DOMAIN = "bench-contention"
+_local = threading.local()
+
+
+def _session() -> requests.Session:
+    """One keep-alive session per worker thread."""
+    if not hasattr(_local, "session"):
+        _local.session = requests.Session()
+    return _local.session
+
+
+def _version(round_number: int) -> str:
+    return f"2025-01-01-00-00-{round_number:02d}"
+
+
+def setup(url: str, images: list[str]) -> None:
+    for name in images:
+        requests.post(f"{url}/images/create", json={"name": name, "domain": DOMAIN}).raise_for_status()
+    requests.post(f"{url}/domains/{DOMAIN}/create", json={"version": "2025-01-01-00-00-00"}).raise_for_status()
+
+
+def cleanup(url: str, images: list[str]) -> None:
+    for name in images:
+        requests.delete(f"{url}/images/{name}")
+    requests.delete(f"{url}/domains/{DOMAIN}")
+
+
+def register(url: str, name: str, version: str) -> tuple[float, int]:
+    start = time.perf_counter()
+    response = _session().post(f"{url}/images/{name}/create", json={"version": version})
+    return time.perf_counter() - start, response.status_code
+
+
+def percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8080/v1", help="Version Manager API URL")
+    parser.add_argument("--images", type=int, default=20, help="Images in the contended domain")
+    parser.add_argument("--versions", type=int, default=5, help="Versions registered per image")
+    parser.add_argument("--workers", type=int, default=20, help="Concurrent clients")
+    args = parser.parse_args()
+
+    images = [f"bench-img-{i}" for i in range(args.images)]
+    cleanup(args.url, images)
+    setup(args.url, images)
+    try:
+        latencies, errors = [], 0
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.workers) as pool:
+            for round_number in range(1, args.versions + 1):
+                version = _version(round_number)
+                for latency, status in pool.map(lambda name: register(args.url, name, version), images):
+                    latencies.append(latency)
+                    errors += status != 201
+        elapsed = time.perf_counter() - start
+
+        response = requests.get(f"{args.url}/domains/{DOMAIN}/active", params={"env": "dev"})
+        response.raise_for_status()
+        pinned = {img["name"]: img["version"] for img in response.json()[0]["images"]}
+        lost = [name for name in images if pinned.get(name) != _version(args.versions)]
+
+        print(f"requests:      {len(latencies)} ({args.images} images x {args.versions} versions, {args.workers} workers)")
+        print(f"errors:        {errors}")
+        print(f"throughput:    {len(latencies) / elapsed:.1f} req/s")
+        print(f"latency p50:   {statistics.median(latencies) * 1000:.1f} ms")
+        print(f"latency p95:   {percentile(latencies, 95) * 1000:.1f} ms")
+        print(f"latency p99:   {percentile(latencies, 99) * 1000:.1f} ms")
+        print(f"lost updates:  {len(lost)} {lost if lost else ''}")
+    finally:
+        cleanup(args.url, images)
+
+
+if __name__ == "__main__":
+    main()
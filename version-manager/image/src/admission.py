@@ -0,0 +1,113 @@
+"""
+Admission control for API requests.
+Reads and writes have separate concurrency budgets with bounded wait queues, so that a storm of
+CI registrations can't take all database connections from the deploy pipelines reading versions.
+Requests that find the queue full, or wait longer than ADMISSION_QUEUE_TIMEOUT, get 429 with Retry-After.
+"""
+
+import os
+import asyncio
+import math
+import time
+
+from fastapi import Request
+from fastapi.responses import JSONResponse
+
+ADMISSION_READ_LIMIT = int(os.getenv("ADMISSION_READ_LIMIT", "32"))
+ADMISSION_READ_QUEUE = int(os.getenv("ADMISSION_READ_QUEUE", "256"))
+ADMISSION_WRITE_LIMIT = int(os.getenv("ADMISSION_WRITE_LIMIT", "8"))
+ADMISSION_WRITE_QUEUE = int(os.getenv("ADMISSION_WRITE_QUEUE", "64"))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "10"))
+ADMITTED_PREFIX = "/v1/"
+WRITE_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+# Weight of the last request in the moving average of request durations
+DURATION_SMOOTHING = 0.1
+
+
+class AdmissionLimiter:
+    """Runs at most limit requests at once, queues up to queue_size more and rejects the rest."""
+
+    def __init__(self, name: str, limit: int, queue_size: int, queue_timeout: float):
+        self.name = name
+        self.limit = limit
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.waiting = 0
+        self.max_waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.avg_duration = 0.05
+        self._semaphore = asyncio.Semaphore(limit)
+
+    async def acquire(self) -> bool:
+        """Wait for a slot. False if the queue is full or the wait timed out."""
+        if self._semaphore.locked():
+            if self.waiting >= self.queue_size:
+                self.rejected += 1
+                return False
+            self.waiting += 1
+            self.max_waiting = max(self.max_waiting, self.waiting)
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                self.timed_out += 1
+                return False
+            finally:
+                self.waiting -= 1
+        else:
+            await self._semaphore.acquire()
+        self.active += 1
+        self.admitted += 1
+        return True
+
+    def release(self, duration: float) -> None:
+        self.active -= 1
+        self.avg_duration += DURATION_SMOOTHING * (duration - self.avg_duration)
+        self._semaphore.release()
+
+    def retry_after(self) -> int:
+        """Seconds until the current queue is expected to drain."""
+        return max(1, math.ceil((self.waiting + 1) * self.avg_duration / self.limit))
+
+    def stats(self) -> dict:
+        return {
+            "limit": self.limit,
+            "queue_size": self.queue_size,
+            "active": self.active,
+            "waiting": self.waiting,
+            "max_waiting": self.max_waiting,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "avg_duration_ms": round(self.avg_duration * 1000, 1),
+        }
+
+
+reads = AdmissionLimiter("read", ADMISSION_READ_LIMIT, ADMISSION_READ_QUEUE, ADMISSION_QUEUE_TIMEOUT)
+writes = AdmissionLimiter("write", ADMISSION_WRITE_LIMIT, ADMISSION_WRITE_QUEUE, ADMISSION_QUEUE_TIMEOUT)
+
+
+def admission_stats() -> dict:
+    """Queue depth and counters of the read and write budgets of this process."""
+    return {"read": reads.stats(), "write": writes.stats()}
+
+
+async def admission_middleware(request: Request, call_next):
+    """Admit API requests within the read or write budget, 429 with Retry-After when it is exhausted."""
+    if not request.url.path.startswith(ADMITTED_PREFIX):
+        return await call_next(request)
+
+    limiter = writes if request.method in WRITE_METHODS else reads
+    if not await limiter.acquire():
+        return JSONResponse(
+            status_code=429,
+            content={"detail": f"Too many concurrent {limiter.name} requests, retry later"},
+            headers={"Retry-After": str(limiter.retry_after())},
+        )
+    start = time.perf_counter()
+    try:
+        return await call_next(request)
+    finally:
+        limiter.release(time.perf_counter() - start)
@@ -0,0 +1,125 @@
+"""
+Asynchronous audit log of mutations.
+Database methods attach events to their session, and the events are queued in memory when the
+session commits, so that rolled back changes are not logged and CI calls don't wait for audit inserts.
+A background writer flushes the queue in multi-row inserts, and drains it on shutdown.
+"""
+
+import os
+import asyncio
+import logging
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+from fastapi import Request
+
+logger = logging.getLogger(__name__)
+
+AUDIT_QUEUE_SIZE = int(os.getenv("AUDIT_QUEUE_SIZE", "10000"))
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "500"))
+# Seconds between flushes, sooner when a full batch is queued
+AUDIT_FLUSH_INTERVAL = float(os.getenv("AUDIT_FLUSH_INTERVAL", "0.5"))
+AUDIT_WRITE_RETRIES = 3
+ACTOR_HEADER = "X-Actor"
+
+# Who made the current request: the X-Actor header, "anonymous" without it, "system" outside requests
+current_actor: ContextVar[str] = ContextVar("current_actor", default="system")
+
+
+def audit_event(action: str, entity_type: str, entity: str, version: str | None = None, **details) -> dict:
+    """An audit_events row for a change made now by the current actor."""
+    return {
+        "at": datetime.now(timezone.utc).replace(tzinfo=None),
+        "actor": current_actor.get(),
+        "action": action,
+        "entity_type": entity_type,
+        "entity": entity,
+        "version": version,
+        "details": details,
+    }
+
+
+async def audit_middleware(request: Request, call_next):
+    """Record the X-Actor header of the request as the actor of its changes."""
+    current_actor.set(request.headers.get(ACTOR_HEADER) or "anonymous")
+    return await call_next(request)
+
+
+class AuditLog:
+    """Bounded in-memory queue of audit events, written in batches by a background task."""
+
+    def __init__(self):
+        self._queue: asyncio.Queue | None = None
+        self._task = None
+        self._write = None
+        self._closing = False
+        self._wakeup = asyncio.Event()
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+
+    async def start(self, write):
+        """Start the writer. write(rows) inserts a batch of events."""
+        self._write = write
+        self._closing = False
+        self._queue = asyncio.Queue(maxsize=AUDIT_QUEUE_SIZE)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Write the queued events and stop the writer."""
+        if self._task:
+            self._closing = True
+            self._wakeup.set()
+            await self._task
+
+    def record(self, events: list[dict]) -> None:
+        """Queue committed events. Events are dropped when the queue is full, mutations never wait."""
+        if self._queue is None:
+            return
+        for event in events:
+            try:
+                self._queue.put_nowait(event)
+            except asyncio.QueueFull:
+                self.dropped += 1
+                if self.dropped % 1000 == 1:
+                    logger.warning(f"Audit queue is full ({AUDIT_QUEUE_SIZE} events), {self.dropped} events dropped")
+        if self._queue.qsize() >= AUDIT_BATCH_SIZE:
+            self._wakeup.set()
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize() if self._queue else 0,
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed": self.failed,
+        }
+
+    async def _run(self):
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), AUDIT_FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self._flush()
+        await self._flush()
+
+    async def _flush(self):
+        """Write the queued events in batches of AUDIT_BATCH_SIZE."""
+        while not self._queue.empty():
+            batch = [self._queue.get_nowait() for _ in range(min(AUDIT_BATCH_SIZE, self._queue.qsize()))]
+            for attempt in range(1, AUDIT_WRITE_RETRIES + 1):
+                try:
+                    await self._write(batch)
+                    self.written += len(batch)
+                    break
+                except Exception as e:
+                    if attempt == AUDIT_WRITE_RETRIES:
+                        self.failed += len(batch)
+                        logger.error(f"Writing {len(batch)} audit events failed: {e}")
+                    else:
+                        await asyncio.sleep(attempt)
+
+
+# Global audit log instance
+audit_log = AuditLog()
@@ -0,0 +1,96 @@
+"""
+Single-flight coalescing of identical concurrent GET requests.
+At deploy time many runners ask for the same active versions within milliseconds: the first request
+runs the route, and identical requests arriving while it is in flight share its response bytes.
+The data revision is part of the key, so a request never joins a flight started before a local change.
+Only successes and 304 responses are shared: a follower of a flight that got an error, e.g. a 429 from
+admission control, runs the request itself.
+"""
+
+import asyncio
+import logging
+
+from fastapi import Request
+from fastapi.responses import Response
+
+from coherence import notifier
+
+logger = logging.getLogger(__name__)
+
+COALESCED_PREFIX = "/v1/"
+# Streamed or too large to hold in memory
+NOT_COALESCED_PATHS = {"/v1/snapshot"}
+KEY_HEADERS = ("if-none-match",)
+
+
+def _shared(status_code: int) -> bool:
+    return 200 <= status_code < 300 or status_code == 304
+
+
+class NotShared(Exception):
+    """The response of the flight is not shared with its followers."""
+
+
+class RequestCoalescer:
+    """In-flight GET requests by key, with counters of executed and coalesced requests."""
+
+    def __init__(self):
+        self._flights: dict[tuple, asyncio.Future] = {}
+        self.executed = 0
+        self.coalesced = 0
+
+    def stats(self) -> dict:
+        return {"in_flight": len(self._flights), "executed": self.executed, "coalesced": self.coalesced}
+
+    def _key(self, request: Request) -> tuple:
+        return (
+            notifier.revision,
+            request.url.path,
+            tuple(sorted(request.query_params.multi_items())),
+            tuple(request.headers.get(name) for name in KEY_HEADERS),
+        )
+
+    async def _follow(self, flight: asyncio.Future, request: Request, call_next):
+        """Replay the response of the flight, or run the request if the flight failed."""
+        try:
+            status_code, headers, body = await asyncio.shield(flight)
+        except Exception:
+            self.executed += 1
+            return await call_next(request)
+        self.coalesced += 1
+        return Response(content=body, status_code=status_code, headers=headers)
+
+    async def __call__(self, request: Request, call_next):
+        path = request.url.path
+        if request.method != "GET" or not path.startswith(COALESCED_PREFIX) or path in NOT_COALESCED_PATHS:
+            return await call_next(request)
+
+        key = self._key(request)
+        flight = self._flights.get(key)
+        if flight is not None:
+            return await self._follow(flight, request, call_next)
+
+        flight = asyncio.get_running_loop().create_future()
+        self._flights[key] = flight
+        try:
+            self.executed += 1
+            response = await call_next(request)
+            body = b"".join([chunk async for chunk in response.body_iterator])
+            headers = dict(response.headers)
+            if _shared(response.status_code):
+                flight.set_result((response.status_code, headers, body))
+            else:
+                flight.set_exception(NotShared(response.status_code))
+                flight.exception()
+        except BaseException as e:
+            # Followers run the request themselves
+            flight.set_exception(e if isinstance(e, Exception) else RuntimeError("Request cancelled"))
+            flight.exception()
+            raise
+        finally:
+            del self._flights[key]
+        return Response(content=body, status_code=response.status_code, headers=headers)
+
+
+# Global request coalescer instance, used as an HTTP middleware
+coalescer = RequestCoalescer()
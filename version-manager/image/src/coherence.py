@@ -0,0 +1,198 @@
+"""
+Cross-process change notifications.
+Keeps in-process caches coherent when several uvicorn workers or pods share one database:
+PostgreSQL uses LISTEN/NOTIFY, SQLite uses a revision file next to the database file.
+"""
+
+import os
+import asyncio
+import fcntl
+import logging
+import uuid
+from typing import Callable
+
+import asyncpg
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "version_manager_changes"
+POLL_INTERVAL = float(os.getenv("COHERENCE_POLL_INTERVAL", "0.2"))
+RECONNECT_INTERVAL = 1.0
+
+
+class _PostgresBackend:
+    """
+    Publishes changes with pg_notify in the writing transaction, so the notification is delivered
+    exactly when the transaction commits, and listens for other processes on a dedicated connection.
+    """
+
+    transactional = True
+
+    def __init__(self, engine, token: str, on_remote: Callable[[], None]):
+        self.engine = engine
+        self.token = token
+        self.on_remote = on_remote
+        self.dsn = engine.url.set(drivername="postgresql").render_as_string(hide_password=False)
+        self._listener = None
+        self._task = None
+
+    async def start(self):
+        await self._connect()
+        self._task = asyncio.create_task(self._watch())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+        if self._listener and not self._listener.is_closed():
+            await self._listener.close()
+
+    def publish_statement(self):
+        return text("SELECT pg_notify(:channel, :token)").bindparams(channel=CHANNEL, token=self.token)
+
+    async def _connect(self):
+        self._listener = await asyncpg.connect(self.dsn)
+        await self._listener.add_listener(CHANNEL, self._on_notification)
+
+    def _on_notification(self, connection, pid, channel, payload):
+        if payload != self.token:
+            self.on_remote()
+
+    async def _watch(self):
+        """Reconnect the listener if the connection drops. Changes may have been missed, so invalidate."""
+        while True:
+            await asyncio.sleep(RECONNECT_INTERVAL)
+            if not self._listener.is_closed():
+                continue
+            try:
+                await self._connect()
+                self.on_remote()
+            except Exception as e:
+                logger.warning(f"Change listener reconnect failed: {e}")
+
+
+class _FileBackend:
+    """Stand-in for SQLite: a revision counter file shared by all processes using the same database file."""
+
+    transactional = False
+
+    def __init__(self, path: str, on_remote: Callable[[], None]):
+        self.path = path
+        self.on_remote = on_remote
+        self._seen = None
+        self._mtime = None
+        self._task = None
+
+    async def start(self):
+        self._seen = await asyncio.to_thread(self._read)
+        self._task = asyncio.create_task(self._poll())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+
+    async def publish(self):
+        previous, current = await asyncio.to_thread(self._bump)
+        # Only skip our own change if no other process changed the file in between
+        if previous == self._seen:
+            self._seen = current
+
+    def _bump(self) -> tuple[int, int]:
+        with open(self.path, "a+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            f.seek(0)
+            previous = int(f.read().strip() or 0)
+            f.seek(0)
+            f.truncate()
+            f.write(str(previous + 1))
+            return previous, previous + 1
+
+    def _read(self) -> int:
+        try:
+            with open(self.path) as f:
+                fcntl.flock(f, fcntl.LOCK_SH)
+                return int(f.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+
+    async def _poll(self):
+        while True:
+            await asyncio.sleep(POLL_INTERVAL)
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+            except FileNotFoundError:
+                continue
+            if mtime == self._mtime:
+                continue
+            self._mtime = mtime
+            current = await asyncio.to_thread(self._read)
+            if current != self._seen:
+                self._seen = current
+                self.on_remote()
+
+
+class ChangeNotifier:
+    """Tracks the data revision seen by this process and invalidates subscribers on every change."""
+
+    def __init__(self):
+        self.revision = 0
+        self.remote_changes = 0
+        self.token = uuid.uuid4().hex
+        self._subscribers: list[Callable[[], None]] = []
+        self._backend = None
+        self._pending: set[asyncio.Task] = set()
+
+    def subscribe(self, callback: Callable[[], None]) -> None:
+        """Register a callback invoked whenever the data changed in this or another process."""
+        self._subscribers.append(callback)
+
+    def _changed(self) -> None:
+        self.revision += 1
+        for callback in self._subscribers:
+            callback()
+
+    def _remote_changed(self) -> None:
+        self.remote_changes += 1
+        self._changed()
+
+    def publish_statement(self):
+        """
+        Statement to execute in a transaction that changed data, just before its commit, to tell other processes.
+        None if the backend tells them after the commit instead.
+        """
+        if self._backend and self._backend.transactional:
+            return self._backend.publish_statement()
+        return None
+
+    def notify_changed(self) -> None:
+        """Called after a commit that changed data: invalidate local caches and tell other processes."""
+        self._changed()
+        if self._backend and not self._backend.transactional:
+            task = asyncio.get_running_loop().create_task(self._publish())
+            self._pending.add(task)
+            task.add_done_callback(self._pending.discard)
+
+    async def _publish(self):
+        try:
+            await self._backend.publish()
+        except Exception as e:
+            logger.warning(f"Publishing change notification failed: {e}")
+
+    async def start(self, engine, sqlite_path: str | None = None):
+        """Start listening for changes made by other processes."""
+        if engine.dialect.name == "postgresql":
+            self._backend = _PostgresBackend(engine, self.token, self._remote_changed)
+        else:
+            self._backend = _FileBackend(f"{sqlite_path}.revision", self._remote_changed)
+        await self._backend.start()
+
+    async def stop(self):
+        """Flush pending notifications and stop listening."""
+        if self._pending:
+            await asyncio.gather(*self._pending, return_exceptions=True)
+        if self._backend:
+            await self._backend.stop()
+
+
+# Global change notifier instance
+notifier = ChangeNotifier()
@@ -3,13 +3,149 @@ Database connection and operations.
 """
 
 import os
+import asyncio
+import csv
+import fcntl
+import functools
+import json
+import logging
+import random
+import sqlite3
+import tarfile
+import tempfile
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
 from typing import Optional
+from sqlalchemy import event
+from sqlalchemy.orm import Session
 from sqlalchemy.orm.attributes import flag_modified
+from sqlalchemy.orm.exc import StaleDataError
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
-from sqlalchemy import select, update, delete, and_, or_
+from sqlalchemy import select, insert, update, delete, and_, or_, tuple_, inspect, text, func, true, case, literal, union_all, table, column, bindparam, type_coerce, any_, lambda_stmt
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB
+from sqlalchemy.engine.default import CACHE_HIT, CACHE_MISS
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.types import DateTime
 
 import models as M
+from migrations import MIGRATIONS, LATEST_VERSION, backfill_version_at
 import schemas as S
+from audit import audit_event, audit_log
+from coherence import notifier
+from group_commit import group_commit
+
+logger = logging.getLogger(__name__)
+
+# Attempts for methods that rewrite Domain.images when a concurrent writer changed the same row
+DOMAIN_WRITE_RETRIES = int(os.getenv("DOMAIN_WRITE_RETRIES", "5"))
+
+
+def retry_on_conflict(method):
+    """
+    Re-run a Database method in a new transaction when its compare-and-swap update
+    of a Domain row lost against a concurrent writer (row_version changed).
+    """
+    @functools.wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        for attempt in range(1, DOMAIN_WRITE_RETRIES + 1):
+            try:
+                return await method(self, *args, **kwargs)
+            except StaleDataError:
+                if attempt == DOMAIN_WRITE_RETRIES:
+                    raise
+                # Jittered exponential backoff spreads out the competing writers
+                await asyncio.sleep(random.uniform(0, 0.005 * 2 ** attempt))
+    return wrapper
+
+
+# Name columns searched by GET /v1/search: result type -> (table, column)
+SEARCH_SOURCES = {
+    "image": ("image_domain", "image"),
+    "domain": ("domains", "name"),
+}
+
+# Tables stored in snapshots; the other tables are derived or transient
+SNAPSHOT_TABLES = ("images", "domains", "image_domain")
+SNAPSHOT_FORMAT = 1
+# Snapshot restored at startup if the database is empty
+RESTORE_SNAPSHOT = os.getenv("RESTORE_SNAPSHOT", "")
+
+# Apply pending migrations at startup instead of by the one-shot migrate.py command (local development)
+MIGRATE_ON_STARTUP = os.getenv("MIGRATE_ON_STARTUP", "false").lower() == "true"
+# Seconds to wait at startup for the migration command to bring the schema to the expected version
+SCHEMA_WAIT_TIMEOUT = float(os.getenv("SCHEMA_WAIT_TIMEOUT", "0"))
+
+# Writes to these models invalidate caches in all processes
+TRACKED_MODELS = (M.Image, M.Domain, M.ImageDomain)
+# Arbitrary application-wide key for the PostgreSQL advisory lock taken during startup
+STARTUP_LOCK_ID = 7_420_001
+# First key of the per-domain PostgreSQL advisory locks (the second is the hash of the name)
+DOMAIN_LOCK_CLASS = 7_420_002
+# Distinct SQL strings remembered for GET /stats; the application sends a few dozen
+STATEMENTS_TRACKED = 1000
+
+
+def _image_domain_by_image(name: str):
+    """ImageDomain row of an image, as a lambda statement cached by its code location."""
+    return lambda_stmt(lambda: select(M.ImageDomain).where(M.ImageDomain.image == name))
+
+
+def _active_domain(name: str, deployed: str):
+    """Active version of a domain in an environment, as a lambda statement cached by its code location."""
+    return lambda_stmt(
+        lambda: select(M.Domain).where(and_(M.Domain.name == name, M.Domain.deployed == deployed, M.Domain.active == True))
+    )
+
+
+def _image_version(name: str, version: str):
+    """Image row of an image version, as a lambda statement cached by its code location."""
+    return lambda_stmt(lambda: select(M.Image).where(and_(M.Image.name == name, M.Image.version == version)))
+
+
+class TrackedSession(Session):
+    """Session that reports commits which changed images or domains to the change notifier."""
+
+
+@event.listens_for(TrackedSession, "after_flush")
+def _track_flush(session, flush_context):
+    if any(isinstance(obj, TRACKED_MODELS) for obj in (*session.new, *session.dirty, *session.deleted)):
+        session.info["changed"] = True
+
+
+@event.listens_for(TrackedSession, "do_orm_execute")
+def _track_execute(orm_execute_state):
+    if orm_execute_state.is_select or orm_execute_state.bind_mapper is None:
+        return
+    if issubclass(orm_execute_state.bind_mapper.class_, TRACKED_MODELS):
+        orm_execute_state.session.info["changed"] = True
+
+
+@event.listens_for(TrackedSession, "before_commit")
+def _publish_commit(session):
+    statement = notifier.publish_statement()
+    if statement is None:
+        return
+    # Flush first so that the changes of the final flush are tracked too
+    session.flush()
+    if session.info.get("changed"):
+        session.connection().execute(statement)
+
+
+@event.listens_for(TrackedSession, "after_commit")
+def _notify_commit(session):
+    if session.info.pop("changed", False):
+        notifier.notify_changed()
+    events = session.info.pop("audit", None)
+    if events:
+        audit_log.record(events)
+
+
+@event.listens_for(TrackedSession, "after_rollback")
+def _reset_rollback(session):
+    session.info.pop("changed", None)
+    session.info.pop("audit", None)
+
 
 class Database:
     """Database operations handler."""
@@ -17,6 +153,10 @@ class Database:
     def __init__(self):
         self.engine = None
         self.session_factory = None
+        self.sqlite_path = None
+        self.compiled_hits = 0
+        self.compiled_misses = 0
+        self.statements: set[str] = set()
 
     async def connect(self):
         """Initialize database connection. Uses PostgreSQL or SQLite based on USE_POSTGRESQL env var."""
@@ -29,23 +169,303 @@ class Database:
             db_user = os.getenv("DB_USER", "postgres")
             db_password = os.getenv("DB_PASSWORD", "postgres")
             database_url = f"postgresql+asyncpg://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}"
+            # Every uvicorn worker of every pod has its own pool, size it accordingly
+            pool_options = {
+                "pool_size": int(os.getenv("DB_POOL_SIZE", "5")),
+                "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "10")),
+                "pool_pre_ping": True,
+            }
         else:
             db_path = os.getenv("SQLITE_PATH", "/app/data/version_manager.db")
             os.makedirs(os.path.dirname(db_path), exist_ok=True)
             database_url = f"sqlite+aiosqlite:///{db_path}"
-
-        self.engine = create_async_engine(database_url, echo=True)
-        self.session_factory = async_sessionmaker(self.engine, class_=AsyncSession, expire_on_commit=False)
-
-    async def create_tables(self):
-        """Create all tables."""
-        async with self.engine.begin() as conn:
-            await conn.run_sync(M.Base.metadata.create_all)
+            self.sqlite_path = db_path
+            pool_options = {}
+
+        self.engine = create_async_engine(database_url, echo=True, **pool_options)
+        self.session_factory = async_sessionmaker(
+            self.engine, class_=AsyncSession, sync_session_class=TrackedSession, expire_on_commit=False
+        )
+        event.listen(self.engine.sync_engine, "before_cursor_execute", self._count_statement)
+
+    def _count_statement(self, conn, cursor, statement, parameters, context, executemany):
+        if context.cache_hit is CACHE_HIT:
+            self.compiled_hits += 1
+        elif context.cache_hit is CACHE_MISS:
+            self.compiled_misses += 1
+        if len(self.statements) < STATEMENTS_TRACKED:
+            self.statements.add(statement)
+
+    def statement_stats(self) -> dict:
+        """
+        Compiled statement cache hits and misses of this worker process, and the number of distinct SQL strings
+        sent to the database, each prepared once per connection (asyncpg) or cached by the driver (sqlite3).
+        """
+        lookups = self.compiled_hits + self.compiled_misses
+        return {
+            "compiled_cache_hits": self.compiled_hits,
+            "compiled_cache_misses": self.compiled_misses,
+            "compiled_cache_hit_ratio": round(self.compiled_hits / lookups, 3) if lookups else None,
+            "distinct_statements": len(self.statements),
+        }
+
+    @asynccontextmanager
+    async def startup_lock(self):
+        """Serialize schema setup between workers and pods starting at the same time."""
+        if self.engine.dialect.name == "postgresql":
+            async with self.engine.connect() as conn:
+                await conn.exec_driver_sql(f"SELECT pg_advisory_lock({STARTUP_LOCK_ID})")
+                try:
+                    yield
+                finally:
+                    await conn.exec_driver_sql(f"SELECT pg_advisory_unlock({STARTUP_LOCK_ID})")
+        else:
+            with open(f"{self.sqlite_path}.lock", "w") as lock_file:
+                await asyncio.to_thread(fcntl.flock, lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
 
     def _get_session(self) -> AsyncSession:
         """Get a new database session."""
         return self.session_factory()
 
+    @staticmethod
+    def _audit(session: AsyncSession, action: str, entity_type: str, entity: str, version: Optional[str] = None, **details) -> None:
+        """Attach an audit event to the session, queued for the audit log when the session commits."""
+        session.info.setdefault("audit", []).append(audit_event(action, entity_type, entity, version, **details))
+
+    async def run_in_transaction(self, works: list) -> list:
+        """Call work(session) for every work in one transaction and commit. Returns their results."""
+        async with self._get_session() as session:
+            results = [await work(session) for work in works]
+            await session.commit()
+            return results
+
+    async def _write(self, work, *args):
+        """Run a single-item write work(session, *args) in its own transaction, or in a group commit when enabled."""
+        if group_commit.running:
+            return await group_commit.submit(lambda session: work(session, *args))
+        [result] = await self.run_in_transaction([lambda session: work(session, *args)])
+        return result
+
+    def _in_keys(self, columns: tuple, keys) -> object:
+        """
+        Filter on columns matching one of the keys (tuples, or values for a single column).
+        The keys are bound as one array per column on PostgreSQL (= ANY, unnest) and as one JSON array on SQLite,
+        so that the SQL is the same for any number of keys and stays in the statement caches.
+        """
+        keys = [key if isinstance(key, (tuple, list)) else (key,) for key in keys]
+        if self.engine.dialect.name == "postgresql":
+            arrays = [
+                bindparam(None, [key[i] for key in keys], type_=ARRAY(col.type)) for i, col in enumerate(columns)
+            ]
+            if len(columns) == 1:
+                return columns[0] == any_(arrays[0])
+            rows = func.unnest(*arrays).table_valued(*[f"k{i}" for i in range(len(columns))])
+            return tuple_(*columns).in_(select(*rows.c))
+        rows = func.json_each(bindparam(None, json.dumps(keys))).table_valued("value")
+        return tuple_(*columns).in_(
+            select(*[func.json_extract(rows.c.value, f"$[{i}]") for i in range(len(columns))])
+        )
+
+    async def _check_row_versions(self, session: AsyncSession, domains: list) -> None:
+        """
+        Compare-and-swap on Domain rows read by this transaction: bump their row_version,
+        or raise StaleDataError if a concurrent writer changed one of them since it was read.
+        """
+        if not domains:
+            return
+        keys = [(domain.name, domain.version, domain.row_version) for domain in domains]
+        result = await session.execute(
+            update(M.Domain)
+            .where(self._in_keys((M.Domain.name, M.Domain.version, M.Domain.row_version), keys))
+            .values(row_version=M.Domain.row_version + 1)
+        )
+        if result.rowcount != len(keys):
+            raise StaleDataError(f"{len(keys) - result.rowcount} of {len(keys)} domain versions changed since they were read")
+
+    def _insert(self, model):
+        """Get a dialect-specific INSERT that supports ON CONFLICT on PostgreSQL and SQLite."""
+        if self.engine.dialect.name == "postgresql":
+            return pg_insert(model)
+        return sqlite_insert(model)
+
+    # =========================================================================
+    # Schema Migrations
+    # =========================================================================
+
+    async def get_schema_version(self) -> int:
+        """Get the latest applied migration version, 0 for an empty database."""
+        async with self.engine.connect() as conn:
+            exists = await conn.run_sync(lambda sync_conn: inspect(sync_conn).has_table(M.SchemaMigration.__tablename__))
+            if not exists:
+                return 0
+            result = await conn.execute(select(func.max(M.SchemaMigration.version)))
+            return result.scalar() or 0
+
+    async def migrate(self) -> list[int]:
+        """
+        Apply pending migrations in order and return their versions. The caller holds the startup lock.
+        Non-transactional migrations run in autocommit mode on PostgreSQL, for CREATE INDEX CONCURRENTLY.
+        """
+        async with self.engine.begin() as conn:
+            await conn.run_sync(M.SchemaMigration.__table__.create, checkfirst=True)
+        current = await self.get_schema_version()
+        applied = []
+        for migration in MIGRATIONS:
+            if migration.version <= current:
+                continue
+            if migration.transactional or self.engine.dialect.name != "postgresql":
+                async with self.engine.begin() as conn:
+                    await conn.run_sync(migration.upgrade)
+                    await self._record_migration(conn, migration)
+            else:
+                async with self.engine.connect() as conn:
+                    autocommit = await conn.execution_options(isolation_level="AUTOCOMMIT")
+                    await autocommit.run_sync(migration.upgrade)
+                async with self.engine.begin() as conn:
+                    await self._record_migration(conn, migration)
+            logger.info(f"Applied migration {migration.version}: {migration.description}")
+            applied.append(migration.version)
+        return applied
+
+    @staticmethod
+    async def _record_migration(conn, migration) -> None:
+        await conn.execute(
+            M.SchemaMigration.__table__.insert().values(
+                version=migration.version,
+                description=migration.description,
+                applied_at=datetime.now(timezone.utc).replace(tzinfo=None),
+            )
+        )
+
+    async def wait_for_schema(self, timeout: float) -> int:
+        """
+        Check that the schema is at the version this application needs, waiting up to timeout seconds
+        for the migration command. A newer schema is accepted: migrations only add tables, columns and indexes.
+        """
+        deadline = asyncio.get_running_loop().time() + timeout
+        while True:
+            version = await self.get_schema_version()
+            if version >= LATEST_VERSION:
+                return version
+            if asyncio.get_running_loop().time() >= deadline:
+                raise RuntimeError(
+                    f"Database schema is at version {version}, this application needs version {LATEST_VERSION}: "
+                    f"run 'python migrate.py' or set MIGRATE_ON_STARTUP=true"
+                )
+            await asyncio.sleep(1)
+
+    # =========================================================================
+    # Current State Operations
+    # =========================================================================
+
+    async def _lock_domains(self, session: AsyncSession, names: set[str]) -> None:
+        """
+        Serialize the transactions that rebuild the state of the same domains, until they commit.
+        PostgreSQL: transaction-level advisory locks, taken in name order so that two writers don't deadlock.
+        SQLite: nothing to do, the write transaction already holds the database lock.
+        """
+        if self.engine.dialect.name != "postgresql":
+            return
+        # The locks are taken after the sort: volatile functions are evaluated after ORDER BY
+        await session.execute(
+            text(
+                "SELECT pg_advisory_xact_lock(:lock_class, hashtext(name)) "
+                "FROM unnest(CAST(:names AS text[])) AS names(name) ORDER BY name"
+            ),
+            {"lock_class": DOMAIN_LOCK_CLASS, "names": sorted(names)},
+        )
+
+    async def _sync_current_state(self, session: AsyncSession, names: set[str]) -> None:
+        """
+        Rebuild current_state rows for the given domain names from the active Domain rows,
+        and record the states that changed in state_history.
+        Runs inside the caller's session so the state is committed together with the mutation,
+        under a per-domain lock: concurrent rebuilds of a domain would insert the same current_state keys.
+        """
+        if not names:
+            return
+        await session.flush()
+        await self._lock_domains(session, names)
+        await session.execute(delete(M.CurrentState).where(self._in_keys((M.CurrentState.domain,), names)))
+        result = await session.execute(
+            select(M.Domain)
+            .where(and_(self._in_keys((M.Domain.name,), names), M.Domain.active == True))
+            .order_by(M.Domain.version_at.nulls_first(), M.Domain.version)
+        )
+        # Keep the latest version if several rows are active for the same environment
+        states = {(domain.name, domain.deployed): domain for domain in result.scalars().all()}
+        for domain in states.values():
+            session.add(M.CurrentState(
+                domain=domain.name,
+                env=domain.deployed,
+                version=domain.version,
+                tested=domain.tested,
+                images=[f"{img['name']}:{img['version']}" for img in (domain.images or [])],
+            ))
+        await self._record_state_history(session, names, states)
+
+    async def _record_state_history(self, session: AsyncSession, names: set[str], states: dict) -> None:
+        """Close the open intervals of states that changed or ended, and open intervals for the new states."""
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        result = await session.execute(
+            select(M.StateHistory).where(
+                and_(self._in_keys((M.StateHistory.domain,), names), M.StateHistory.valid_to.is_(None))
+            )
+        )
+        open_intervals = {(interval.domain, interval.env): interval for interval in result.scalars().all()}
+        for key in open_intervals.keys() | states.keys():
+            interval, domain = open_intervals.get(key), states.get(key)
+            if interval and domain and (interval.version, interval.tested, interval.images) == (
+                domain.version, domain.tested, domain.images or []
+            ):
+                continue
+            if interval:
+                interval.valid_to = now
+            if domain:
+                session.add(M.StateHistory(
+                    domain=domain.name,
+                    env=domain.deployed,
+                    version=domain.version,
+                    tested=domain.tested,
+                    images=[dict(img) for img in (domain.images or [])],
+                    valid_from=now,
+                ))
+
+    async def rebuild_current_state(self):
+        """Rebuild the whole current_state table from the Domain table."""
+        async with self._get_session() as session:
+            result = await session.execute(select(M.Domain.name).distinct())
+            names = set(result.scalars().all())
+            await session.execute(delete(M.CurrentState))
+            await self._sync_current_state(session, names)
+            await session.commit()
+
+    async def get_current_state(self, name: str, env: str) -> Optional[dict]:
+        """Get the active version and resolved image:version pairs of a domain in an environment."""
+        async with self._get_session() as session:
+            state = await session.get(M.CurrentState, (name, env))
+            return state.to_dict() if state else None
+
+    async def get_all_current_states(self) -> list[dict]:
+        """Get the current state of every active (domain, env) pair."""
+        async with self._get_session() as session:
+            result = await session.execute(select(M.CurrentState).order_by(M.CurrentState.env, M.CurrentState.domain))
+            return [state.to_dict() for state in result.scalars().all()]
+
+    async def lookup_current_states(self, keys: list[tuple[str, str]]) -> dict[tuple[str, str], dict]:
+        """Get current states for many (domain, env) pairs with one query."""
+        if not keys:
+            return {}
+        async with self._get_session() as session:
+            result = await session.execute(
+                select(M.CurrentState).where(self._in_keys((M.CurrentState.domain, M.CurrentState.env), keys))
+            )
+            return {(state.domain, state.env): state.to_dict() for state in result.scalars().all()}
+
     # =========================================================================
     # Image Operations
     # =========================================================================
@@ -69,10 +489,33 @@ class Database:
             result = await session.execute(query)
             return [img.to_dict() for img in result.scalars().all()]
 
-    async def get_image_by_name(self, name: str) -> list[dict]:
-        """Get all versions of an image by name."""
+    @staticmethod
+    def _version_range(query, model, since: Optional[datetime], until: Optional[datetime], latest: Optional[int]):
+        """
+        Restrict a query to versions between since and until (inclusive), and to the latest N of them.
+        Served by the (name, version_at) index; versions that are not timestamps are excluded.
+        """
+        if since:
+            query = query.where(model.version_at >= since)
+        if until:
+            query = query.where(model.version_at <= until)
+        if latest:
+            return query.where(model.version_at.isnot(None)).order_by(model.version_at.desc()).limit(latest)
+        if since or until:
+            return query.order_by(model.version_at)
+        return query
+
+    async def get_image_by_name(
+        self,
+        name: str,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        latest: Optional[int] = None,
+    ) -> list[dict]:
+        """Get all versions of an image by name, optionally restricted to a version range."""
         async with self._get_session() as session:
-            result = await session.execute(select(M.Image).where(M.Image.name == name))
+            query = self._version_range(select(M.Image).where(M.Image.name == name), M.Image, since, until, latest)
+            result = await session.execute(query)
             return [img.to_dict() for img in result.scalars().all()]
 
     async def get_tested_image_by_name(self, name: str, tested: bool = True) -> list[dict]:
@@ -82,75 +525,107 @@ class Database:
             result = await session.execute(query)
             return [img.to_dict() for img in result.scalars().all()]
 
-    async def create_image(self, image: S.ImageCreate) -> dict:
-        """Create a new image entry."""
+    async def lookup_image_versions(self, keys: list[tuple[str, str]]) -> dict[tuple[str, str], dict]:
+        """Get many image versions by (name, version) pairs with one query."""
+        if not keys:
+            return {}
         async with self._get_session() as session:
             result = await session.execute(
-                select(M.ImageDomain).where(M.ImageDomain.image == image.name)
+                select(M.Image).where(self._in_keys((M.Image.name, M.Image.version), keys))
             )
-            db_image_domain = result.scalar_one_or_none()
+            return {(img.name, img.version): img.to_dict() for img in result.scalars().all()}
+
+    async def get_domains_by_image_version(self, name: str, version: str) -> list[dict]:
+        """
+        Get the domain versions whose images contain an image version, with their environment and status.
+        PostgreSQL: JSONB containment on the GIN index. SQLite: the domain_images table kept by triggers.
+        """
+        async with self._get_session() as session:
+            query = select(M.Domain.name, M.Domain.version, M.Domain.deployed, M.Domain.tested, M.Domain.active)
+            if self.engine.dialect.name == "postgresql":
+                query = query.where(type_coerce(M.Domain.images, JSONB).contains([{"name": name, "version": version}]))
+            else:
+                refs = table("domain_images", column("image"), column("image_version"), column("domain"), column("domain_version"))
+                query = query.where(tuple_(M.Domain.name, M.Domain.version).in_(
+                    select(refs.c.domain, refs.c.domain_version)
+                    .where(and_(refs.c.image == name, refs.c.image_version == version))
+                ))
+            result = await session.execute(query.order_by(M.Domain.name, M.Domain.version))
+            return [dict(row._mapping) for row in result.all()]
+
+    async def create_image(self, image: S.ImageCreate) -> dict:
+        """Create a new image entry. Returns the existing entry if the image is already registered."""
+        async with self._get_session() as session:
+            query = select(M.ImageDomain).where(M.ImageDomain.image == image.name)
+            result = await session.execute(query)
+            db_image_domain = result.scalars().first()
             if not db_image_domain:
-                db_image_domain = M.ImageDomain(
-                    image=image.name,
-                    domain=image.domain,
-                    domains=[image.domain],
+                # Upsert so that concurrent retries of the same request don't fail on the primary key
+                await session.execute(
+                    self._insert(M.ImageDomain)
+                    .values(image=image.name, domain=image.domain, domains=[image.domain])
+                    .on_conflict_do_nothing(index_elements=["image", "domain"])
                 )
-                session.add(db_image_domain)
+                self._audit(session, "create", "image", image.name, domain=image.domain)
                 await session.commit()
-                await session.refresh(db_image_domain)
+                result = await session.execute(query)
+                db_image_domain = result.scalars().first()
             return db_image_domain.to_dict()
 
+    @retry_on_conflict
     async def create_image_version(self, name: str, version: str) -> dict:
         """
         Create a new entry for an image version.
         Auto-updates the active domain in dev environment by adding or replacing this image in the domain's images list.
         """
-        async with self._get_session() as session:
-            result = await session.execute(select(M.ImageDomain).where(M.ImageDomain.image == name))
-            db_image_domain = result.scalar_one_or_none()
-            if not db_image_domain:
-                return None
-            
-            domain_name = db_image_domain.domain
-            
-            # Create the image version
-            db_image = M.Image(
-                name=name,
-                version=version,
-                domain=domain_name,
-                tested=False,
-            )
-            session.add(db_image)
-            await session.flush()  # Flush to get the image ID
-            
-            # Auto-update the active domain in dev environment
-            # Find the active domain version in dev environment
-            active_domain_result = await session.execute(
-                select(M.Domain).where(
-                    and_(
-                        M.Domain.name == domain_name,
-                        M.Domain.deployed == "dev",
-                        M.Domain.active == True
-                    )
-                )
-            )
-            active_domain = active_domain_result.scalar_one_or_none()
-            
-            if active_domain:
-                # Update the domain's images list: add or replace this image
-                images_list = list(active_domain.images or [])
-                # Remove existing entry for this image name if present
-                images_list = [img for img in images_list if img.get("name") != name]
-                # Add the new image version
-                images_list.append({"name": name, "version": version, "tested": False})
-                active_domain.images = images_list
-            
-            await session.commit()
-            await session.refresh(db_image)
-            return db_image.to_dict()
+        return await self._write(self._create_image_version, name, version)
 
+    async def _create_image_version(self, session: AsyncSession, name: str, version: str) -> dict:
+        result = await session.execute(_image_domain_by_image(name))
+        db_image_domain = result.scalar_one_or_none()
+        if not db_image_domain:
+            return None
+        
+        domain_name = db_image_domain.domain
+        
+        # Create the image version; a retry of an existing version returns it unchanged
+        result = await session.execute(
+            self._insert(M.Image)
+            .values(name=name, version=version, domain=domain_name, tested=False)
+            .on_conflict_do_nothing(index_elements=["name", "version"])
+            .returning(M.Image.name)
+        )
+        created = result.scalar_one_or_none() is not None
+        db_image = await session.get(M.Image, (name, version))
+        if not created:
+            return db_image.to_dict()
+        
+        # Auto-update the active domain in dev environment
+        # Find the active domain version in dev environment
+        active_domain_result = await session.execute(_active_domain(domain_name, "dev"))
+        active_domain = active_domain_result.scalar_one_or_none()
+        
+        if active_domain:
+            # Update the domain's images list: add or replace this image
+            images_list = list(active_domain.images or [])
+            # Remove existing entry for this image name if present
+            images_list = [img for img in images_list if img.get("name") != name]
+            # Add the new image version
+            images_list.append({"name": name, "version": version, "tested": False})
+            active_domain.images = images_list
+            await self._sync_current_state(session, {domain_name})
+        self._audit(
+            session, "create_version", "image", name, version,
+            domain=domain_name, pinned_in=active_domain.version if active_domain else None,
+        )
+        return db_image.to_dict()
+
+    @retry_on_conflict
     async def set_image_tested(self, name: str, version: str, tested: bool) -> Optional[dict]:
         """Set image tested status."""
+        return await self._write(self._set_image_tested, name, version, tested)
+
+    async def _set_image_tested(self, session: AsyncSession, name: str, version: str, tested: bool) -> Optional[dict]:
 
         def _set_tested(images: list[str] | None, name: str, version: str, tested: bool) -> list[str]:
             images = list(images or [])
@@ -160,30 +635,28 @@ class Database:
                     break
             return images
 
-        async with self._get_session() as session:
-            # Step 1. Retrieve the ImageDomain mapping record
-            result = await session.execute(select(M.ImageDomain).where(M.ImageDomain.image == name))
-            db_image_domain = result.scalar_one_or_none()
-            if not db_image_domain:
-                return None
-            # Step 2. Retrieve and update Domain records
-            result = await session.execute(select(M.Domain).where(M.Domain.name == db_image_domain.domain))
-            db_domains = result.scalars().all()
-            for domain in db_domains:
-                domain.images = _set_tested(domain.images, name, version, tested)      
-                flag_modified(domain, "images")
-
-            # Step 3. Update the Image record
-            await session.execute(
-                update(M.Image).where(and_(M.Image.name == name, M.Image.version == version)).values(tested=tested)
-            )
-            await session.commit()
-            # Fetch and return the updated image
-            result = await session.execute(
-                select(M.Image).where(and_(M.Image.name == name, M.Image.version == version))
-            )
-            db_image = result.scalar_one_or_none()
-            return db_image.to_dict() if db_image else None
+        # Step 1. Retrieve the ImageDomain mapping record
+        result = await session.execute(_image_domain_by_image(name))
+        db_image_domain = result.scalar_one_or_none()
+        if not db_image_domain:
+            return None
+        # Step 2. Retrieve and update Domain records
+        result = await session.execute(select(M.Domain).where(M.Domain.name == db_image_domain.domain))
+        db_domains = result.scalars().all()
+        for domain in db_domains:
+            domain.images = _set_tested(domain.images, name, version, tested)      
+            flag_modified(domain, "images")
+        await self._sync_current_state(session, {db_image_domain.domain})
+
+        # Step 3. Update the Image record
+        await session.execute(
+            update(M.Image).where(and_(M.Image.name == name, M.Image.version == version)).values(tested=tested)
+        )
+        self._audit(session, "set_tested", "image", name, version, tested=tested)
+        # Fetch and return the updated image
+        result = await session.execute(_image_version(name, version))
+        db_image = result.scalar_one_or_none()
+        return db_image.to_dict() if db_image else None
 
 
     async def update_image_domain(self, name: str, domain: str) -> list[dict] | None:
@@ -218,6 +691,7 @@ class Database:
                 .where(M.Image.name == name)
                 .values(domain=domain)
             )
+            self._audit(session, "update_domain", "image", name, domain=domain)
 
             await session.commit()
             
@@ -226,6 +700,7 @@ class Database:
             return [img.to_dict() for img in result.scalars().all()]
 
 
+    @retry_on_conflict
     async def rename_image(self, old_name: str, new_name: str) -> list[dict]:
         """
         Rename image: first updates the name in all domain.images lists,
@@ -238,11 +713,11 @@ class Database:
             for domain in db_domains:
                 if domain.images and any(img.get("name") == old_name for img in domain.images):
                     domain.images = [
-                        {"name": new_name, "version": img["version"]} 
+                        {**img, "name": new_name}
                         if img.get("name") == old_name else img 
                         for img in domain.images
                     ]
-
+            await self._sync_current_state(session, {domain.name for domain in db_domains})
 
             # Step 2. Update ImageDomain
             await session.execute(
@@ -257,11 +732,13 @@ class Database:
                 .where(M.Image.name == old_name)
                 .values(name=new_name)
             )
+            self._audit(session, "rename", "image", old_name, new_name=new_name)
 
             await session.commit()
             result = await session.execute(select(M.Image).where(M.Image.name == new_name))
             return [img.to_dict() for img in result.scalars().all()]
 
+    @retry_on_conflict
     async def delete_image(self, name: str) -> dict:
         """
         Delete image: first removes it from all domain.images lists,
@@ -280,6 +757,7 @@ class Database:
             db_domains = result.scalars().all()
             for domain in db_domains:
                 domain.images = [img for img in domain.images if img["name"] != name]
+            await self._sync_current_state(session, {domain.name for domain in db_domains})
 
             # Step 3: Delete all image versions
             result = await session.execute(delete(M.Image).where(M.Image.name == name))
@@ -289,6 +767,7 @@ class Database:
             await session.execute(
                 delete(M.ImageDomain).where(M.ImageDomain.image == name)
             )
+            self._audit(session, "delete", "image", name, versions_removed=versions_removed)
 
             await session.commit()
             return {"deleted": name, "versions_removed": versions_removed}
@@ -312,12 +791,40 @@ class Database:
             result = await session.execute(query)
             return [domain.to_dict() for domain in result.scalars().all()]
 
-    async def get_domain_by_name(self, name: str) -> list[dict]:
-        """Get all versions of a domain by name."""
+    async def get_domain_by_name(
+        self,
+        name: str,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        latest: Optional[int] = None,
+    ) -> list[dict]:
+        """Get all versions of a domain by name, optionally restricted to a version range."""
         async with self._get_session() as session:
-            result = await session.execute(select(M.Domain).where(M.Domain.name == name))
+            query = self._version_range(select(M.Domain).where(M.Domain.name == name), M.Domain, since, until, latest)
+            result = await session.execute(query)
             return [domain.to_dict() for domain in result.scalars().all()]
 
+    async def get_active_domains_at(self, at: datetime, deployed: Optional[str] = None) -> list[dict]:
+        """
+        Get the domain versions that were active at a point in time, from their activation intervals.
+        On PostgreSQL the interval containment is answered by the GiST index on the time range.
+        """
+        async with self._get_session() as session:
+            query = select(M.StateHistory)
+            if deployed is not None:
+                query = query.where(M.StateHistory.env == deployed)
+            if self.engine.dialect.name == "postgresql":
+                query = query.where(
+                    func.tsrange(M.StateHistory.valid_from, M.StateHistory.valid_to).op("@>")(literal(at, DateTime))
+                )
+            else:
+                query = query.where(and_(
+                    M.StateHistory.valid_from <= at,
+                    or_(M.StateHistory.valid_to.is_(None), M.StateHistory.valid_to > at),
+                ))
+            result = await session.execute(query.order_by(M.StateHistory.env, M.StateHistory.domain))
+            return [interval.to_domain_dict() for interval in result.scalars().all()]
+
     async def get_active_domain_by_name(self, name: str, deployed: Optional[str] = None) -> Optional[dict]:
         """Get active version of a domain by name."""
         async with self._get_session() as session:
@@ -327,12 +834,29 @@ class Database:
             result = await session.execute(query)
             return [domain.to_dict() for domain in result.scalars().all()]
 
+    @retry_on_conflict
     async def create_domain(self, name: str, version: str) -> dict:
-        """Create a new domain version with tested images. Sets new version as Active."""
+        """
+        Create a new domain version with tested images. Sets new version as Active.
+        A retry of an existing version returns it unchanged.
+        """
         async with self._get_session() as session:
+            result = await session.execute(
+                self._insert(M.Domain)
+                .values(name=name, version=version, deployed="dev", tested=False, active=True, images=[])
+                .on_conflict_do_nothing(index_elements=["name", "version"])
+                .returning(M.Domain.version)
+            )
+            created = result.scalar_one_or_none() is not None
+            db_domain = await session.get(M.Domain, (name, version))
+            if not created:
+                return db_domain.to_dict()
+
             # Deactivate all previous versions of this domain in 'dev' environment
             await session.execute(
-                update(M.Domain).where(and_(M.Domain.name == name, M.Domain.deployed == "dev")).values(active=False)
+                update(M.Domain)
+                .where(and_(M.Domain.name == name, M.Domain.deployed == "dev", M.Domain.version != version))
+                .values(active=False, row_version=M.Domain.row_version + 1)
             )
 
             # Get all images for this domain
@@ -341,7 +865,7 @@ class Database:
                 .where(and_(
                     M.Image.domain == name
                 ))
-                .order_by(M.Image.name, M.Image.version.desc())
+                .order_by(M.Image.name, M.Image.version_at.desc().nulls_last(), M.Image.version.desc())
             )
 
             # Get the latest version for each image name
@@ -350,30 +874,21 @@ class Database:
                 if img.name not in latest_images:
                     latest_images[img.name] = img
 
-            # Create domain with images stored as JSON, set as Active
-            db_domain = M.Domain(
-                name=name,
-                version=version,
-                deployed="dev",
-                tested=False,
-                active=True,  # New domain version is automatically Active
-                images=[{"name": img.name, "version": img.version, "tested": img.tested} for img in latest_images.values()],
-            )
-            session.add(db_domain)
+            # Store images as JSON; the new version is automatically Active
+            db_domain.images = [{"name": img.name, "version": img.version, "tested": img.tested} for img in latest_images.values()]
+            await self._sync_current_state(session, {name})
+            self._audit(session, "create", "domain", name, version, images=db_domain.images)
             await session.commit()
-            await session.refresh(db_domain)
             return db_domain.to_dict()
 
+    @retry_on_conflict
     async def update_domains(self, domains: list[S.DomainUpdate]) -> list[dict]:
-        """Update image versions in domains."""
+        """Update image versions in domains, in one transaction so that a retry after a conflict applies the batch once."""
 
         async with self._get_session() as session:
             updated_domains = []
             async def _enrich_images_list(images: list[S.ImageVersion]) -> list[dict]:
-                filters = or_(*[
-                    and_(M.Image.name == item.name, M.Image.version == item.version)
-                    for item in images
-                ])
+                filters = self._in_keys((M.Image.name, M.Image.version), [(item.name, item.version) for item in images])
                 result = await session.execute(select(M.Image).where(filters))
                 return [{'name': item.name, 'version': item.version, 'tested': item.tested} for item in result.scalars().all()]
             
@@ -390,10 +905,16 @@ class Database:
                     for img in await _enrich_images_list(domain_update.images):
                         existing_images[img['name']] = {"name": img['name'], "version": img['version'], "tested": img['tested']}
                     domain.images = list(existing_images.values())
-                    await session.commit()
-                    await session.refresh(domain)
-                    updated_domains.append(domain.to_dict())
-            return updated_domains
+                    self._audit(
+                        session, "update_images", "domain", domain.name, domain.version,
+                        images=[img.model_dump() for img in domain_update.images],
+                    )
+                    updated_domains.append(domain)
+            await self._sync_current_state(session, {domain.name for domain in updated_domains})
+            await session.commit()
+            for domain in updated_domains:
+                await session.refresh(domain)
+            return [domain.to_dict() for domain in updated_domains]
 
     async def set_domains_tested(self, domains: list[S.DomainTested]) -> list[dict]:
         """Set domains as tested."""
@@ -403,54 +924,54 @@ class Database:
                 await session.execute(
                     update(M.Domain)
                     .where(and_(M.Domain.name == domain.name, M.Domain.version == domain.version))
-                    .values(tested=domain.tested)
+                    .values(tested=domain.tested, row_version=M.Domain.row_version + 1)
                 )
+                self._audit(session, "set_tested", "domain", domain.name, domain.version, tested=domain.tested)
+            await self._sync_current_state(session, {domain.name for domain in domains})
             await session.commit()
-            conditions = or_(*[
-                and_(M.Domain.name == d.name, M.Domain.version == d.version)
-                for d in domains
-            ])
+            conditions = self._in_keys((M.Domain.name, M.Domain.version), [(d.name, d.version) for d in domains])
             result = await session.execute(select(M.Domain).where(conditions))
             return [domain.to_dict() for domain in result.scalars().all()]
 
+    @retry_on_conflict
     async def set_domains_active(self, domains: list[S.DomainActive]) -> list[dict]:
         """Set domains as active, deactivating previous active versions."""
         async with self._get_session() as session:
             async def _enrich_domains_list(domains: list[S.DomainActive]) -> list[dict]:
-                filters = or_(*[
-                    and_(M.Domain.name == item.name, M.Domain.version == item.version)
-                    for item in domains
-                ])
+                filters = self._in_keys((M.Domain.name, M.Domain.version), [(item.name, item.version) for item in domains])
                 result = await session.execute(select(M.Domain).where(filters))
-                return [{'name': domain.name, 'version': domain.version, 'deployed': domain.deployed, 'tested': domain.tested, 'active': domain.active} for domain in result.scalars().all()]
+                rows = result.scalars().all()
+                # The environments are taken from these rows: fail if a concurrent promotion moved one
+                await self._check_row_versions(session, rows)
+                return [{'name': domain.name, 'version': domain.version, 'deployed': domain.deployed, 'tested': domain.tested, 'active': domain.active} for domain in rows]
 
             db_domains = await _enrich_domains_list(domains)
 
-            list_conditions = or_(*[
-                and_(M.Domain.name == d['name'], M.Domain.deployed == d['deployed'])
-                for d in db_domains
-            ])
-            deactivate_conditions = or_(*[
-                and_(M.Domain.name == d['name'], M.Domain.deployed == d['deployed'], M.Domain.active == True)
-                for d in db_domains
-            ])
-            activate_conditions = or_(*[
-                and_(M.Domain.name == d['name'], M.Domain.version == d['version'], M.Domain.deployed == d['deployed'])
-                for d in db_domains
-            ])
+            list_conditions = self._in_keys(
+                (M.Domain.name, M.Domain.deployed), [(d['name'], d['deployed']) for d in db_domains]
+            )
+            deactivate_conditions = and_(list_conditions, M.Domain.active == True)
+            activate_conditions = self._in_keys(
+                (M.Domain.name, M.Domain.version, M.Domain.deployed),
+                [(d['name'], d['version'], d['deployed']) for d in db_domains],
+            )
             # Step 1. Deactivate all previous active versions
             await session.execute(
-                update(M.Domain).where(deactivate_conditions).values(active=False)
+                update(M.Domain).where(deactivate_conditions).values(active=False, row_version=M.Domain.row_version + 1)
             )
             # Step 2. Activate the specified versions
             await session.execute(
-                update(M.Domain).where(activate_conditions).values(active=True)
+                update(M.Domain).where(activate_conditions).values(active=True, row_version=M.Domain.row_version + 1)
             )
+            await self._sync_current_state(session, {d['name'] for d in db_domains})
+            for d in db_domains:
+                self._audit(session, "activate", "domain", d['name'], d['version'], env=d['deployed'])
 
             await session.commit()
             result = await session.execute(select(M.Domain).where(list_conditions))
             return [domain.to_dict() for domain in result.scalars().all()]
             
+    @retry_on_conflict
     async def promote_domains(self, domains: list[S.DomainPromote]) -> list[dict]:
         """
         Promote domains to specified environment and set as active.
@@ -477,12 +998,11 @@ class Database:
                 return True if target_deployed == "prod" else False
 
             # Step #1. Fetch all domains to get their current deployed status
-            conditions = or_(*[
-                and_(M.Domain.name == d.name, M.Domain.version == d.version)
-                for d in domains
-            ])
+            conditions = self._in_keys((M.Domain.name, M.Domain.version), [(d.name, d.version) for d in domains])
             result = await session.execute(select(M.Domain).where(conditions))
             db_domains = {f"{d.name}:{d.version}": d for d in result.scalars().all()}
+            # The target environments are computed from these rows: fail if a concurrent promotion moved one
+            await self._check_row_versions(session, list(db_domains.values()))
 
             for domain_promote in domains:
                 domain_key = f"{domain_promote.name}:{domain_promote.version}"
@@ -494,39 +1014,42 @@ class Database:
                 target_deployed = _promote_to(current_deployed)
                 
                 # Add to filters for deactivation and promotion
-                filter_deactivated.append(
-                    and_(M.Domain.name == domain_promote.name, M.Domain.deployed == target_deployed)
-                )
-                filter_promoted.append(
-                    and_(M.Domain.name == domain_promote.name, M.Domain.version == domain_promote.version)
+                filter_deactivated.append((domain_promote.name, target_deployed))
+                filter_promoted.append((domain_promote.name, domain_promote.version, target_deployed))
+                self._audit(
+                    session, "promote", "domain", domain_promote.name, domain_promote.version,
+                    from_env=current_deployed, to_env=target_deployed,
                 )
 
             # Step 2: Deactivate all previous active versions in target environments
             if filter_deactivated:
                 await session.execute(
-                    update(M.Domain).where(or_(*filter_deactivated)).values(active=False)
+                    update(M.Domain)
+                    .where(self._in_keys((M.Domain.name, M.Domain.deployed), filter_deactivated))
+                    .values(active=False, row_version=M.Domain.row_version + 1)
                 )
             
-            # Step 3: Promote and activate the specified domain versions
-            if filter_promoted:
-                for domain_promote in filter_promoted:
-                    await session.execute(
-                        update(M.Domain)
-                        .where(and_(
-                            domain_promote
-                        ))
-                        .values(
-                            deployed=target_deployed,
-                            tested=_is_tested(target_deployed),
-                            active=True
-                        )
+            # Step 3: Promote and activate the specified domain versions, one statement per target environment
+            for target_deployed in {target for _, _, target in filter_promoted}:
+                keys = [(name, version) for name, version, target in filter_promoted if target == target_deployed]
+                await session.execute(
+                    update(M.Domain)
+                    .where(self._in_keys((M.Domain.name, M.Domain.version), keys))
+                    .values(
+                        deployed=target_deployed,
+                        tested=_is_tested(target_deployed),
+                        active=True,
+                        row_version=M.Domain.row_version + 1,
                     )
+                )
+            await self._sync_current_state(session, {d.name for d in db_domains.values()})
             
             await session.commit()
             
             # Fetch and return the promoted domains
             if filter_promoted:
-                result = await session.execute(select(M.Domain).where(or_(*filter_promoted)))
+                keys = [(name, version) for name, version, _ in filter_promoted]
+                result = await session.execute(select(M.Domain).where(self._in_keys((M.Domain.name, M.Domain.version), keys)))
                 return [domain.to_dict() for domain in result.scalars().all()]
             return []
 
@@ -539,11 +1062,15 @@ class Database:
         """
         def _add_domain(domains: list[str] | None, domain: str) -> list[str]:
             current_list = list(domains or [])
-            return current_list if domain in current_list else current_list.append(domain)
+            return current_list if domain in current_list else current_list + [domain]
 
         async with self._get_session() as session:
             # Step 1: Rename all domain entries
-            result = await session.execute(update(M.Domain).where(M.Domain.name == old_name).values(name=new_name))
+            result = await session.execute(
+                update(M.Domain)
+                .where(M.Domain.name == old_name)
+                .values(name=new_name, row_version=M.Domain.row_version + 1)
+            )
             if result.rowcount == 0:
                 return None
             # Step 2: Update ImageDomain table with new domain name and add new domain to domains list
@@ -555,6 +1082,8 @@ class Database:
 
             # Step 3: Update domain field in all related images
             await session.execute(update(M.Image).where(M.Image.domain == old_name).values(domain=new_name))
+            await self._sync_current_state(session, {old_name, new_name})
+            self._audit(session, "rename", "domain", old_name, new_name=new_name)
 
             await session.commit()
             result = await session.execute(select(M.Domain).where(M.Domain.name == new_name))
@@ -570,6 +1099,8 @@ class Database:
             )
             if result.rowcount == 0:
                 return None
+            await self._sync_current_state(session, {name})
+            self._audit(session, "delete_version", "domain", name, version)
             await session.commit()
             return {"deleted": True, "name": name, "version": version}
 
@@ -597,14 +1128,577 @@ class Database:
             if result.rowcount == 0:
                 return None
             else:
+                await self._sync_current_state(session, {name})
+                self._audit(session, "delete", "domain", name)
                 await session.commit()
                 return {"deleted": True, "name": name}
 
+    # =========================================================================
+    # Diff Operations
+    # =========================================================================
+
+    @staticmethod
+    def _diff_images(from_images: list[dict] | None, to_images: list[dict] | None) -> dict:
+        """Compare two stored image lists by image name: added, removed, and changed versions or tested flags."""
+        before = {img["name"]: img for img in from_images or []}
+        after = {img["name"]: img for img in to_images or []}
+
+        def _entry(img: dict) -> dict:
+            return {"name": img["name"], "version": img["version"], "tested": img.get("tested", False)}
+
+        return {
+            "added": [_entry(after[name]) for name in sorted(after.keys() - before.keys())],
+            "removed": [_entry(before[name]) for name in sorted(before.keys() - after.keys())],
+            "changed": [
+                {
+                    "name": name,
+                    "from_version": before[name]["version"],
+                    "to_version": after[name]["version"],
+                    "from_tested": before[name].get("tested", False),
+                    "to_tested": after[name].get("tested", False),
+                }
+                for name in sorted(before.keys() & after.keys())
+                if _entry(before[name]) != _entry(after[name])
+            ],
+        }
+
+    async def diff_domain_versions(self, name: str, from_version: str, to_version: str) -> Optional[dict]:
+        """Compare the images of two versions of a domain. Returns None if either version doesn't exist."""
+        async with self._get_session() as session:
+            result = await session.execute(
+                select(M.Domain).where(and_(M.Domain.name == name, M.Domain.version.in_([from_version, to_version])))
+            )
+            versions = {domain.version: domain for domain in result.scalars().all()}
+            if from_version not in versions or to_version not in versions:
+                return None
+            return {
+                "name": name,
+                "from_version": from_version,
+                "to_version": to_version,
+                **self._diff_images(versions[from_version].images, versions[to_version].images),
+            }
+
+    async def diff_environments(self, from_env: str, to_env: str) -> list[dict]:
+        """Compare the active versions of all domains between two environments. Only domains that differ are returned."""
+        async with self._get_session() as session:
+            result = await session.execute(
+                select(M.Domain)
+                .where(and_(M.Domain.active == True, M.Domain.deployed.in_([from_env, to_env])))
+                .order_by(M.Domain.version_at.nulls_first(), M.Domain.version)
+            )
+            # Keep the latest version if several rows are active for the same environment
+            active = {(domain.name, domain.deployed): domain for domain in result.scalars().all()}
+        diffs = []
+        for name in sorted({name for name, _ in active}):
+            before, after = active.get((name, from_env)), active.get((name, to_env))
+            diff = self._diff_images(before.images if before else [], after.images if after else [])
+            if before and after and before.version == after.version and not any(diff.values()):
+                continue
+            diffs.append({
+                "name": name,
+                "from_version": before.version if before else None,
+                "to_version": after.version if after else None,
+                **diff,
+            })
+        return diffs
+
+    # =========================================================================
+    # Search Operations
+    # =========================================================================
+
+    def _search_source(self, result_type: str, term: str):
+        """Distinct names of one result type containing the term, using the dialect's substring index."""
+        table_name, column_name = SEARCH_SOURCES[result_type]
+        if self.engine.dialect.name == "postgresql":
+            name = column(column_name)
+            source = table(table_name, name)
+            matches = func.lower(name).contains(term, autoescape=True)
+        else:
+            name = column(column_name)
+            source = table(f"{table_name}_fts", name)
+            # The trigram FTS index answers LIKE; instr() keeps '%' and '_' in the term literal
+            matches = and_(name.like(f"%{term}%"), func.instr(func.lower(name), term) > 0)
+        return select(literal(result_type).label("type"), name.label("name")).select_from(source).where(matches).distinct()
+
+    async def search(self, q: str, result_type: Optional[str], limit: int, offset: int) -> dict:
+        """
+        Search image and domain names by prefix and substring.
+        Results are ranked: exact match, then prefix match, then substring match; shorter names first.
+        """
+        term = q.lower()
+        types = [result_type] if result_type else list(SEARCH_SOURCES)
+        matches = union_all(*[self._search_source(t, term) for t in types]).subquery()
+        name = func.lower(matches.c.name)
+        rank = case((name == term, 0), (name.startswith(term, autoescape=True), 1), else_=2)
+        async with self._get_session() as session:
+            total = await session.execute(select(func.count()).select_from(matches))
+            result = await session.execute(
+                select(matches.c.type, matches.c.name, rank.label("rank"))
+                .order_by(rank, func.length(matches.c.name), matches.c.name)
+                .limit(limit)
+                .offset(offset)
+            )
+            labels = ("exact", "prefix", "substring")
+            return {
+                "items": [{"type": row.type, "name": row.name, "match": labels[row.rank]} for row in result.all()],
+                "total": total.scalar_one(),
+                "limit": limit,
+                "offset": offset,
+            }
+
+    # =========================================================================
+    # Chunked Cascade Operations (background jobs)
+    # =========================================================================
+
+    async def _count(self, model, where=true()) -> int:
+        """Count rows of a model matching a filter."""
+        async with self._get_session() as session:
+            result = await session.execute(select(func.count()).select_from(model).where(where))
+            return result.scalar_one()
+
+    @retry_on_conflict
+    async def _rewrite_domains_chunk(self, where, after: tuple[str, str], rewrite, chunk_size: int) -> tuple[int, Optional[tuple[str, str]]]:
+        """
+        Rewrite one keyset chunk of Domain rows matching the filter in its own transaction.
+        Returns the number of scanned rows and the key to continue after, or None when done.
+        """
+        async with self._get_session() as session:
+            result = await session.execute(
+                select(M.Domain)
+                .where(and_(where, tuple_(M.Domain.name, M.Domain.version) > after))
+                .order_by(M.Domain.name, M.Domain.version)
+                .limit(chunk_size)
+            )
+            db_domains = result.scalars().all()
+            if not db_domains:
+                return 0, None
+            last = (db_domains[-1].name, db_domains[-1].version)
+            names = {domain.name for domain in db_domains}
+            for domain in db_domains:
+                rewrite(domain)
+            await self._sync_current_state(session, names | {domain.name for domain in db_domains})
+            await session.commit()
+            return len(db_domains), last
+
+    async def _rewrite_domains_in_chunks(self, where, rewrite, chunk_size: int, progress) -> None:
+        """Rewrite all Domain rows matching the filter, committing every chunk_size rows."""
+        after = ("", "")
+        while True:
+            scanned, after = await self._rewrite_domains_chunk(where, after, rewrite, chunk_size)
+            if after is None:
+                return
+            await progress.advance(scanned)
+
+    async def _update_images_in_chunks(self, where, values: Optional[dict], chunk_size: int, progress) -> int:
+        """
+        Update (or delete, if values is None) Image rows matching the filter, committing every chunk_size rows.
+        The update must make rows stop matching the filter. Returns the number of affected rows.
+        """
+        affected = 0
+        while True:
+            async with self._get_session() as session:
+                result = await session.execute(select(M.Image.name, M.Image.version).where(where).limit(chunk_size))
+                keys = [tuple(row) for row in result.all()]
+                if not keys:
+                    return affected
+                chunk = self._in_keys((M.Image.name, M.Image.version), keys)
+                if values is None:
+                    await session.execute(delete(M.Image).where(chunk))
+                else:
+                    await session.execute(update(M.Image).where(chunk).values(**values))
+                await session.commit()
+            affected += len(keys)
+            await progress.advance(len(keys))
+
+    async def rename_image_chunked(self, old_name: str, new_name: str, chunk_size: int, progress) -> list[dict] | None:
+        """Chunked variant of rename_image for background jobs. Each chunk is committed separately."""
+        if not await self._count(M.ImageDomain, M.ImageDomain.image == old_name):
+            return None
+        await progress.start(await self._count(M.Domain) + await self._count(M.Image, M.Image.name == old_name))
+
+        def _rename(domain):
+            if domain.images and any(img.get("name") == old_name for img in domain.images):
+                domain.images = [{**img, "name": new_name} if img.get("name") == old_name else img for img in domain.images]
+
+        await self._rewrite_domains_in_chunks(true(), _rename, chunk_size, progress)
+        await self._update_images_in_chunks(M.Image.name == old_name, {"name": new_name}, chunk_size, progress)
+        async with self._get_session() as session:
+            await session.execute(update(M.ImageDomain).where(M.ImageDomain.image == old_name).values(image=new_name))
+            self._audit(session, "rename", "image", old_name, new_name=new_name)
+            await session.commit()
+        return await self.get_image_by_name(new_name)
+
+    async def delete_image_chunked(self, name: str, chunk_size: int, progress) -> dict | None:
+        """Chunked variant of delete_image for background jobs. Each chunk is committed separately."""
+        if not await self._count(M.ImageDomain, M.ImageDomain.image == name):
+            return None
+        await progress.start(await self._count(M.Domain) + await self._count(M.Image, M.Image.name == name))
+
+        def _remove(domain):
+            if domain.images and any(img.get("name") == name for img in domain.images):
+                domain.images = [img for img in domain.images if img.get("name") != name]
+
+        await self._rewrite_domains_in_chunks(true(), _remove, chunk_size, progress)
+        versions_removed = await self._update_images_in_chunks(M.Image.name == name, None, chunk_size, progress)
+        async with self._get_session() as session:
+            await session.execute(delete(M.ImageDomain).where(M.ImageDomain.image == name))
+            self._audit(session, "delete", "image", name, versions_removed=versions_removed)
+            await session.commit()
+        return {"deleted": name, "versions_removed": versions_removed}
+
+    async def rename_domain_chunked(self, old_name: str, new_name: str, chunk_size: int, progress) -> list[dict] | None:
+        """Chunked variant of rename_domain for background jobs. Each chunk is committed separately."""
+        domains_count = await self._count(M.Domain, M.Domain.name == old_name)
+        if not domains_count:
+            return None
+        await progress.start(domains_count + await self._count(M.Image, M.Image.domain == old_name))
+
+        def _rename(domain):
+            domain.name = new_name
+
+        await self._rewrite_domains_in_chunks(M.Domain.name == old_name, _rename, chunk_size, progress)
+        async with self._get_session() as session:
+            result = await session.execute(select(M.ImageDomain).where(M.ImageDomain.domain == old_name))
+            for image_domain in result.scalars().all():
+                image_domain.domain = new_name
+                if new_name not in (image_domain.domains or []):
+                    image_domain.domains = list(image_domain.domains or []) + [new_name]
+            self._audit(session, "rename", "domain", old_name, new_name=new_name)
+            await session.commit()
+        await self._update_images_in_chunks(M.Image.domain == old_name, {"domain": new_name}, chunk_size, progress)
+        return await self.get_domain_by_name(new_name)
+
+    async def update_image_domain_chunked(self, name: str, domain: str, chunk_size: int, progress) -> list[dict] | None:
+        """Chunked variant of update_image_domain for background jobs. Each chunk is committed separately."""
+        async with self._get_session() as session:
+            result = await session.execute(select(M.ImageDomain).where(M.ImageDomain.image == name))
+            db_image_domain = result.scalar_one_or_none()
+            if not db_image_domain:
+                return None
+            db_image_domain.domain = domain
+            if domain not in (db_image_domain.domains or []):
+                db_image_domain.domains = list(db_image_domain.domains or []) + [domain]
+            self._audit(session, "update_domain", "image", name, domain=domain)
+            await session.commit()
+        where = and_(M.Image.name == name, M.Image.domain != domain)
+        await progress.start(await self._count(M.Image, where))
+        await self._update_images_in_chunks(where, {"domain": domain}, chunk_size, progress)
+        return await self.get_image_by_name(name)
+
+    # =========================================================================
+    # Job Operations
+    # =========================================================================
+
+    async def create_job(self, job_id: str, operation: str, params: dict) -> dict:
+        """Create a pending background job."""
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        async with self._get_session() as session:
+            job = M.Job(id=job_id, operation=operation, params=params, status="pending", created_at=now, updated_at=now)
+            session.add(job)
+            await session.commit()
+            return job.to_dict()
+
+    async def update_job(self, job_id: str, **values) -> None:
+        """Update status, progress or outcome of a background job."""
+        values["updated_at"] = datetime.now(timezone.utc).replace(tzinfo=None)
+        async with self._get_session() as session:
+            await session.execute(update(M.Job).where(M.Job.id == job_id).values(**values))
+            await session.commit()
+
+    async def touch_jobs(self, job_ids: list[str]) -> None:
+        """Refresh updated_at of the queued and running jobs of this process, so that they are not taken for stale."""
+        if not job_ids:
+            return
+        async with self._get_session() as session:
+            await session.execute(
+                update(M.Job)
+                .where(self._in_keys((M.Job.id,), job_ids))
+                .values(updated_at=datetime.now(timezone.utc).replace(tzinfo=None))
+            )
+            await session.commit()
+
+    async def fail_stale_jobs(self, timeout: float) -> int:
+        """
+        Mark as failed the pending and running jobs not updated for timeout seconds:
+        the process that accepted them stopped without finishing them. Returns the number of jobs.
+        """
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        async with self._get_session() as session:
+            result = await session.execute(
+                update(M.Job)
+                .where(and_(M.Job.status.in_(("pending", "running")), M.Job.updated_at < now - timedelta(seconds=timeout)))
+                .values(status="failed", error="Interrupted: the server running the job stopped", updated_at=now)
+            )
+            await session.commit()
+            return result.rowcount
+
+    async def get_job(self, job_id: str) -> Optional[dict]:
+        """Get a background job by id."""
+        async with self._get_session() as session:
+            job = await session.get(M.Job, job_id)
+            return job.to_dict() if job else None
+
+    # =========================================================================
+    # Audit Operations
+    # =========================================================================
+
+    async def insert_audit_events(self, rows: list[dict]) -> None:
+        """Insert a batch of audit events in one multi-row INSERT."""
+        async with self._get_session() as session:
+            await session.execute(insert(M.AuditEvent).values(rows))
+            await session.commit()
+
+    async def get_audit_events(
+        self,
+        entity_type: Optional[str] = None,
+        entity: Optional[str] = None,
+        action: Optional[str] = None,
+        actor: Optional[str] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        cursor: Optional[int] = None,
+        limit: int = 50,
+    ) -> dict:
+        """
+        Audit events newest first, with keyset pagination: cursor is the id of the last event
+        of the previous page, and next_cursor is None on the last page.
+        """
+        query = select(M.AuditEvent)
+        for column, value in (
+            (M.AuditEvent.entity_type, entity_type),
+            (M.AuditEvent.entity, entity),
+            (M.AuditEvent.action, action),
+            (M.AuditEvent.actor, actor),
+        ):
+            if value is not None:
+                query = query.where(column == value)
+        if since is not None:
+            query = query.where(M.AuditEvent.at >= since)
+        if until is not None:
+            query = query.where(M.AuditEvent.at <= until)
+        if cursor is not None:
+            query = query.where(M.AuditEvent.id < cursor)
+        async with self._get_session() as session:
+            result = await session.execute(query.order_by(M.AuditEvent.id.desc()).limit(limit + 1))
+            events = [event.to_dict() for event in result.scalars().all()]
+        next_cursor = events[limit - 1]["id"] if len(events) > limit else None
+        return {"items": events[:limit], "next_cursor": next_cursor}
+
+    # =========================================================================
+    # Idempotency Operations
+    # =========================================================================
+
+    async def reserve_idempotency_key(self, key: str, request: str, request_hash: str, ttl: int,
+                                      pending_timeout: int) -> Optional[dict]:
+        """
+        Reserve an idempotency key for a request in flight, with status_code 0 until its response is saved.
+        Returns None once reserved, or the record of the key if it is already taken. Expired keys, and
+        reservations older than pending_timeout seconds (the server stopped during the request), are taken over.
+        """
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        async with self._get_session() as session:
+            await session.execute(
+                delete(M.IdempotencyKey).where(and_(
+                    M.IdempotencyKey.key == key,
+                    or_(
+                        M.IdempotencyKey.created_at < now - timedelta(seconds=ttl),
+                        and_(
+                            M.IdempotencyKey.status_code == 0,
+                            M.IdempotencyKey.created_at < now - timedelta(seconds=pending_timeout),
+                        ),
+                    ),
+                ))
+            )
+            result = await session.execute(
+                self._insert(M.IdempotencyKey)
+                .values(key=key, request=request, request_hash=request_hash, status_code=0, body="", created_at=now)
+                .on_conflict_do_nothing(index_elements=["key"])
+            )
+            if result.rowcount:
+                await session.commit()
+                return None
+            stored = await session.get(M.IdempotencyKey, key)
+            await session.commit()
+            if not stored:
+                # Released since the insert
+                return await self.reserve_idempotency_key(key, request, request_hash, ttl, pending_timeout)
+            return {
+                "request": stored.request,
+                "request_hash": stored.request_hash,
+                "status_code": stored.status_code,
+                "headers": stored.headers,
+                "body": stored.body,
+            }
+
+    async def save_idempotent_response(self, key: str, status_code: int, headers: list, body: str, ttl: int) -> None:
+        """Store the response for a reserved idempotency key and purge expired keys."""
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        async with self._get_session() as session:
+            await session.execute(
+                delete(M.IdempotencyKey).where(M.IdempotencyKey.created_at < now - timedelta(seconds=ttl))
+            )
+            await session.execute(
+                update(M.IdempotencyKey)
+                .where(and_(M.IdempotencyKey.key == key, M.IdempotencyKey.status_code == 0))
+                .values(status_code=status_code, headers=headers, body=body, created_at=now)
+            )
+            await session.commit()
+
+    async def release_idempotency_key(self, key: str) -> None:
+        """Drop the reservation of an idempotency key whose response is not stored, so that the request can be retried."""
+        async with self._get_session() as session:
+            await session.execute(
+                delete(M.IdempotencyKey).where(and_(M.IdempotencyKey.key == key, M.IdempotencyKey.status_code == 0))
+            )
+            await session.commit()
+
+    # =========================================================================
+    # Snapshot Operations
+    # =========================================================================
+
+    async def is_empty(self) -> bool:
+        """Check that none of the snapshot tables has rows."""
+        async with self.engine.connect() as conn:
+            existing = await conn.run_sync(lambda sync_conn: set(inspect(sync_conn).get_table_names()))
+            for table_name in SNAPSHOT_TABLES:
+                if table_name in existing:
+                    result = await conn.execute(text(f"SELECT 1 FROM {table_name} LIMIT 1"))
+                    if result.first():
+                        return False
+        return True
+
+    async def create_snapshot(self, path: str) -> dict:
+        """
+        Write a consistent gzip-compressed snapshot of the snapshot tables to path.
+        SQLite: online backup of the database file. PostgreSQL: COPY of every table in one repeatable-read transaction.
+        """
+        with tempfile.TemporaryDirectory() as workdir:
+            if self.engine.dialect.name == "postgresql":
+                tables = await self._copy_tables_out(workdir)
+            else:
+                tables = await asyncio.to_thread(self._backup_sqlite, workdir)
+            info = {
+                "format": SNAPSHOT_FORMAT,
+                "dialect": self.engine.dialect.name,
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                "tables": tables,
+            }
+            await asyncio.to_thread(self._pack_snapshot, path, workdir, info)
+        return info
+
+    async def restore_snapshot(self, path: str) -> dict:
+        """
+        Bulk-load a snapshot into an empty database of the same dialect,
+        then migrate the schema and rebuild the derived data.
+        """
+        if not await self.is_empty():
+            raise ValueError("Snapshots can only be restored into an empty database")
+        with tempfile.TemporaryDirectory() as workdir:
+            info = await asyncio.to_thread(self._unpack_snapshot, path, workdir)
+            if info["dialect"] != self.engine.dialect.name:
+                raise ValueError(f"Snapshot of a {info['dialect']} database can't be restored into {self.engine.dialect.name}")
+            if self.engine.dialect.name == "postgresql":
+                await self.migrate()
+                await self._copy_tables_in(workdir)
+            else:
+                # The backup replaces the whole database file, so no pooled connection may keep the old one
+                await self.engine.dispose()
+                await asyncio.to_thread(self._restore_sqlite, workdir)
+                await self.migrate()
+        # Snapshots may predate columns derived from the stored data
+        async with self.engine.begin() as conn:
+            await conn.run_sync(backfill_version_at)
+        await self.rebuild_current_state()
+        return info
+
+    async def _copy_tables_out(self, workdir: str) -> dict[str, int]:
+        tables = {}
+        async with self.engine.connect() as conn:
+            raw = (await conn.get_raw_connection()).driver_connection
+            async with raw.transaction(isolation="repeatable_read", readonly=True):
+                for table_name in SNAPSHOT_TABLES:
+                    status = await raw.copy_from_table(
+                        table_name, output=os.path.join(workdir, f"{table_name}.csv"), format="csv", header=True
+                    )
+                    tables[table_name] = int(status.split()[-1])
+        return tables
+
+    async def _copy_tables_in(self, workdir: str) -> None:
+        async with self.engine.connect() as conn:
+            raw = (await conn.get_raw_connection()).driver_connection
+            async with raw.transaction():
+                for table_name in SNAPSHOT_TABLES:
+                    source = os.path.join(workdir, f"{table_name}.csv")
+                    # Load the columns of the snapshot, which may predate columns added since
+                    with open(source, newline="") as f:
+                        columns = next(csv.reader(f))
+                    await raw.copy_to_table(table_name, source=source, columns=columns, format="csv", header=True)
+
+    def _backup_sqlite(self, workdir: str) -> dict[str, int]:
+        target = sqlite3.connect(os.path.join(workdir, "catalog.db"))
+        source = sqlite3.connect(self.sqlite_path)
+        try:
+            source.backup(target)
+        finally:
+            source.close()
+        try:
+            # Keep only the snapshot tables; search indexes and derived tables are recreated on restore
+            for (name,) in target.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'").fetchall():
+                target.execute(f'DROP TRIGGER "{name}"')
+            for (name,) in target.execute("SELECT name FROM sqlite_master WHERE sql LIKE 'CREATE VIRTUAL TABLE%'").fetchall():
+                target.execute(f'DROP TABLE "{name}"')
+            for (name,) in target.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'").fetchall():
+                if name not in SNAPSHOT_TABLES:
+                    target.execute(f'DROP TABLE "{name}"')
+            target.commit()
+            target.execute("VACUUM")
+            return {name: target.execute(f"SELECT count(*) FROM {name}").fetchone()[0] for name in SNAPSHOT_TABLES}
+        finally:
+            target.close()
+
+    def _restore_sqlite(self, workdir: str) -> None:
+        source = sqlite3.connect(os.path.join(workdir, "catalog.db"))
+        target = sqlite3.connect(self.sqlite_path)
+        try:
+            source.backup(target)
+        finally:
+            source.close()
+            target.close()
+
+    @staticmethod
+    def _pack_snapshot(path: str, workdir: str, info: dict) -> None:
+        with open(os.path.join(workdir, "snapshot.json"), "w") as f:
+            json.dump(info, f)
+        with tarfile.open(path, "w:gz", compresslevel=6) as tar:
+            for name in sorted(os.listdir(workdir)):
+                tar.add(os.path.join(workdir, name), arcname=name)
+
+    @staticmethod
+    def _unpack_snapshot(path: str, workdir: str) -> dict:
+        with tarfile.open(path, "r:gz") as tar:
+            tar.extractall(workdir, filter="data")
+        with open(os.path.join(workdir, "snapshot.json")) as f:
+            info = json.load(f)
+        if info.get("format") != SNAPSHOT_FORMAT:
+            raise ValueError(f"Unsupported snapshot format: {info.get('format')}")
+        return info
+
 # Global database instance
 db = Database()
 
 
 async def init_db():
-    """Initialize database connection and create tables."""
+    """
+    Initialize database connection and check the schema version.
+    Optionally migrate the schema and restore RESTORE_SNAPSHOT into an empty database first.
+    """
     await db.connect()
-    await db.create_tables()
+    if MIGRATE_ON_STARTUP or RESTORE_SNAPSHOT:
+        async with db.startup_lock():
+            if MIGRATE_ON_STARTUP:
+                await db.migrate()
+            if RESTORE_SNAPSHOT and await db.is_empty():
+                info = await db.restore_snapshot(RESTORE_SNAPSHOT)
+                logger.info(f"Restored snapshot {RESTORE_SNAPSHOT} created at {info['created_at']}: {info['tables']}")
+    await db.wait_for_schema(SCHEMA_WAIT_TIMEOUT)
+    await notifier.start(db.engine, sqlite_path=db.sqlite_path)
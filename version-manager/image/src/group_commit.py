@@ -0,0 +1,127 @@
+"""
+Optional group commit of single-item writes.
+Bursts of concurrent image registrations and tested flags each pay a transaction and an fsync.
+With GROUP_COMMIT=true, writes arriving within GROUP_COMMIT_WINDOW_MS (or until GROUP_COMMIT_MAX_ITEMS
+are queued) run in one transaction. If one of them fails, or the commit fails, the transaction is rolled
+back and every write of the group runs again in its own transaction, so each caller gets its own result or error.
+"""
+
+import os
+import asyncio
+import contextvars
+import logging
+
+logger = logging.getLogger(__name__)
+
+GROUP_COMMIT = os.getenv("GROUP_COMMIT", "false").lower() == "true"
+GROUP_COMMIT_WINDOW_MS = float(os.getenv("GROUP_COMMIT_WINDOW_MS", "5"))
+GROUP_COMMIT_MAX_ITEMS = int(os.getenv("GROUP_COMMIT_MAX_ITEMS", "64"))
+
+
+class GroupCommit:
+    """
+    Pending writes, committed in groups by one background task: writes queue up while a group commits,
+    so groups grow with the load. An idle committer waits for the window before committing the first group.
+    """
+
+    def __init__(self):
+        self._run = None
+        self._pending: list[tuple] = []
+        self._full = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self.groups = 0
+        self.items = 0
+        self.max_group = 0
+        self.fallbacks = 0
+
+    @property
+    def running(self) -> bool:
+        return self._run is not None
+
+    async def start(self, run):
+        """Enable group commit if configured. run(works) calls work(session) for every work in one transaction."""
+        if GROUP_COMMIT:
+            self._run = run
+
+    async def stop(self):
+        """Commit the pending writes and stop."""
+        if self._task:
+            self._full.set()
+            await self._task
+        self._run = None
+
+    async def submit(self, work):
+        """Run work(session) in the next group and return its result, or raise its error."""
+        future = asyncio.get_running_loop().create_future()
+        # The group runs in another task: keep the caller's context, e.g. the actor of the audit events
+        self._pending.append((work, contextvars.copy_context(), future))
+        if len(self._pending) >= GROUP_COMMIT_MAX_ITEMS:
+            self._full.set()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._drain())
+        return await future
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.running,
+            "window_ms": GROUP_COMMIT_WINDOW_MS,
+            "max_items": GROUP_COMMIT_MAX_ITEMS,
+            "pending": len(self._pending),
+            "groups": self.groups,
+            "items": self.items,
+            "max_group": self.max_group,
+            "fallbacks": self.fallbacks,
+        }
+
+    async def _drain(self):
+        """Commit groups until no write is pending."""
+        try:
+            await asyncio.wait_for(self._full.wait(), GROUP_COMMIT_WINDOW_MS / 1000)
+        except asyncio.TimeoutError:
+            pass
+        while self._pending:
+            group = self._pending[:GROUP_COMMIT_MAX_ITEMS]
+            del self._pending[:GROUP_COMMIT_MAX_ITEMS]
+            self._full.clear()
+            await self._commit(group)
+
+    @staticmethod
+    def _in_context(work, context):
+        return lambda session: asyncio.create_task(work(session), context=context)
+
+    async def _commit(self, group: list[tuple]):
+        self.groups += 1
+        self.items += len(group)
+        self.max_group = max(self.max_group, len(group))
+        try:
+            results = await self._run([self._in_context(work, context) for work, context, _ in group])
+        except Exception as e:
+            if len(group) == 1:
+                self._resolve(group[0][2], exception=e)
+                return
+            self.fallbacks += 1
+            logger.info(f"Group commit of {len(group)} writes failed, committing them one by one: {e}")
+            for work, context, future in group:
+                try:
+                    [result] = await self._run([self._in_context(work, context)])
+                except Exception as e:
+                    self._resolve(future, exception=e)
+                else:
+                    self._resolve(future, result)
+            return
+        for (_, _, future), result in zip(group, results):
+            self._resolve(future, result)
+
+    @staticmethod
+    def _resolve(future: asyncio.Future, result=None, exception: Exception | None = None):
+        # The caller may have been cancelled, e.g. by a client disconnect
+        if future.done():
+            return
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(result)
+
+
+# Global group commit instance
+group_commit = GroupCommit()
@@ -0,0 +1,106 @@
+"""
+Liveness and readiness checks.
+Liveness only tells that the process serves requests. Readiness runs a timed database ping,
+reports connection pool usage and event loop lag, and fails when they pass the configured thresholds,
+so that an overloaded pod is taken out of the load balancer instead of being restarted.
+"""
+
+import os
+import asyncio
+import logging
+import time
+
+from sqlalchemy import text
+
+from database import db
+
+logger = logging.getLogger(__name__)
+
+READY_CACHE_TTL = float(os.getenv("READY_CACHE_TTL", "2"))
+READY_DB_TIMEOUT = float(os.getenv("READY_DB_TIMEOUT", "2"))
+READY_MAX_DB_LATENCY_MS = float(os.getenv("READY_MAX_DB_LATENCY_MS", "500"))
+READY_MAX_LOOP_LAG_MS = float(os.getenv("READY_MAX_LOOP_LAG_MS", "500"))
+LOOP_LAG_INTERVAL = 0.5
+
+
+class ReadinessCheck:
+    """Samples event loop lag in the background and caches the result of the database check."""
+
+    def __init__(self):
+        self.loop_lag = 0.0
+        self._task = None
+        self._lock = asyncio.Lock()
+        self._result = None
+        self._checked_at = 0.0
+
+    async def start(self):
+        self._task = asyncio.create_task(self._sample_loop_lag())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+
+    async def _sample_loop_lag(self):
+        """Measure how late the loop wakes up from a sleep: time spent waiting behind other tasks."""
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(LOOP_LAG_INTERVAL)
+            self.loop_lag = max(0.0, loop.time() - start - LOOP_LAG_INTERVAL)
+
+    async def check(self) -> dict:
+        """Return the readiness report, computed at most once per READY_CACHE_TTL seconds."""
+        async with self._lock:
+            if self._result is None or time.monotonic() - self._checked_at >= READY_CACHE_TTL:
+                self._result = await self._run()
+                self._checked_at = time.monotonic()
+            return self._result
+
+    async def _ping(self) -> float:
+        start = time.perf_counter()
+        async with db.engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+        return time.perf_counter() - start
+
+    def _pool_stats(self) -> dict:
+        pool = db.engine.pool
+        stats = {"class": type(pool).__name__}
+        if hasattr(pool, "checkedout"):
+            stats.update({
+                "size": pool.size(),
+                "checked_out": pool.checkedout(),
+                # Negative while the pool has not opened all of its connections yet
+                "overflow": max(0, pool.overflow()),
+            })
+        return stats
+
+    async def _run(self) -> dict:
+        failures = []
+        database = {"latency_ms": None}
+        try:
+            latency = await asyncio.wait_for(self._ping(), READY_DB_TIMEOUT)
+            database["latency_ms"] = round(latency * 1000, 1)
+            if database["latency_ms"] > READY_MAX_DB_LATENCY_MS:
+                failures.append(f"Database latency {database['latency_ms']} ms exceeds {READY_MAX_DB_LATENCY_MS:g} ms")
+        except asyncio.TimeoutError:
+            failures.append(f"Database ping timed out after {READY_DB_TIMEOUT:g} s")
+        except Exception as e:
+            failures.append(f"Database ping failed: {e}")
+
+        loop_lag_ms = round(self.loop_lag * 1000, 1)
+        if loop_lag_ms > READY_MAX_LOOP_LAG_MS:
+            failures.append(f"Event loop lag {loop_lag_ms} ms exceeds {READY_MAX_LOOP_LAG_MS:g} ms")
+
+        if failures:
+            logger.warning(f"Not ready: {'; '.join(failures)}")
+        return {
+            "status": "not ready" if failures else "ready",
+            "failures": failures,
+            "database": database,
+            "pool": self._pool_stats(),
+            "loop_lag_ms": loop_lag_ms,
+        }
+
+
+# Global readiness check instance
+readiness = ReadinessCheck()
@@ -0,0 +1,79 @@
+"""
+Idempotency-Key support for mutating requests.
+Responses of POST/PUT/DELETE requests sent with an Idempotency-Key header are stored
+in the database for IDEMPOTENCY_TTL seconds, and retries with the same key get the stored response.
+The key is reserved while the request runs, so that a concurrent retry is rejected instead of applied twice.
+"""
+
+import hashlib
+import os
+from fastapi import Request
+from fastapi.responses import JSONResponse, Response
+
+from database import db
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+IDEMPOTENCY_TTL = int(os.getenv("IDEMPOTENCY_TTL", "86400"))
+# Seconds after which the reservation of a request that never completed is taken over
+IDEMPOTENCY_PENDING_TIMEOUT = int(os.getenv("IDEMPOTENCY_PENDING_TIMEOUT", "300"))
+IDEMPOTENT_METHODS = {"POST", "PUT", "DELETE"}
+# Client errors that a retry of the same request gets again, stored like successes.
+# The others (409 conflicts, 429 rejections, ...) may succeed on a retry.
+STORED_CLIENT_ERRORS = {400, 404, 405, 410, 422}
+
+
+def _stored(status_code: int) -> bool:
+    return 200 <= status_code < 300 or status_code in STORED_CLIENT_ERRORS
+
+
+async def idempotency_middleware(request: Request, call_next):
+    """Replay stored responses for retried requests that carry an Idempotency-Key header."""
+    key = request.headers.get(IDEMPOTENCY_HEADER)
+    if not key or request.method not in IDEMPOTENT_METHODS:
+        return await call_next(request)
+
+    fingerprint = f"{request.method} {request.url.path}"
+    request_hash = hashlib.sha256(request.url.query.encode() + b"\n" + await request.body()).hexdigest()
+    stored = await db.reserve_idempotency_key(
+        key, fingerprint, request_hash, IDEMPOTENCY_TTL, IDEMPOTENCY_PENDING_TIMEOUT
+    )
+    if stored:
+        if stored["request"] != fingerprint:
+            return JSONResponse(
+                status_code=422,
+                content={"detail": f"{IDEMPOTENCY_HEADER} '{key}' was already used for '{stored['request']}'"},
+            )
+        if stored["request_hash"] not in (None, request_hash):
+            return JSONResponse(
+                status_code=422,
+                content={"detail": f"{IDEMPOTENCY_HEADER} '{key}' was already used with a different request body"},
+            )
+        if stored["status_code"] == 0:
+            return JSONResponse(
+                status_code=409,
+                content={"detail": f"A request with {IDEMPOTENCY_HEADER} '{key}' is in progress"},
+                headers={"Retry-After": "1"},
+            )
+        replayed = Response(content=stored["body"], status_code=stored["status_code"], media_type="application/json")
+        if stored["headers"] is not None:
+            replayed.raw_headers = [(name.encode("latin-1"), value.encode("latin-1")) for name, value in stored["headers"]]
+        replayed.headers["Idempotency-Replayed"] = "true"
+        return replayed
+
+    try:
+        response = await call_next(request)
+        body = b"".join([chunk async for chunk in response.body_iterator])
+    except BaseException:
+        await db.release_idempotency_key(key)
+        raise
+    if _stored(response.status_code):
+        headers = [[name.decode("latin-1"), value.decode("latin-1")] for name, value in response.raw_headers]
+        await db.save_idempotent_response(key, response.status_code, headers, body.decode(), IDEMPOTENCY_TTL)
+    else:
+        await db.release_idempotency_key(key)
+    return Response(
+        content=body,
+        status_code=response.status_code,
+        headers=dict(response.headers),
+        media_type=response.media_type,
+    )
@@ -0,0 +1,133 @@
+"""
+Background job engine for heavy cascading operations.
+Jobs are stored in the database so that any worker can report their progress,
+and run in a bounded pool of asyncio workers in the process that accepted them.
+Each process refreshes its jobs every JOB_HEARTBEAT_INTERVAL seconds: jobs not refreshed for
+JOB_STALE_TIMEOUT seconds were left by a process that crashed or was killed, and are marked as failed.
+"""
+
+import os
+import asyncio
+import logging
+import uuid
+from typing import Awaitable, Callable
+
+from audit import current_actor
+from database import db
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "100"))
+JOB_CHUNK_SIZE = int(os.getenv("JOB_CHUNK_SIZE", "500"))
+JOB_HEARTBEAT_INTERVAL = float(os.getenv("JOB_HEARTBEAT_INTERVAL", "30"))
+JOB_STALE_TIMEOUT = float(os.getenv("JOB_STALE_TIMEOUT", "120"))
+
+
+class JobQueueFull(Exception):
+    """Raised when no more jobs can be queued."""
+
+
+class JobProgress:
+    """Progress reporter passed to the chunked Database operations."""
+
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+        self.processed = 0
+
+    async def start(self, total: int) -> None:
+        await db.update_job(self.job_id, total=total)
+
+    async def advance(self, count: int) -> None:
+        self.processed += count
+        await db.update_job(self.job_id, processed=self.processed)
+
+
+class JobRunner:
+    """Bounded queue of background jobs processed by a fixed number of worker tasks."""
+
+    def __init__(self):
+        self._queue: asyncio.Queue | None = None
+        self._workers: list[asyncio.Task] = []
+        self._heartbeat: asyncio.Task | None = None
+        self._running: dict[asyncio.Task, str] = {}
+        # Queue slots taken by submits creating their job row
+        self._reserved = 0
+        # Queued and running jobs of this process
+        self._jobs: set[str] = set()
+
+    async def start(self):
+        """Fail the jobs left by stopped processes, then start the workers."""
+        await self._fail_stale_jobs()
+        self._queue = asyncio.Queue(maxsize=JOB_QUEUE_SIZE)
+        self._workers = [asyncio.create_task(self._work()) for _ in range(JOB_WORKERS)]
+        self._heartbeat = asyncio.create_task(self._beat())
+
+    async def stop(self):
+        """Stop the workers. Jobs that were interrupted or never started are marked as failed."""
+        tasks = self._workers + ([self._heartbeat] if self._heartbeat else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        interrupted = list(self._running.values())
+        while self._queue and not self._queue.empty():
+            interrupted.append(self._queue.get_nowait()[0])
+        for job_id in interrupted:
+            await db.update_job(job_id, status="failed", error="Interrupted by server shutdown")
+
+    async def submit(self, operation: str, params: dict, run: Callable[[JobProgress], Awaitable]) -> dict:
+        """Queue a job. run receives a JobProgress and returns the JSON-serializable job result."""
+        # The slot is reserved before the row is created, so that concurrent submits can't overfill the queue
+        if self._queue.qsize() + self._reserved >= JOB_QUEUE_SIZE:
+            raise JobQueueFull(f"Job queue is full ({JOB_QUEUE_SIZE} jobs)")
+        self._reserved += 1
+        try:
+            job = await db.create_job(uuid.uuid4().hex, operation, params)
+        finally:
+            self._reserved -= 1
+        self._jobs.add(job["id"])
+        self._queue.put_nowait((job["id"], run, current_actor.get()))
+        return job
+
+    async def _fail_stale_jobs(self):
+        failed = await db.fail_stale_jobs(JOB_STALE_TIMEOUT)
+        if failed:
+            logger.warning(f"{failed} jobs of stopped servers marked as failed")
+
+    async def _beat(self):
+        """Refresh the jobs of this process and fail those of stopped processes."""
+        while True:
+            await asyncio.sleep(JOB_HEARTBEAT_INTERVAL)
+            try:
+                await db.touch_jobs(list(self._jobs))
+                await self._fail_stale_jobs()
+            except Exception as e:
+                logger.warning(f"Job heartbeat failed: {e}")
+
+    async def _work(self):
+        worker = asyncio.current_task()
+        while True:
+            job_id, run, actor = await self._queue.get()
+            self._running[worker] = job_id
+            # Changes made by the job are audited as made by the actor who submitted it
+            current_actor.set(actor)
+            try:
+                await db.update_job(job_id, status="running")
+                result = await run(JobProgress(job_id))
+                if result is None:
+                    await db.update_job(job_id, status="failed", error="Not found")
+                else:
+                    await db.update_job(job_id, status="succeeded", result=result)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Job {job_id} failed: {e}")
+                await db.update_job(job_id, status="failed", error=str(e))
+            # A cancelled job stays in _running so that stop() can mark it as failed
+            self._running.pop(worker, None)
+            self._jobs.discard(job_id)
+            self._queue.task_done()
+
+
+# Global job runner instance
+jobs = JobRunner()
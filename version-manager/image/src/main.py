@@ -8,11 +8,20 @@ import os
 import uvicorn
 from fastapi import FastAPI, HTTPException
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse
 from pydantic import BaseModel
 from contextlib import asynccontextmanager
 
-from database import init_db
+from admission import admission_middleware, admission_stats
+from audit import audit_log, audit_middleware
+from coalescing import coalescer
+from coherence import notifier
+from database import db, init_db
+from group_commit import group_commit
+from health import readiness
+from idempotency import idempotency_middleware
+from jobs import jobs
+from manifests import manifests
 from routes import router as api_router
 from swagger import get_swagger_config
 
@@ -28,9 +37,19 @@ class LoginRequest(BaseModel):
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    """Initialize database on startup."""
+    """Initialize database, manifests, audit log, group commit and background jobs on startup, stop them on shutdown."""
     await init_db()
+    await manifests.start()
+    await audit_log.start(db.insert_audit_events)
+    await group_commit.start(db.run_in_transaction)
+    await jobs.start()
+    await readiness.start()
     yield
+    await readiness.stop()
+    await jobs.stop()
+    await group_commit.stop()
+    await audit_log.stop()
+    await notifier.stop()
 
 
 app = FastAPI(
@@ -38,6 +57,18 @@ app = FastAPI(
     **get_swagger_config(),
 )
 
+# Replay stored responses for retried requests with an Idempotency-Key header
+app.middleware("http")(idempotency_middleware)
+
+# Actor of the audited changes, from the X-Actor header
+app.middleware("http")(audit_middleware)
+
+# Read and write concurrency budgets, added last so that it runs first
+app.middleware("http")(admission_middleware)
+
+# Identical concurrent GET requests share one response, and don't take admission slots
+app.middleware("http")(coalescer)
+
 # API routes
 app.include_router(api_router, prefix="/v1")
 
@@ -49,10 +80,31 @@ if os.path.exists(UI_DIR):
 
 @app.get("/health")
 async def health_check():
-    """Health check endpoint."""
+    """Liveness check: the process serves requests. Doesn't touch the database."""
     return {"status": "healthy"}
 
 
+@app.get("/ready")
+async def readiness_check():
+    """Readiness check: database latency, connection pool usage and event loop lag. 503 when over the thresholds."""
+    result = await readiness.check()
+    return JSONResponse(status_code=200 if result["status"] == "ready" else 503, content=result)
+
+
+@app.get("/stats")
+async def stats():
+    """Request admission queues, coalesced requests, audit log queue, group commits and statement caching of this worker process."""
+    return {
+        # Worker processes of the server: the counters below are those of the process that answered
+        "workers": int(os.getenv("WEB_CONCURRENCY", "1")),
+        "admission": admission_stats(),
+        "coalescing": coalescer.stats(),
+        "audit": audit_log.stats(),
+        "group_commit": group_commit.stats(),
+        "statements": db.statement_stats(),
+    }
+
+
 @app.post("/auth/login")
 async def login(request: LoginRequest):
     """Authenticate user with username and password."""
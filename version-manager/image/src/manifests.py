@@ -0,0 +1,101 @@
+"""
+Deploy manifests of active image tags per environment.
+Manifests are rendered from the current_state table after every change, in this or another process,
+and served from memory with an ETag so that deploy pipelines don't hit the database.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+
+from coherence import notifier
+from database import db
+
+logger = logging.getLogger(__name__)
+
+FORMATS = {"json": "application/json", "yaml": "application/yaml"}
+
+
+def _render_yaml(manifest: dict) -> str:
+    """Render a manifest as YAML. Names and tags are written as JSON strings, which are valid YAML scalars."""
+    lines = [f"env: {json.dumps(manifest['env'])}", "domains:" + ("" if manifest["domains"] else " {}")]
+    for domain, state in manifest["domains"].items():
+        lines.append(f"  {json.dumps(domain)}:")
+        lines.append(f"    version: {json.dumps(state['version'])}")
+        lines.append(f"    tested: {json.dumps(state['tested'])}")
+        lines.append("    images:" + ("" if state["images"] else " {}"))
+        lines.extend(f"      {json.dumps(image)}: {json.dumps(tag)}" for image, tag in state["images"].items())
+    return "\n".join(lines) + "\n"
+
+
+def _render(manifest: dict) -> dict:
+    """Render a manifest in every format, with a content-hash ETag each."""
+    bodies = {"json": json.dumps(manifest, indent=2).encode(), "yaml": _render_yaml(manifest).encode()}
+    return {fmt: (body, f'"{hashlib.sha256(body).hexdigest()[:32]}"') for fmt, body in bodies.items()}
+
+
+class ManifestCache:
+    """In-memory manifests per environment and per (environment, domain), rebuilt after every change."""
+
+    def __init__(self):
+        self._revision = 0
+        self._built = -1
+        self._rendered: dict[tuple[str, str | None], dict] = {}
+        self._task: asyncio.Task | None = None
+
+    async def start(self):
+        notifier.subscribe(self.invalidate)
+        await self._refresh()
+
+    def invalidate(self) -> None:
+        """Notifier callback: schedule a rebuild. Changes arriving during a rebuild trigger one more."""
+        self._revision += 1
+        if not self._task or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._refresh())
+
+    async def _refresh(self):
+        while self._built != self._revision:
+            revision = self._revision
+            try:
+                states = await db.get_all_current_states()
+            except Exception as e:
+                logger.warning(f"Rendering manifests failed: {e}")
+                return
+            self._rendered = self._render_all(states)
+            self._built = revision
+
+    @staticmethod
+    def _render_all(states: list[dict]) -> dict[tuple[str, str | None], dict]:
+        manifests: dict[str, dict] = {}
+        for state in states:
+            manifest = manifests.setdefault(state["env"], {"env": state["env"], "domains": {}})
+            manifest["domains"][state["domain"]] = {
+                "version": state["version"],
+                "tested": state["tested"],
+                "images": dict(item.rsplit(":", 1) for item in state["images"]),
+            }
+        rendered = {}
+        for env, manifest in manifests.items():
+            rendered[(env, None)] = _render(manifest)
+            for domain, state in manifest["domains"].items():
+                rendered[(env, domain)] = _render({"env": env, "domains": {domain: state}})
+        return rendered
+
+    async def get(self, env: str, domain: str | None, fmt: str) -> tuple[bytes, str] | None:
+        """Get the (body, ETag) of a manifest. None if the domain is not active in the environment."""
+        if self._built != self._revision:
+            if not self._task or self._task.done():
+                self._task = asyncio.get_running_loop().create_task(self._refresh())
+            await asyncio.shield(self._task)
+        rendered = self._rendered.get((env, domain))
+        if rendered is None:
+            if domain:
+                return None
+            # No active domain in the environment yet
+            rendered = _render({"env": env, "domains": {}})
+        return rendered[fmt]
+
+
+# Global manifest cache instance
+manifests = ManifestCache()
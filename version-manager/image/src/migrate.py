@@ -0,0 +1,27 @@
+"""
+Apply pending schema migrations using the database settings of the server
+(USE_POSTGRESQL, DB_* or SQLITE_PATH environment variables).
+Run it as a one-shot job before starting a new version of the application.
+
+Usage: python migrate.py
+"""
+
+import asyncio
+
+from database import db
+from migrations import LATEST_VERSION
+
+
+async def main():
+    await db.connect()
+    try:
+        async with db.startup_lock():
+            current = await db.get_schema_version()
+            applied = await db.migrate()
+        print(f"Schema version {current} -> {LATEST_VERSION}, applied migrations: {applied or 'none'}")
+    finally:
+        await db.engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,325 @@
+"""
+Versioned schema migrations.
+Applied in order by the one-shot `python migrate.py` command (or at startup with MIGRATE_ON_STARTUP=true),
+and recorded in the schema_migrations table. Every migration is idempotent, so that databases created
+by older versions of the application, and restored snapshots, can be brought to the latest version.
+Index builds run outside a transaction on PostgreSQL (CREATE INDEX CONCURRENTLY) and don't block writes.
+"""
+
+from datetime import datetime, timezone
+from typing import Callable
+
+from sqlalchemy import MetaData, Table, Column, String, Boolean, JSON, select, update, delete, insert, and_, inspect, bindparam, text
+from sqlalchemy.types import DateTime
+
+import models as M
+
+
+class Migration:
+    """A schema change: upgrade runs with a sync connection, inside a transaction unless transactional is False."""
+
+    def __init__(self, version: int, description: str, upgrade: Callable, transactional: bool = True):
+        self.version = version
+        self.description = description
+        self.upgrade = upgrade
+        self.transactional = transactional
+
+
+MIGRATIONS: list[Migration] = []
+
+# The schema before versioned migrations, created by migration 1. Frozen: the later migrations change it,
+# so that a database at a given version has the same schema whatever version of the models created it.
+BASELINE = MetaData()
+Table(
+    "images", BASELINE,
+    Column("name", String, primary_key=True),
+    Column("version", String, primary_key=True),
+    Column("domain", String, nullable=False),
+    Column("tested", Boolean),
+)
+Table(
+    "domains", BASELINE,
+    Column("name", String, primary_key=True),
+    Column("version", String, primary_key=True),
+    Column("deployed", String),
+    Column("tested", Boolean),
+    Column("active", Boolean),
+    Column("images", JSON),
+)
+Table(
+    "image_domain", BASELINE,
+    Column("image", String, primary_key=True),
+    Column("domain", String, primary_key=True),
+    Column("domains", JSON),
+)
+
+
+def migration(version: int, description: str, transactional: bool = True):
+    """Register a migration function."""
+    def register(upgrade: Callable) -> Callable:
+        MIGRATIONS.append(Migration(version, description, upgrade, transactional))
+        return upgrade
+    return register
+
+
+def _add_column(conn, table_name: str, column_name: str, ddl: str) -> None:
+    """Add a column to an existing table if it is missing."""
+    if column_name in {column["name"] for column in inspect(conn).get_columns(table_name)}:
+        return
+    quote = conn.dialect.identifier_preparer.quote
+    conn.exec_driver_sql(f"ALTER TABLE {quote(table_name)} ADD COLUMN {quote(column_name)} {ddl}")
+
+
+def _create_index(conn, name: str, table_name: str, columns: str, using: str = "", unique: bool = False,
+                  where: str = "") -> None:
+    """
+    Create an index if it is missing, unique and partial with the unique and where arguments.
+    On PostgreSQL the index is built concurrently, and an invalid index left by an interrupted build
+    (e.g. on duplicate keys) is dropped and built again.
+    """
+    kind = "UNIQUE INDEX" if unique else "INDEX"
+    where = f" WHERE {where}" if where else ""
+    if conn.dialect.name != "postgresql":
+        conn.exec_driver_sql(f"CREATE {kind} IF NOT EXISTS {name} ON {table_name} ({columns}){where}")
+        return
+    valid = conn.execute(
+        text("SELECT i.indisvalid FROM pg_class c JOIN pg_index i ON i.indexrelid = c.oid WHERE c.relname = :name"),
+        {"name": name},
+    ).scalar()
+    if valid:
+        return
+    if valid is not None:
+        conn.exec_driver_sql(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+    using = f" USING {using}" if using else ""
+    conn.exec_driver_sql(f"CREATE {kind} CONCURRENTLY IF NOT EXISTS {name} ON {table_name}{using} ({columns}){where}")
+
+
+def backfill_version_at(conn) -> None:
+    """Parse version_at for rows that don't have it, e.g. created before the column existed."""
+    for model in (M.Image, M.Domain):
+        table = model.__table__
+        result = conn.execute(select(table.c.name, table.c.version).where(table.c.version_at.is_(None)))
+        rows = [
+            {"b_name": name, "b_version": version, "b_version_at": M.parse_version(version)}
+            for name, version in result.all()
+        ]
+        rows = [row for row in rows if row["b_version_at"]]
+        if rows:
+            conn.execute(
+                update(table)
+                .where(and_(table.c.name == bindparam("b_name"), table.c.version == bindparam("b_version")))
+                .values(version_at=bindparam("b_version_at")),
+                rows,
+            )
+
+
+@migration(1, "Create tables")
+def _create_tables(conn) -> None:
+    BASELINE.create_all(conn)
+
+
+@migration(2, "Build current_state from the active domain versions")
+def _build_current_state(conn) -> None:
+    domains = M.Domain.__table__
+    current_state = M.CurrentState.__table__
+    current_state.create(conn, checkfirst=True)
+    conn.execute(delete(current_state))
+    result = conn.execute(
+        select(domains.c.name, domains.c.deployed, domains.c.version, domains.c.tested, domains.c.images)
+        .where(domains.c.active == True)
+    )
+    # Keep the latest version if several rows are active for the same environment, in the order of
+    # _sync_current_state: parsed version (version_at, added by migration 5), versions in another format first
+    rows = sorted(result.all(), key=lambda row: (
+        M.parse_version(row.version) is not None, M.parse_version(row.version) or datetime.min, row.version
+    ))
+    states = {(row.name, row.deployed): row for row in rows}
+    if states:
+        conn.execute(insert(current_state), [
+            {
+                "domain": row.name,
+                "env": row.deployed,
+                "version": row.version,
+                "tested": row.tested,
+                "images": [f"{img['name']}:{img['version']}" for img in (row.images or [])],
+            }
+            for row in states.values()
+        ])
+
+
+@migration(3, "Add domains.row_version for optimistic locking")
+def _add_row_version(conn) -> None:
+    _add_column(conn, "domains", "row_version", "INTEGER NOT NULL DEFAULT 1")
+
+
+@migration(4, "Index image and domain names for search", transactional=False)
+def _create_search_indexes(conn) -> None:
+    """Trigram GIN indexes on PostgreSQL, trigram FTS5 tables kept in sync by triggers on SQLite."""
+    sources = (("image_domain", "image"), ("domains", "name"))
+    if conn.dialect.name == "postgresql":
+        conn.exec_driver_sql("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        for table_name, column_name in sources:
+            _create_index(
+                conn, f"ix_{table_name}_{column_name}_trgm", table_name, f"lower({column_name}) gin_trgm_ops", using="gin"
+            )
+        return
+    existing = set(inspect(conn).get_table_names())
+    for table_name, column_name in sources:
+        fts = f"{table_name}_fts"
+        conn.exec_driver_sql(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+            f"{column_name}, content='{table_name}', content_rowid='rowid', tokenize='trigram')"
+        )
+        conn.exec_driver_sql(
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_insert AFTER INSERT ON {table_name} BEGIN "
+            f"INSERT INTO {fts}(rowid, {column_name}) VALUES (new.rowid, new.{column_name}); END"
+        )
+        conn.exec_driver_sql(
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_delete AFTER DELETE ON {table_name} BEGIN "
+            f"INSERT INTO {fts}({fts}, rowid, {column_name}) VALUES ('delete', old.rowid, old.{column_name}); END"
+        )
+        conn.exec_driver_sql(
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_update AFTER UPDATE OF {column_name} ON {table_name} BEGIN "
+            f"INSERT INTO {fts}({fts}, rowid, {column_name}) VALUES ('delete', old.rowid, old.{column_name}); "
+            f"INSERT INTO {fts}(rowid, {column_name}) VALUES (new.rowid, new.{column_name}); END"
+        )
+        if fts not in existing:
+            # Index the rows that existed before the FTS table
+            conn.exec_driver_sql(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+
+@migration(5, "Add version_at to images and domains, parsed from the version")
+def _add_version_at(conn) -> None:
+    for table_name in ("images", "domains"):
+        _add_column(conn, table_name, "version_at", DateTime().compile(dialect=conn.dialect))
+    backfill_version_at(conn)
+
+
+@migration(6, "Index images and domains by (name, version_at)", transactional=False)
+def _create_version_at_indexes(conn) -> None:
+    for table_name in ("images", "domains"):
+        _create_index(conn, f"ix_{table_name}_name_version_at", table_name, "name, version_at")
+
+
+@migration(7, "Create the audit_events table")
+def _create_audit_events(conn) -> None:
+    M.AuditEvent.__table__.create(conn, checkfirst=True)
+
+
+@migration(8, "Record activation intervals in state_history", transactional=False)
+def _create_state_history(conn) -> None:
+    """
+    Open an interval for every current state, and index the intervals by environment and time:
+    a GiST index on the time range on PostgreSQL, a B-tree on (env, valid_to, valid_from) on SQLite.
+    """
+    history = M.StateHistory.__table__
+    history.create(conn, checkfirst=True)
+    if conn.execute(select(history.c.id).limit(1)).first() is None:
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        domains = M.Domain.__table__
+        current_state = M.CurrentState.__table__
+        result = conn.execute(
+            select(domains.c.name, domains.c.deployed, domains.c.version, domains.c.tested, domains.c.images)
+            .join(current_state, and_(
+                current_state.c.domain == domains.c.name,
+                current_state.c.env == domains.c.deployed,
+                current_state.c.version == domains.c.version,
+            ))
+        )
+        rows = [
+            {"domain": row.name, "env": row.deployed, "version": row.version, "tested": row.tested,
+             "images": row.images or [], "valid_from": now}
+            for row in result.all()
+        ]
+        if rows:
+            conn.execute(insert(history), rows)
+    if conn.dialect.name == "postgresql":
+        conn.exec_driver_sql("CREATE EXTENSION IF NOT EXISTS btree_gist")
+        _create_index(conn, "ix_state_history_env_at", "state_history", "env, tsrange(valid_from, valid_to)", using="gist")
+    else:
+        _create_index(conn, "ix_state_history_env_at", "state_history", "env, valid_to, valid_from")
+
+
+@migration(9, "Index domain versions by the image versions they contain", transactional=False)
+def _create_domain_images_index(conn) -> None:
+    """
+    PostgreSQL: domains.images as JSONB with a GIN index, for containment queries (images @> '[{...}]').
+    SQLite: a domain_images table with one row per image of a domain version, kept in sync by triggers.
+    """
+    if conn.dialect.name == "postgresql":
+        data_type = conn.execute(
+            text("SELECT data_type FROM information_schema.columns WHERE table_name = 'domains' AND column_name = 'images'")
+        ).scalar()
+        if data_type == "json":
+            conn.exec_driver_sql("ALTER TABLE domains ALTER COLUMN images TYPE jsonb USING images::jsonb")
+        _create_index(conn, "ix_domains_images", "domains", "images jsonb_path_ops", using="gin")
+        return
+    existing = set(inspect(conn).get_table_names())
+    conn.exec_driver_sql(
+        "CREATE TABLE IF NOT EXISTS domain_images ("
+        "image VARCHAR NOT NULL, image_version VARCHAR NOT NULL, domain VARCHAR NOT NULL, domain_version VARCHAR NOT NULL)"
+    )
+    _create_index(conn, "ix_domain_images_image", "domain_images", "image, image_version")
+    _create_index(conn, "ix_domain_images_domain", "domain_images", "domain, domain_version")
+    add = (
+        "INSERT INTO domain_images(image, image_version, domain, domain_version) "
+        "SELECT json_extract(value, '$.name'), json_extract(value, '$.version'), new.name, new.version "
+        "FROM json_each(new.images) WHERE type = 'object'; "
+    )
+    remove = "DELETE FROM domain_images WHERE domain = old.name AND domain_version = old.version; "
+    conn.exec_driver_sql(f"CREATE TRIGGER IF NOT EXISTS domain_images_insert AFTER INSERT ON domains BEGIN {add}END")
+    conn.exec_driver_sql(f"CREATE TRIGGER IF NOT EXISTS domain_images_delete AFTER DELETE ON domains BEGIN {remove}END")
+    conn.exec_driver_sql(
+        f"CREATE TRIGGER IF NOT EXISTS domain_images_update AFTER UPDATE OF name, version, images ON domains BEGIN {remove}{add}END"
+    )
+    if "domain_images" not in existing:
+        # Index the domain versions that existed before the table
+        conn.exec_driver_sql(
+            "INSERT INTO domain_images(image, image_version, domain, domain_version) "
+            "SELECT json_extract(j.value, '$.name'), json_extract(j.value, '$.version'), d.name, d.version "
+            "FROM domains d, json_each(d.images) j WHERE j.type = 'object'"
+        )
+
+
+@migration(10, "Create the idempotency_keys and jobs tables")
+def _create_idempotency_keys_and_jobs(conn) -> None:
+    """Created by migration 1 on databases created before it was frozen to the baseline schema."""
+    M.IdempotencyKey.__table__.create(conn, checkfirst=True)
+    M.Job.__table__.create(conn, checkfirst=True)
+
+
+@migration(11, "Allow one open state_history interval per (domain, env)", transactional=False)
+def _create_state_history_open_index(conn) -> None:
+    """
+    Concurrent activations could open two intervals for the same state: each open interval that has
+    a newer one is closed when the next one opened, then a partial unique index keeps one open interval.
+    """
+    history = M.StateHistory.__table__
+    newer = history.alias("newer")
+    next_open = (
+        select(newer.c.valid_from)
+        .where(and_(
+            newer.c.domain == history.c.domain,
+            newer.c.env == history.c.env,
+            newer.c.valid_to.is_(None),
+            newer.c.id > history.c.id,
+        ))
+        .order_by(newer.c.id)
+        .limit(1)
+        .scalar_subquery()
+    )
+    conn.execute(
+        update(history)
+        .where(and_(history.c.valid_to.is_(None), next_open.isnot(None)))
+        .values(valid_to=next_open)
+    )
+    _create_index(conn, "ux_state_history_open", "state_history", "domain, env", unique=True, where="valid_to IS NULL")
+
+
+@migration(12, "Add the request hash and response headers to idempotency_keys")
+def _add_idempotency_request_hash(conn) -> None:
+    _add_column(conn, "idempotency_keys", "request_hash", "VARCHAR")
+    _add_column(conn, "idempotency_keys", "headers", "JSON")
+
+
+LATEST_VERSION = max(m.version for m in MIGRATIONS)
@@ -2,11 +2,30 @@
 SQLAlchemy models for database tables.
 """
 
-from sqlalchemy import Column, String, Boolean, JSON
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import Column, String, Boolean, Integer, BigInteger, Text, DateTime, JSON, Index
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import declarative_base
 
 Base = declarative_base()
 
+VERSION_FORMAT = "%Y-%m-%d-%H-%M-%S"
+
+
+def parse_version(version: str) -> Optional[datetime]:
+    """Parse a YYYY-MM-DD-hh-mm-ss version. Returns None for versions in another format."""
+    try:
+        return datetime.strptime(version, VERSION_FORMAT)
+    except (TypeError, ValueError):
+        return None
+
+
+def _version_timestamp(context) -> Optional[datetime]:
+    """Column default: the parsed timestamp of the inserted version."""
+    return parse_version(context.get_current_parameters()["version"])
+
 
 class Image(Base):
     """Image table model."""
@@ -17,6 +36,9 @@ class Image(Base):
     version = Column(String, primary_key=True)
     domain = Column(String, nullable=False)
     tested = Column(Boolean, default=False)
+    version_at = Column(DateTime, default=_version_timestamp)  # Parsed version, for range queries
+
+    __table_args__ = (Index("ix_images_name_version_at", "name", "version_at"),)
 
     def to_dict(self):
         return {
@@ -37,7 +59,13 @@ class Domain(Base):
     deployed = Column(String, default="dev")  # 'dev', 'staging', 'prod'
     tested = Column(Boolean, default=False)
     active = Column(Boolean, default=False)
-    images = Column(JSON, default=list)  # [{"name": "", "version": ""}, ...]
+    # [{"name": "", "version": ""}, ...], JSONB with a GIN index on PostgreSQL (see migrations.py)
+    images = Column(JSON().with_variant(JSONB, "postgresql"), default=list)
+    row_version = Column(Integer, nullable=False, default=1, server_default="1")  # Optimistic locking counter
+    version_at = Column(DateTime, default=_version_timestamp)  # Parsed version, for range queries
+
+    __table_args__ = (Index("ix_domains_name_version_at", "name", "version_at"),)
+    __mapper_args__ = {"version_id_col": row_version}
 
     def to_dict(self):
         return {
@@ -64,3 +92,143 @@ class ImageDomain(Base):
             "domain": self.domain,
             "domains": self.domains or [],
         }
+
+
+class CurrentState(Base):
+    """Current deployment state table model, one row per active (domain, env)."""
+
+    __tablename__ = "current_state"
+
+    domain = Column(String, primary_key=True)
+    env = Column(String, primary_key=True)  # 'dev', 'staging', 'prod'
+    version = Column(String, nullable=False)
+    tested = Column(Boolean, default=False)
+    images = Column(JSON, default=list)  # ["image:version", ...]
+
+    def to_dict(self):
+        return {
+            "domain": self.domain,
+            "env": self.env,
+            "version": self.version,
+            "tested": self.tested,
+            "images": self.images or [],
+        }
+
+
+class StateHistory(Base):
+    """
+    Activation intervals per (domain, env): the active version and its images from valid_from
+    until valid_to, which is null while the state is current. The interval index and the unique index
+    of the open intervals are created by migrations.py.
+    """
+
+    __tablename__ = "state_history"
+    __table_args__ = (
+        Index("ix_state_history_domain", "domain", "env", "valid_to"),
+    )
+
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True)
+    domain = Column(String, nullable=False)
+    env = Column(String, nullable=False)  # 'dev', 'staging', 'prod'
+    version = Column(String, nullable=False)
+    tested = Column(Boolean, default=False)
+    images = Column(JSON, default=list)  # [{"name", "version", "tested"}, ...] as in Domain.images
+    valid_from = Column(DateTime, nullable=False)
+    valid_to = Column(DateTime)
+
+    def to_domain_dict(self):
+        """The state as the Domain row that was active."""
+        return {
+            "name": self.domain,
+            "version": self.version,
+            "deployed": self.env,
+            "tested": self.tested,
+            "active": True,
+            "images": self.images or [],
+        }
+
+
+class IdempotencyKey(Base):
+    """Stored responses of requests sent with an Idempotency-Key header."""
+
+    __tablename__ = "idempotency_keys"
+
+    key = Column(String, primary_key=True)
+    request = Column(String, nullable=False)  # "METHOD /path"
+    request_hash = Column(String)  # SHA-256 of the query string and body
+    status_code = Column(Integer, nullable=False)  # 0 while the request is in flight
+    headers = Column(JSON)  # [[name, value], ...]
+    body = Column(Text, nullable=False)
+    created_at = Column(DateTime, nullable=False, index=True)
+
+
+class Job(Base):
+    """Background job table model."""
+
+    __tablename__ = "jobs"
+
+    id = Column(String, primary_key=True)
+    operation = Column(String, nullable=False)  # e.g. 'rename_image'
+    params = Column(JSON, default=dict)
+    status = Column(String, nullable=False, default="pending")  # 'pending', 'running', 'succeeded', 'failed'
+    processed = Column(Integer, nullable=False, default=0)
+    total = Column(Integer)
+    result = Column(JSON)
+    error = Column(Text)
+    created_at = Column(DateTime, nullable=False)
+    updated_at = Column(DateTime, nullable=False)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "operation": self.operation,
+            "params": self.params or {},
+            "status": self.status,
+            "processed": self.processed or 0,
+            "total": self.total,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+
+
+class AuditEvent(Base):
+    """Append-only audit log of mutations, written in batches by audit.py."""
+
+    __tablename__ = "audit_events"
+    __table_args__ = (
+        Index("ix_audit_events_entity", "entity_type", "entity", "id"),
+        Index("ix_audit_events_at", "at"),
+    )
+
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True)
+    at = Column(DateTime, nullable=False)
+    actor = Column(String, nullable=False)
+    action = Column(String, nullable=False)  # e.g. 'promote'
+    entity_type = Column(String, nullable=False)  # 'image', 'domain'
+    entity = Column(String, nullable=False)
+    version = Column(String)
+    details = Column(JSON, default=dict)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "at": self.at,
+            "actor": self.actor,
+            "action": self.action,
+            "entity_type": self.entity_type,
+            "entity": self.entity,
+            "version": self.version,
+            "details": self.details or {},
+        }
+
+
+class SchemaMigration(Base):
+    """Applied schema migrations, see migrations.py."""
+
+    __tablename__ = "schema_migrations"
+
+    version = Column(Integer, primary_key=True, autoincrement=False)
+    description = Column(String, nullable=False)
+    applied_at = Column(DateTime, nullable=False)
@@ -3,13 +3,54 @@ API Routes for Version Manager Application.
 Defines all endpoints for managing images and domains.
 """
 
-from typing import Optional
-from fastapi import APIRouter, HTTPException, Query
+import os
+import tempfile
+from datetime import datetime, timezone
+from typing import Literal, Optional
+from fastapi import APIRouter, Header, HTTPException, Query
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import FileResponse, JSONResponse, Response
+from starlette.background import BackgroundTask
 from database import db
+from jobs import jobs, JobQueueFull, JOB_CHUNK_SIZE
+from manifests import manifests, FORMATS
+from models import parse_version
 import schemas as S
 
 router = APIRouter()
 
+ASYNC_QUERY = Query(False, alias="async", description="Run as a background job: returns 202 with the job id")
+ACCEPTED_RESPONSE = {202: {"model": S.JobResponse, "description": "Background job accepted"}}
+SINCE_QUERY = Query(None, description="Only versions at or after this version (YYYY-MM-DD-hh-mm-ss)")
+UNTIL_QUERY = Query(None, description="Only versions at or before this version (YYYY-MM-DD-hh-mm-ss)")
+LATEST_QUERY = Query(None, ge=1, description="Only the N newest versions, newest first")
+
+
+def _version_bound(param: str, value: Optional[str]):
+    """Parse a since/until query parameter."""
+    if value is None:
+        return None
+    bound = parse_version(value)
+    if bound is None:
+        raise HTTPException(status_code=422, detail=f"'{param}' must be a version in YYYY-MM-DD-hh-mm-ss format")
+    return bound
+
+
+def _utc(value: Optional[datetime]) -> Optional[datetime]:
+    """Naive UTC datetime, as stored in the database. Datetimes without an offset are taken as UTC."""
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+async def _submit_job(operation: str, params: dict, run) -> JSONResponse:
+    """Queue a background job and return 202 Accepted with the job and its status URL."""
+    try:
+        job = await jobs.submit(operation, params, run)
+    except JobQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    return JSONResponse(status_code=202, content=jsonable_encoder(job), headers={"Location": f"/v1/jobs/{job['id']}"})
+
 
 # =============================================================================
 # Images Endpoints
@@ -49,11 +90,31 @@ async def list_tested_images(
         raise HTTPException(status_code=500, detail=f"Error getting tested images: {str(e)}")
 
 
+@router.post("/images/versions/lookup", response_model=S.ImageLookupResponse, tags=["Images"])
+async def lookup_image_versions(images: list[S.ImageLookup]):
+    """Look up many image versions in one request. Results are keyed by 'name:version'."""
+    try:
+        found = await db.lookup_image_versions([(img.name, img.version) for img in images])
+        results = {f"{img.name}:{img.version}": found.get((img.name, img.version)) for img in images}
+        return {"results": results, "missing": [key for key, value in results.items() if value is None]}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error looking up image versions: {str(e)}")
+
+
 @router.get("/images/{image_name}/list", response_model=list[S.ImageResponse], tags=["Images"])
-async def get_image_versions(image_name: str):
-    """Get the image with all versions and their status."""
+async def get_image_versions(
+    image_name: str,
+    since: Optional[str] = SINCE_QUERY,
+    until: Optional[str] = UNTIL_QUERY,
+    latest: Optional[int] = LATEST_QUERY,
+):
+    """Get the image with all versions and their status, optionally restricted to a version range."""
     try:
-        images = await db.get_image_by_name(image_name)
+        images = await db.get_image_by_name(
+            image_name, _version_bound("since", since), _version_bound("until", until), latest
+        )
         if not images:
             raise HTTPException(status_code=404, detail=f"Image '{image_name}' not found")
         return images
@@ -80,6 +141,19 @@ async def get_tested_image_versions(
         raise HTTPException(status_code=500, detail=f"Error getting tested image {image_name}: {str(e)}")
 
 
+@router.get("/images/{image_name}/{version}/domains", response_model=list[S.DomainReferenceResponse], tags=["Images"])
+async def get_image_version_domains(image_name: str, version: str):
+    """Get every domain version that contains the image version, with its environment and active flag."""
+    try:
+        if not await db.lookup_image_versions([(image_name, version)]):
+            raise HTTPException(status_code=404, detail=f"Image '{image_name}' version '{version}' not found")
+        return await db.get_domains_by_image_version(image_name, version)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error getting domains of image {image_name}:{version}: {str(e)}")
+
+
 @router.post("/images/create", response_model=S.ImageDomainResponse, status_code=201, tags=["Images"])
 async def create_image(
     image: S.ImageCreate):
@@ -126,12 +200,19 @@ async def set_image_tested(
         raise HTTPException(status_code=500, detail=f"Error setting image tested {image_name}: {str(e)}")
 
 
-@router.put("/images/{image_name}/domain", response_model=list[S.ImageResponse], tags=["Images"])
+@router.put("/images/{image_name}/domain", response_model=list[S.ImageResponse], responses=ACCEPTED_RESPONSE, tags=["Images"])
 async def update_image_domain(
     image_name: str,
-    domain: S.ImageDomain):
+    domain: S.ImageDomain,
+    run_async: bool = ASYNC_QUERY):
     """Update domain for all versions of an image."""
     try:
+        if run_async:
+            return await _submit_job(
+                "update_image_domain",
+                {"name": image_name, "domain": domain.domain},
+                lambda progress: db.update_image_domain_chunked(image_name, domain.domain, JOB_CHUNK_SIZE, progress),
+            )
         images = await db.update_image_domain(name=image_name, domain=domain.domain)
         if not images:
             raise HTTPException(status_code=404, detail=f"Image '{image_name}' not found")
@@ -142,15 +223,22 @@ async def update_image_domain(
         raise HTTPException(status_code=500, detail=f"Error updating image domain {image_name}: {str(e)}")
 
 
-@router.put("/images/{image_name}/rename", response_model=list[S.ImageResponse], tags=["Images"])
+@router.put("/images/{image_name}/rename", response_model=list[S.ImageResponse], responses=ACCEPTED_RESPONSE, tags=["Images"])
 async def rename_image(
     image_name: str,
-    new_name: S.ImageRename):
+    new_name: S.ImageRename,
+    run_async: bool = ASYNC_QUERY):
     """
     Rename image: first updates the name in all domain.images lists,
     then renames all image entries.
     """
     try:
+        if run_async:
+            return await _submit_job(
+                "rename_image",
+                {"name": image_name, "new_name": new_name.name},
+                lambda progress: db.rename_image_chunked(image_name, new_name.name, JOB_CHUNK_SIZE, progress),
+            )
         images = await db.rename_image(old_name=image_name, new_name=new_name.name)
         if not images:
             raise HTTPException(status_code=404, detail=f"Image '{image_name}' not found")
@@ -161,13 +249,19 @@ async def rename_image(
         raise HTTPException(status_code=500, detail=f"Error renaming image {image_name}: {str(e)}")
 
 
-@router.delete("/images/{image_name}", tags=["Images"])
-async def delete_image(image_name: str):
+@router.delete("/images/{image_name}", responses=ACCEPTED_RESPONSE, tags=["Images"])
+async def delete_image(image_name: str, run_async: bool = ASYNC_QUERY):
     """
     Delete image: first removes it from all domain.images lists,
     then deletes all image versions.
     """
     try:
+        if run_async:
+            return await _submit_job(
+                "delete_image",
+                {"name": image_name},
+                lambda progress: db.delete_image_chunked(image_name, JOB_CHUNK_SIZE, progress),
+            )
         result = await db.delete_image(name=image_name)
         if not result:
             raise HTTPException(status_code=404, detail=f"Image '{image_name}' not found")
@@ -197,9 +291,12 @@ async def list_all_domains():
 @router.get("/domains/active", response_model=list[S.DomainResponse], tags=["Domains"])
 async def list_active_domains(
     env: Optional[str] = Query(None, description="Filter by deployment environment: dev, staging, prod"),
+    at: Optional[datetime] = Query(None, description="Domains that were active at this time (ISO 8601, UTC if no offset)"),
 ):
-    """List all the active domains with names, versions, image versions and status."""
+    """List all the active domains with names, versions, image versions and status, now or at a point in time."""
     try:
+        if at is not None:
+            return await db.get_active_domains_at(_utc(at), deployed=env)
         return await db.get_active_domains(deployed=env)
     except HTTPException:
         raise
@@ -207,11 +304,45 @@ async def list_active_domains(
         raise HTTPException(status_code=500, detail=f"Error getting active domains: {str(e)}")
 
 
+@router.post("/domains/active/lookup", response_model=S.DomainLookupResponse, tags=["Domains"])
+async def lookup_active_domains(domains: list[S.DomainLookup]):
+    """Look up the active version of many domains in one request. Results are keyed by 'name:env'."""
+    try:
+        found = await db.lookup_current_states([(d.name, d.env) for d in domains])
+        results = {f"{d.name}:{d.env}": found.get((d.name, d.env)) for d in domains}
+        return {"results": results, "missing": [key for key, value in results.items() if value is None]}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error looking up active domains: {str(e)}")
+
+
+@router.get("/domains/diff", response_model=S.EnvironmentDiffResponse, tags=["Domains"])
+async def diff_environments(
+    from_env: str = Query(..., description="Compared environment: dev, staging, prod"),
+    to_env: str = Query(..., description="Target environment: dev, staging, prod"),
+):
+    """Compare the active image versions of all domains between two environments."""
+    try:
+        return {"from_env": from_env, "to_env": to_env, "domains": await db.diff_environments(from_env, to_env)}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error comparing environments: {str(e)}")
+
+
 @router.get("/domains/{domain_name}", response_model=list[S.DomainResponse], tags=["Domains"])
-async def get_domain(domain_name: str):
-    """List all the domain entries with all image versions and status."""
+async def get_domain(
+    domain_name: str,
+    since: Optional[str] = SINCE_QUERY,
+    until: Optional[str] = UNTIL_QUERY,
+    latest: Optional[int] = LATEST_QUERY,
+):
+    """List all the domain entries with all image versions and status, optionally restricted to a version range."""
     try:
-        domains = await db.get_domain_by_name(domain_name)
+        domains = await db.get_domain_by_name(
+            domain_name, _version_bound("since", since), _version_bound("until", until), latest
+        )
         if not domains:
             raise HTTPException(status_code=404, detail=f"Domain '{domain_name}' not found")
         return domains
@@ -237,6 +368,41 @@ async def get_active_domain(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error getting active domain: {str(e)}")
 
+@router.get("/domains/{domain_name}/current", response_model=S.CurrentStateResponse, tags=["Domains"])
+async def get_current_state(
+    domain_name: str,
+    env: str = Query("dev", description="Deployment environment: dev, staging, prod"),
+):
+    """Get active domain version with resolved image:version pairs from the current state table."""
+    try:
+        state = await db.get_current_state(domain_name, env)
+        if not state:
+            raise HTTPException(status_code=404, detail=f"Active domain '{domain_name}' not found in '{env}'")
+        return state
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error getting current state: {str(e)}")
+
+@router.get("/domains/{domain_name}/diff", response_model=S.DomainDiffResponse, tags=["Domains"])
+async def diff_domain_versions(
+    domain_name: str,
+    from_version: str = Query(..., alias="from", description="Compared version (YYYY-MM-DD-hh-mm-ss)"),
+    to_version: str = Query(..., alias="to", description="Target version (YYYY-MM-DD-hh-mm-ss)"),
+):
+    """Compare the image versions and tested flags of two versions of a domain."""
+    try:
+        diff = await db.diff_domain_versions(domain_name, from_version, to_version)
+        if not diff:
+            raise HTTPException(
+                status_code=404, detail=f"Domain '{domain_name}' versions '{from_version}' and '{to_version}' not found"
+            )
+        return diff
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error comparing domain versions: {str(e)}")
+
 @router.post("/domains/{domain_name}/create", response_model=S.DomainResponse, status_code=201, tags=["Domains"])
 async def create_domain(
     domain_name: str,
@@ -303,15 +469,22 @@ async def promote_domains(domains: S.DomainPromote | list[S.DomainPromote]):
         raise HTTPException(status_code=500, detail=f"Error promoting domains: {str(e)}")
 
 
-@router.put("/domains/{domain_name}/rename", response_model=list[S.DomainResponse], tags=["Domains"])
+@router.put("/domains/{domain_name}/rename", response_model=list[S.DomainResponse], responses=ACCEPTED_RESPONSE, tags=["Domains"])
 async def rename_domain(
     domain_name: str,
-    name: S.DomainRename):
+    name: S.DomainRename,
+    run_async: bool = ASYNC_QUERY):
     """
     Rename domain: first updates the domain field in all related images,
     then renames all domain entries.
     """
     try:
+        if run_async:
+            return await _submit_job(
+                "rename_domain",
+                {"name": domain_name, "new_name": name.name},
+                lambda progress: db.rename_domain_chunked(domain_name, name.name, JOB_CHUNK_SIZE, progress),
+            )
         domain = await db.rename_domain(old_name=domain_name, new_name=name.name)
         if not domain:
             raise HTTPException(status_code=404, detail=f"Domain '{domain_name}' not found")
@@ -355,3 +528,128 @@ async def delete_domain_version(
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error deleting domain version {domain_name} {version}: {str(e)}")
+
+
+# =============================================================================
+# Manifests Endpoints
+# =============================================================================
+
+
+@router.get(
+    "/manifests/{env}",
+    tags=["Manifests"],
+    response_class=Response,
+    responses={
+        200: {"content": {media_type: {} for media_type in FORMATS.values()}, "description": "Manifest"},
+        304: {"description": "Manifest unchanged since the ETag in If-None-Match"},
+    },
+)
+async def get_manifest(
+    env: Literal["dev", "staging", "prod"],
+    domain: Optional[str] = Query(None, description="Only this domain"),
+    format: Literal["yaml", "json"] = Query("yaml", description="Manifest format: yaml, json"),
+    if_none_match: Optional[str] = Header(None),
+):
+    """Get the image tags of every active domain in an environment, served from memory with an ETag."""
+    try:
+        manifest = await manifests.get(env, domain, format)
+        if manifest is None:
+            raise HTTPException(status_code=404, detail=f"Active domain '{domain}' not found in '{env}'")
+        body, etag = manifest
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+            return Response(status_code=304, headers=headers)
+        return Response(content=body, media_type=FORMATS[format], headers=headers)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error getting manifest for '{env}': {str(e)}")
+
+
+# =============================================================================
+# Snapshot Endpoints
+# =============================================================================
+
+
+@router.get(
+    "/snapshot",
+    tags=["Snapshots"],
+    response_class=FileResponse,
+    responses={200: {"content": {"application/gzip": {}}, "description": "Snapshot archive"}},
+)
+async def download_snapshot():
+    """Download a consistent compressed snapshot of the images, domains and image domains tables."""
+    fd, path = tempfile.mkstemp(suffix=".tar.gz")
+    os.close(fd)
+    try:
+        info = await db.create_snapshot(path)
+    except Exception as e:
+        os.unlink(path)
+        raise HTTPException(status_code=500, detail=f"Error creating snapshot: {str(e)}")
+    filename = f"version-manager-{info['created_at'][:19].replace(':', '-')}.tar.gz"
+    return FileResponse(path, media_type="application/gzip", filename=filename, background=BackgroundTask(os.unlink, path))
+
+
+# =============================================================================
+# Search Endpoints
+# =============================================================================
+
+
+@router.get("/search", response_model=S.SearchResponse, tags=["Search"])
+async def search(
+    q: str = Query(..., min_length=1, description="Text to find in image and domain names"),
+    type: Optional[Literal["image", "domain"]] = Query(None, description="Restrict results to: image, domain"),
+    limit: int = Query(20, ge=1, le=100, description="Page size"),
+    offset: int = Query(0, ge=0, description="Results to skip"),
+):
+    """Search image and domain names by prefix and substring, ranked by match quality."""
+    try:
+        return await db.search(q, type, limit, offset)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error searching '{q}': {str(e)}")
+
+
+# =============================================================================
+# Audit Endpoints
+# =============================================================================
+
+
+@router.get("/audit", response_model=S.AuditPage, tags=["Audit"])
+async def list_audit_events(
+    entity_type: Optional[Literal["image", "domain"]] = Query(None, description="Only events of: image, domain"),
+    entity: Optional[str] = Query(None, description="Only events of this image or domain name"),
+    action: Optional[str] = Query(None, description="Only this action, e.g. promote"),
+    actor: Optional[str] = Query(None, description="Only changes made by this actor"),
+    since: Optional[datetime] = Query(None, description="Only events at or after this time (ISO 8601, UTC if no offset)"),
+    until: Optional[datetime] = Query(None, description="Only events at or before this time (ISO 8601, UTC if no offset)"),
+    cursor: Optional[int] = Query(None, description="next_cursor of the previous page"),
+    limit: int = Query(50, ge=1, le=500, description="Page size"),
+):
+    """List audit events of mutations, newest first, with keyset pagination."""
+    try:
+        return await db.get_audit_events(entity_type, entity, action, actor, _utc(since), _utc(until), cursor, limit)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error listing audit events: {str(e)}")
+
+
+# =============================================================================
+# Jobs Endpoints
+# =============================================================================
+
+
+@router.get("/jobs/{job_id}", response_model=S.JobResponse, tags=["Jobs"])
+async def get_job(job_id: str):
+    """Get progress and outcome of a background job."""
+    try:
+        job = await db.get_job(job_id)
+        if not job:
+            raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found")
+        return job
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error getting job {job_id}: {str(e)}")
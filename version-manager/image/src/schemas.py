@@ -2,6 +2,8 @@
 Pydantic schemas for request/response validation.
 """
 
+from datetime import datetime
+from typing import Any, Literal
 from pydantic import BaseModel, Field
 
 class ImageVersion(BaseModel):
@@ -17,6 +19,12 @@ class ImageTested(BaseModel):
     version: str = Field(..., description="Image version in YYYY-MM-DD-hh-mm-ss format")
     tested: bool = Field(..., description="Tested status")
 
+class ImageLookup(BaseModel):
+    """Schema for looking up an image version."""
+
+    name: str = Field(..., description="Image name")
+    version: str = Field(..., description="Image version in YYYY-MM-DD-hh-mm-ss format")
+
 class ImageCreate(BaseModel):
     """Schema for creating new image-domain entry."""
 
@@ -64,6 +72,12 @@ class ImagesListElement(BaseModel):
     class Config:
         from_attributes = True
 
+class ImageLookupResponse(BaseModel):
+    """Schema for batch image version lookup response, keyed by 'name:version'."""
+
+    results: dict[str, ImageResponse | None] = Field(..., description="Image version per input key, null if not found")
+    missing: list[str] = Field(..., description="Input keys that were not found")
+
 class DomainCreate(BaseModel):
     """Schema for creating a new domain version."""
 
@@ -85,6 +99,16 @@ class DomainResponse(BaseModel):
         from_attributes = True
 
 
+class DomainReferenceResponse(BaseModel):
+    """Schema for a domain version that contains an image version."""
+
+    name: str
+    version: str
+    deployed: str = Field(..., description="Deployment environment: dev, staging, prod")
+    tested: bool
+    active: bool
+
+
 class DomainUpdate(BaseModel):
     """Schema for updating domain images."""
 
@@ -118,3 +142,114 @@ class DomainRename(BaseModel):
     """Schema for renaming domain."""
 
     name: str = Field(..., description="New name for the domain")
+
+
+class ImageChange(BaseModel):
+    """Schema for an image whose version or tested flag differs between two domain versions."""
+
+    name: str
+    from_version: str
+    to_version: str
+    from_tested: bool
+    to_tested: bool
+
+
+class DomainDiffResponse(BaseModel):
+    """Schema for the image differences between two domain versions."""
+
+    name: str
+    from_version: str | None = Field(None, description="Compared version, null if the domain is not active there")
+    to_version: str | None = Field(None, description="Target version, null if the domain is not active there")
+    added: list[ImagesListElement] = Field([], description="Images only in the target version")
+    removed: list[ImagesListElement] = Field([], description="Images only in the compared version")
+    changed: list[ImageChange] = Field([], description="Images with a different version or tested flag")
+
+
+class EnvironmentDiffResponse(BaseModel):
+    """Schema for the differences between the active domains of two environments."""
+
+    from_env: str
+    to_env: str
+    domains: list[DomainDiffResponse] = Field(..., description="Domains that differ between the environments")
+
+
+class CurrentStateResponse(BaseModel):
+    """Schema for current deployment state of a domain in an environment."""
+
+    domain: str
+    env: str = Field(..., description="Deployment environment: dev, staging, prod")
+    version: str
+    tested: bool
+    images: list[str] = Field([], description="Resolved image:version pairs")
+
+    class Config:
+        from_attributes = True
+
+
+class DomainLookup(BaseModel):
+    """Schema for looking up the active domain version in an environment."""
+
+    name: str = Field(..., description="Domain name")
+    env: str = Field("dev", description="Deployment environment: dev, staging, prod")
+
+
+class DomainLookupResponse(BaseModel):
+    """Schema for batch active domain lookup response, keyed by 'name:env'."""
+
+    results: dict[str, CurrentStateResponse | None] = Field(..., description="Current state per input key, null if not found")
+    missing: list[str] = Field(..., description="Input keys that were not found")
+
+
+class JobResponse(BaseModel):
+    """Schema for background job status response."""
+
+    id: str
+    operation: str
+    params: dict
+    status: str = Field(..., description="Job status: pending, running, succeeded, failed")
+    processed: int = Field(..., description="Rows processed so far")
+    total: int | None = Field(None, description="Rows to process, once known")
+    result: Any = Field(None, description="Operation result, same as the synchronous response")
+    error: str | None = None
+    created_at: datetime
+    updated_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class AuditEventResponse(BaseModel):
+    """Schema for one audit event."""
+
+    id: int
+    at: datetime
+    actor: str = Field(..., description="X-Actor header of the request, 'anonymous' without it")
+    action: str = Field(..., description="e.g. create, create_version, set_tested, activate, promote, rename, delete")
+    entity_type: Literal["image", "domain"]
+    entity: str = Field(..., description="Image or domain name")
+    version: str | None = None
+    details: dict = {}
+
+
+class AuditPage(BaseModel):
+    """Schema for a page of audit events, newest first."""
+
+    items: list[AuditEventResponse]
+    next_cursor: int | None = Field(None, description="Cursor of the next page, null on the last page")
+
+
+class SearchResult(BaseModel):
+    """Schema for one search result."""
+
+    type: Literal["image", "domain"]
+    name: str
+    match: Literal["exact", "prefix", "substring"]
+
+
+class SearchResponse(BaseModel):
+    """Schema for a page of ranked search results."""
+
+    items: list[SearchResult]
+    total: int = Field(..., description="Number of matching names")
+    limit: int
+    offset: int
@@ -0,0 +1,35 @@
+"""
+Create or restore a catalog snapshot using the database settings of the server
+(USE_POSTGRESQL, DB_* or SQLITE_PATH environment variables).
+
+Usage:
+    python snapshot.py create PATH    write a snapshot of the images, domains and image domains tables
+    python snapshot.py restore PATH   load a snapshot into an empty database
+"""
+
+import sys
+import asyncio
+
+from database import db
+
+
+async def main(command: str, path: str):
+    await db.connect()
+    try:
+        if command == "create":
+            info = await db.create_snapshot(path)
+        else:
+            async with db.startup_lock():
+                info = await db.restore_snapshot(path)
+        print(f"{command}: {path} ({info['dialect']}, {info['created_at']}): {info['tables']}")
+    finally:
+        await db.engine.dispose()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3 or sys.argv[1] not in ("create", "restore"):
+        sys.exit(__doc__)
+    try:
+        asyncio.run(main(sys.argv[1], sys.argv[2]))
+    except ValueError as e:
+        sys.exit(f"{sys.argv[1]} failed: {e}")
@@ -83,6 +83,41 @@ Endpoints for managing deployment domains and versions.
 - Setting a domain as tested also sets all associated images as tested
                 """.strip(),
             },
+            {
+                "name": "Manifests",
+                "description": """
+Deploy manifests of the image tags of active domains per environment, cached in memory with ETags.
+                """.strip(),
+            },
+            {
+                "name": "Snapshots",
+                "description": """
+Consistent compressed snapshots of the catalog for disaster recovery and environment cloning.
+                """.strip(),
+            },
+            {
+                "name": "Search",
+                "description": """
+Indexed search over image and domain names with prefix and substring matching.
+                """.strip(),
+            },
+            {
+                "name": "Audit",
+                "description": """
+Append-only log of who changed which image or domain, and when.
+
+Send the `X-Actor` header with mutating requests to record who made the change.
+                """.strip(),
+            },
+            {
+                "name": "Jobs",
+                "description": """
+Progress and outcome of background jobs.
+
+Heavy cascading operations (image rename/delete/domain change, domain rename) accept `?async=true`
+and then return `202 Accepted` with a job id instead of running inside the request.
+                """.strip(),
+            },
             {
                 "name": "Authentication",
                 "description": """
@@ -95,6 +130,11 @@ Authentication endpoints for user login and session management.
         "openapi_tags": [
             {"name": "Images"},
             {"name": "Domains"},
+            {"name": "Manifests"},
+            {"name": "Snapshots"},
+            {"name": "Search"},
+            {"name": "Audit"},
+            {"name": "Jobs"},
             {"name": "Authentication"},
         ],
         "servers": [
@@ -3,14 +3,64 @@ Pytest configuration and fixtures for Version Manager API tests.
 Assumes docker container is already running (use `make run-sqlite` first).
 """
 
+import contextlib
+import os
+import socket
+import subprocess
+import sys
+import time
+
 import pytest
+import requests
 
 # Configuration
 BASE_URL = "http://localhost:8080"
 API_URL = f"{BASE_URL}/v1"
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
 
 @pytest.fixture(scope="session")
 def api_url():
     """Return the API URL."""
     return API_URL
+
+
+@contextlib.contextmanager
+def local_server(db_path, **env):
+    """
+    Run a server of the sources next to the tests on a free port, on the SQLite database db_path,
+    for tests that need their own configuration. Yields its base URL. Skips without the server dependencies.
+    """
+    pytest.importorskip("uvicorn")
+    pytest.importorskip("aiosqlite")
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    env = {
+        **os.environ,
+        "USE_POSTGRESQL": "false",
+        "SQLITE_PATH": str(db_path),
+        "MIGRATE_ON_STARTUP": "true",
+        "WEB_CONCURRENCY": "1",
+        **env,
+    }
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port)],
+        cwd=SRC_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    url = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.time() + 30
+        while True:
+            try:
+                if requests.get(f"{url}/health").status_code == 200:
+                    break
+            except requests.ConnectionError:
+                pass
+            if server.poll() is not None or time.time() > deadline:
+                pytest.fail("The local test server did not start")
+            time.sleep(0.2)
+        yield url
+    finally:
+        server.terminate()
+        server.wait()
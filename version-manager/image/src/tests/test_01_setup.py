@@ -18,6 +18,46 @@ class TestSetup:
         assert response.status_code == 200
         assert response.json()["status"] == "healthy"
 
+    def test_readiness_check(self, api_url):
+        """Test that API is ready and reports database latency and pool usage."""
+        response = requests.get(f"{api_url.replace('/v1', '')}/ready")
+        assert response.status_code == 200
+        data = response.json()
+        assert data["status"] == "ready"
+        assert data["failures"] == []
+        assert data["database"]["latency_ms"] is not None
+        assert "class" in data["pool"]
+        assert data["loop_lag_ms"] >= 0
+
+    def test_admission_stats(self, api_url):
+        """Test that the read and write admission queues are reported."""
+        response = requests.get(f"{api_url.replace('/v1', '')}/stats")
+        assert response.status_code == 200
+        admission = response.json()["admission"]
+        assert set(admission) == {"read", "write"}
+        for budget in admission.values():
+            assert budget["limit"] > 0
+            assert budget["waiting"] >= 0
+            assert budget["admitted"] >= 0
+
+    def test_group_commit_stats(self, api_url):
+        """Test that group commit is reported, whether it is enabled or not."""
+        response = requests.get(f"{api_url.replace('/v1', '')}/stats")
+        assert response.status_code == 200
+        group_commit = response.json()["group_commit"]
+        assert isinstance(group_commit["enabled"], bool)
+        assert group_commit["max_items"] > 0
+        assert group_commit["items"] >= group_commit["groups"] >= 0
+
+    def test_statement_stats(self, api_url):
+        """Test that the compiled statement cache usage is reported."""
+        response = requests.get(f"{api_url.replace('/v1', '')}/stats")
+        assert response.status_code == 200
+        statements = response.json()["statements"]
+        assert statements["compiled_cache_hits"] >= 0
+        assert statements["compiled_cache_misses"] >= 0
+        assert statements["distinct_statements"] > 0
+
     def test_create_domains(self, api_url):
         """Create all test domain versions."""
         # Create all domain versions
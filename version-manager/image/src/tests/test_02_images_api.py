@@ -8,6 +8,7 @@ Expected state from test_01_setup.py:
 
 import pytest
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from test_data import (
     WEBAPP_2025_01_01,
     WEBAPP_2025_01_02,
@@ -130,6 +131,24 @@ class TestImagesListAPI:
         assert len(data) == 2  # worker has 2 versions
         assert all(img["name"] == "worker" for img in data)
 
+    def test_get_image_versions_range(self, api_url):
+        """GET /images/{image_name}/list - since/until range and latest N."""
+        response = requests.get(
+            f"{api_url}/images/frontend/list",
+            params={"since": "2025-01-02-00-00-00", "until": "2025-01-03-09-33-12"},
+        )
+        assert response.status_code == 200
+        assert [img["version"] for img in response.json()] == ["2025-01-02-11-22-45", "2025-01-03-09-33-12"]
+
+        response = requests.get(f"{api_url}/images/frontend/list", params={"latest": 2})
+        assert response.status_code == 200
+        assert [img["version"] for img in response.json()] == ["2025-01-03-09-33-12", "2025-01-02-11-22-45"]
+
+        response = requests.get(f"{api_url}/images/frontend/list", params={"since": "2026-01-01-00-00-00"})
+        assert response.status_code == 404
+        response = requests.get(f"{api_url}/images/frontend/list", params={"since": "yesterday"})
+        assert response.status_code == 422
+
     def test_get_image_versions_not_found(self, api_url):
         """GET /images/{image_name}/list - image not found."""
         response = requests.get(f"{api_url}/images/nonexistent/list")
@@ -154,6 +173,170 @@ class TestImagesListAPI:
         assert len(data) == 2
         assert all(img["tested"] is True for img in data)
 
+class TestImagesLookupAPI:
+    """Test batch image version lookup."""
+
+    def test_lookup_image_versions(self, api_url):
+        """POST /images/versions/lookup - found and missing keys."""
+        response = requests.post(
+            f"{api_url}/images/versions/lookup",
+            json=[
+                {"name": "frontend", "version": "2025-01-01-10-15-30"},
+                {"name": "worker", "version": "2025-01-02-17-38-21"},
+                {"name": "frontend", "version": "1999-01-01-00-00-00"},
+            ],
+        )
+        assert response.status_code == 200
+        data = response.json()
+        assert data["results"]["frontend:2025-01-01-10-15-30"]["domain"] == "webapp"
+        assert data["results"]["worker:2025-01-02-17-38-21"]["domain"] == "services"
+        assert data["results"]["frontend:1999-01-01-00-00-00"] is None
+        assert data["missing"] == ["frontend:1999-01-01-00-00-00"]
+
+    def test_lookup_image_versions_empty(self, api_url):
+        """POST /images/versions/lookup - empty payload."""
+        response = requests.post(f"{api_url}/images/versions/lookup", json=[])
+        assert response.status_code == 200
+        assert response.json() == {"results": {}, "missing": []}
+
+class TestImagesIdempotency:
+    """Test safe retries of image registration."""
+
+    def test_create_image_version_retry(self, api_url):
+        """POST /images/{image_name}/create - duplicate version returns the original entry."""
+        response = requests.post(f"{api_url}/images/create", json={"name": "retry-image", "domain": "retry"})
+        assert response.status_code == 201
+        response = requests.post(f"{api_url}/images/create", json={"name": "retry-image", "domain": "retry"})
+        assert response.status_code == 201
+        assert response.json()["domain"] == "retry"
+
+        for _ in range(2):
+            response = requests.post(
+                f"{api_url}/images/retry-image/create",
+                json={"version": "2025-01-01-09-33-12"},
+            )
+            assert response.status_code == 201
+            assert response.json()["version"] == "2025-01-01-09-33-12"
+
+        response = requests.get(f"{api_url}/images/retry-image/list")
+        assert len(response.json()) == 1
+
+    def test_idempotency_key_replay(self, api_url):
+        """POST /images/{image_name}/create - retry with Idempotency-Key replays the stored response."""
+        headers = {"Idempotency-Key": "test-02-retry-image-2025-01-02"}
+        first = requests.post(
+            f"{api_url}/images/retry-image/create",
+            json={"version": "2025-01-02-09-33-12"},
+            headers=headers,
+        )
+        assert first.status_code == 201
+        assert "Idempotency-Replayed" not in first.headers
+
+        second = requests.post(
+            f"{api_url}/images/retry-image/create",
+            json={"version": "2025-01-02-09-33-12"},
+            headers=headers,
+        )
+        assert second.status_code == 201
+        assert second.headers["Idempotency-Replayed"] == "true"
+        assert second.json() == first.json()
+        assert second.headers["Content-Type"] == first.headers["Content-Type"]
+        assert second.headers["Content-Length"] == first.headers["Content-Length"]
+
+        # The same key can't be reused for a different request
+        response = requests.put(
+            f"{api_url}/images/retry-image/tested",
+            json={"version": "2025-01-02-09-33-12", "tested": True},
+            headers=headers,
+        )
+        assert response.status_code == 422
+
+        # Nor for the same route with a different body
+        response = requests.post(
+            f"{api_url}/images/retry-image/create",
+            json={"version": "2025-01-03-09-33-12"},
+            headers=headers,
+        )
+        assert response.status_code == 422
+        assert "different request body" in response.json()["detail"]
+
+        response = requests.delete(f"{api_url}/images/retry-image")
+        assert response.status_code == 200
+        assert response.json()["versions_removed"] == 2
+
+    def test_idempotency_key_concurrent_retries(self, api_url):
+        """POST /images/{image_name}/create - concurrent retries with the same key are applied once."""
+        requests.post(f"{api_url}/images/create", json={"name": "retry-concurrent", "domain": "retry"})
+        headers = {"Idempotency-Key": "test-02-retry-concurrent"}
+
+        def _create(_):
+            return requests.post(
+                f"{api_url}/images/retry-concurrent/create",
+                json={"version": "2025-01-04-09-33-12"},
+                headers=headers,
+            )
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            responses = list(pool.map(_create, range(8)))
+        # One request runs, the others are rejected while it is in flight or replay its response
+        applied = [r for r in responses if r.status_code == 201 and "Idempotency-Replayed" not in r.headers]
+        assert len(applied) == 1
+        assert all(r.status_code in (201, 409) for r in responses)
+        assert all(r.headers["Retry-After"] for r in responses if r.status_code == 409)
+
+        response = requests.delete(f"{api_url}/images/retry-concurrent")
+        assert response.status_code == 200
+
+    def test_idempotency_key_stored_statuses(self, api_url):
+        """Deterministic client errors are replayed, errors that a retry may not get again are not stored."""
+        headers = {"Idempotency-Key": "test-02-retry-missing-image"}
+        for replayed in (False, True):
+            response = requests.post(
+                f"{api_url}/images/missing-image/create", json={"version": "2025-01-05-09-33-12"}, headers=headers
+            )
+            assert response.status_code == 404
+            assert ("Idempotency-Replayed" in response.headers) is replayed
+
+        headers = {"Idempotency-Key": "test-02-retry-login"}
+        base_url = api_url.removesuffix("/v1")
+        for _ in range(2):
+            response = requests.post(
+                f"{base_url}/auth/login", json={"username": "nobody", "password": "wrong"}, headers=headers
+            )
+            assert response.status_code == 401
+            assert "Idempotency-Replayed" not in response.headers
+
+
+class TestImagesConcurrentRegistration:
+    """Test concurrent image registrations updating the same domain."""
+
+    def test_parallel_image_versions_update_domain(self, api_url):
+        """POST /images/{image_name}/create - parallel registrations don't lose domain updates."""
+        names = [f"parallel-img-{i}" for i in range(8)]
+        for name in names:
+            requests.post(f"{api_url}/images/create", json={"name": name, "domain": "parallel-domain"})
+        response = requests.post(
+            f"{api_url}/domains/parallel-domain/create",
+            json={"version": "2025-01-01-00-00-00"},
+        )
+        assert response.status_code == 201
+
+        def _register(name):
+            return requests.post(f"{api_url}/images/{name}/create", json={"version": "2025-01-01-10-15-30"})
+
+        with ThreadPoolExecutor(max_workers=len(names)) as pool:
+            responses = list(pool.map(_register, names))
+        assert all(r.status_code == 201 for r in responses), [r.text for r in responses if r.status_code != 201]
+
+        response = requests.get(f"{api_url}/domains/parallel-domain/active", params={"env": "dev"})
+        assert response.status_code == 200
+        assert sorted(img["name"] for img in response.json()[0]["images"]) == names
+
+        for name in names:
+            assert requests.delete(f"{api_url}/images/{name}").status_code == 200
+        assert requests.delete(f"{api_url}/domains/parallel-domain").status_code == 200
+
+
 class TestImagesUpdateAPI:
     """Test Images update endpoints."""
 
@@ -6,11 +6,51 @@ Expected state from test_01_setup.py:
 - services domain: 2025-01-01-17-55-48, 2025-01-02-21-03-27
 """
 
+import io
+import json
+import tarfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 import pytest
 import requests
 from test_data import ACTIVE_VERSIONS, TEST_DOMAINS
 
 
+def wait_for_manifest(api_url, env, predicate, timeout=5):
+    """Poll a JSON manifest until predicate holds: other workers refresh their cached manifests shortly after a change."""
+    deadline = time.time() + timeout
+    while True:
+        response = requests.get(f"{api_url}/manifests/{env}", params={"format": "json"})
+        if (response.status_code == 200 and predicate(response.json())) or time.time() > deadline:
+            return response
+        time.sleep(0.1)
+
+
+def wait_for_job(api_url, job_id, timeout=10):
+    """Poll a background job until it finishes."""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        response = requests.get(f"{api_url}/jobs/{job_id}")
+        assert response.status_code == 200
+        job = response.json()
+        if job["status"] in ("succeeded", "failed"):
+            return job
+        time.sleep(0.1)
+    pytest.fail(f"Job {job_id} did not finish in {timeout}s")
+
+
+def wait_for_audit(api_url, timeout=5, **params):
+    """Poll the audit log until an event matches: events are written in batches shortly after the change."""
+    deadline = time.time() + timeout
+    while True:
+        response = requests.get(f"{api_url}/audit", params=params)
+        assert response.status_code == 200
+        if response.json()["items"] or time.time() > deadline:
+            return response.json()
+        time.sleep(0.1)
+
+
 class TestDomainsSetTested:
     """Test setting domains as tested."""
 
@@ -70,6 +110,306 @@ class TestDomainsSetActive:
             assert active_domain["version"] == domain["version"]
 
 
+class TestDomainsCurrentState:
+    """Test the materialized current deployment state."""
+
+    def test_get_current_state(self, api_url):
+        """GET /domains/{domain_name}/current - matches the active domain version."""
+        response = requests.get(f"{api_url}/domains/webapp/active", params={"env": "dev"})
+        assert response.status_code == 200
+        active = response.json()[0]
+
+        response = requests.get(f"{api_url}/domains/webapp/current", params={"env": "dev"})
+        assert response.status_code == 200
+        data = response.json()
+        assert data["domain"] == "webapp"
+        assert data["env"] == "dev"
+        assert data["version"] == active["version"]
+        assert sorted(data["images"]) == sorted(f"{img['name']}:{img['version']}" for img in active["images"])
+
+    def test_create_domain_retry(self, api_url):
+        """POST /domains/{domain_name}/create - duplicate version returns it unchanged."""
+        response = requests.post(
+            f"{api_url}/domains/webapp/create",
+            json={"version": "2025-01-01-18-30-00"},
+        )
+        assert response.status_code == 201
+        data = response.json()
+        assert data["version"] == "2025-01-01-18-30-00"
+        # The retry must not take the active state away from the current version
+        assert data["active"] is False
+        response = requests.get(f"{api_url}/domains/webapp/current", params={"env": "dev"})
+        assert response.json()["version"] == "2025-01-02-19-45-15"
+
+    def test_get_current_state_not_found(self, api_url):
+        """GET /domains/{domain_name}/current - no active version in environment."""
+        response = requests.get(f"{api_url}/domains/nonexistent/current", params={"env": "prod"})
+        assert response.status_code == 404
+
+
+class TestDomainsConcurrentWriters:
+    """Test concurrent writers changing different versions of the same domain."""
+
+    DOMAIN = "concurrent-domain"
+    VERSIONS = [f"2025-02-01-10-00-{second:02d}" for second in range(8)]
+
+    def test_concurrent_state_rebuilds(self, api_url):
+        """PUT /domains/tested and /domains/active - concurrent rebuilds of the same domain state don't conflict."""
+        for version in self.VERSIONS:
+            response = requests.post(f"{api_url}/domains/{self.DOMAIN}/create", json={"version": version})
+            assert response.status_code == 201
+
+        def _write(version):
+            tested = requests.put(
+                f"{api_url}/domains/tested", json=[{"name": self.DOMAIN, "version": version, "tested": True}]
+            )
+            active = requests.put(f"{api_url}/domains/active", json=[{"name": self.DOMAIN, "version": version}])
+            return tested, active
+
+        with ThreadPoolExecutor(max_workers=len(self.VERSIONS)) as pool:
+            responses = [r for pair in pool.map(_write, self.VERSIONS) for r in pair]
+        assert all(r.status_code == 200 for r in responses), [r.text for r in responses if r.status_code != 200]
+
+        response = requests.get(f"{api_url}/domains/{self.DOMAIN}/active", params={"env": "dev"})
+        assert response.status_code == 200
+        [active] = response.json()
+        response = requests.get(f"{api_url}/domains/{self.DOMAIN}/current", params={"env": "dev"})
+        assert response.status_code == 200
+        assert response.json()["version"] == active["version"]
+        assert response.json()["tested"] is True
+
+        # One open activation interval: the domain is active once at a future time
+        at = (datetime.now(timezone.utc) + timedelta(minutes=1)).isoformat()
+        response = requests.get(f"{api_url}/domains/active", params={"env": "dev", "at": at})
+        assert response.status_code == 200
+        assert [d["version"] for d in response.json() if d["name"] == self.DOMAIN] == [active["version"]]
+
+        assert requests.delete(f"{api_url}/domains/{self.DOMAIN}").status_code == 200
+
+    def test_batch_update_applied_once(self, api_url):
+        """PUT /domains/update racing POST /images/{image_name}/create - a retried batch is applied once."""
+        domain = "concurrent-batch"
+        names = [f"batch-img-{i}" for i in range(4)]
+        versions = [f"2025-02-03-10-00-0{i}" for i in range(4)]
+        for name in names:
+            requests.post(f"{api_url}/images/create", json={"name": name, "domain": domain})
+            requests.post(f"{api_url}/images/{name}/create", json={"version": "2025-02-03-09-00-00"})
+        for version in versions:
+            assert requests.post(f"{api_url}/domains/{domain}/create", json={"version": version}).status_code == 201
+
+        # The active version is the last of the batch, and registrations change it while the batch runs
+        batch = [
+            {"name": domain, "version": version, "images": [{"name": name, "version": "2025-02-03-09-00-00"}]}
+            for version, name in zip(versions, names)
+        ]
+        rounds = 3
+        with ThreadPoolExecutor(max_workers=len(names) + 1) as pool:
+            for i in range(rounds):
+                update = pool.submit(requests.put, f"{api_url}/domains/update", json=batch)
+                registrations = [
+                    pool.submit(requests.post, f"{api_url}/images/{name}/create", json={"version": f"2025-02-03-11-00-0{i}"})
+                    for name in names
+                ]
+                assert update.result().status_code == 200, update.result().text
+                assert all(future.result().status_code == 201 for future in registrations)
+
+        params = {"entity_type": "domain", "entity": domain, "action": "update_images", "limit": 100}
+        deadline = time.time() + 5
+        while len(wait_for_audit(api_url, **params)["items"]) < rounds * len(versions) and time.time() < deadline:
+            time.sleep(0.1)
+        # Let a late duplicate reach the audit log
+        time.sleep(1)
+        events = wait_for_audit(api_url, **params)["items"]
+        assert sorted(event["version"] for event in events) == sorted(versions * rounds)
+
+        for name in names:
+            assert requests.delete(f"{api_url}/images/{name}").status_code == 200
+        assert requests.delete(f"{api_url}/domains/{domain}").status_code == 200
+
+    def test_bulk_and_orm_writers(self, api_url):
+        """POST /images/{image_name}/create racing POST /domains/{domain_name}/create and PUT /domains/tested."""
+        domain = "concurrent-mixed"
+        names = [f"mixed-img-{i}" for i in range(6)]
+        for name in names:
+            requests.post(f"{api_url}/images/create", json={"name": name, "domain": domain})
+        old, new = "2025-02-02-10-00-00", "2025-02-02-11-00-00"
+        assert requests.post(f"{api_url}/domains/{domain}/create", json={"version": old}).status_code == 201
+
+        with ThreadPoolExecutor(max_workers=len(names) + 2) as pool:
+            # Registrations pin their image in the active version, an ORM write checked on row_version.
+            # Creating a version deactivates the old one and setting it tested are bulk writes.
+            registrations = [
+                pool.submit(requests.post, f"{api_url}/images/{name}/create", json={"version": "2025-02-02-10-30-00"})
+                for name in names
+            ]
+            created = pool.submit(requests.post, f"{api_url}/domains/{domain}/create", json={"version": new})
+            tested = pool.submit(
+                requests.put, f"{api_url}/domains/tested", json=[{"name": domain, "version": old, "tested": True}]
+            )
+            responses = [future.result() for future in registrations]
+        assert all(r.status_code == 201 for r in responses), [r.text for r in responses if r.status_code != 201]
+        assert created.result().status_code == 201
+        assert tested.result().status_code == 200
+
+        # No registration pinned its image in the version that was deactivated under it
+        response = requests.get(f"{api_url}/domains/{domain}/active", params={"env": "dev"})
+        [active] = response.json()
+        assert active["version"] == new
+        assert sorted(img["name"] for img in active["images"]) == names
+        response = requests.get(f"{api_url}/domains/{domain}", params={"since": old, "until": old})
+        assert response.json()[0]["tested"] is True
+
+        for name in names:
+            assert requests.delete(f"{api_url}/images/{name}").status_code == 200
+        assert requests.delete(f"{api_url}/domains/{domain}").status_code == 200
+
+
+class TestDomainsActiveAt:
+    """Test point-in-time queries of the active domain versions."""
+
+    def test_active_at_future_matches_current(self, api_url):
+        """GET /domains/active?at= - a future time returns the current active versions."""
+        at = (datetime.now(timezone.utc) + timedelta(minutes=1)).isoformat()
+        response = requests.get(f"{api_url}/domains/active", params={"env": "dev", "at": at})
+        assert response.status_code == 200
+        current = requests.get(f"{api_url}/domains/active", params={"env": "dev"}).json()
+        assert {(d["name"], d["version"]) for d in response.json()} == {(d["name"], d["version"]) for d in current}
+
+    def test_active_at_before_history(self, api_url):
+        """GET /domains/active?at= - nothing was active before the first activation."""
+        response = requests.get(f"{api_url}/domains/active", params={"env": "dev", "at": "2000-01-01T00:00:00Z"})
+        assert response.status_code == 200
+        assert response.json() == []
+
+    def test_active_at_previous_version(self, api_url):
+        """GET /domains/active?at= - a replaced version is returned for a time before the change."""
+        name = "history-test"
+        requests.post(f"{api_url}/domains/{name}/create", json={"version": "2025-02-01-00-00-00"})
+        time.sleep(0.05)
+        before = datetime.now(timezone.utc).isoformat()
+        time.sleep(0.05)
+        requests.post(f"{api_url}/domains/{name}/create", json={"version": "2025-02-02-00-00-00"})
+        try:
+            response = requests.get(f"{api_url}/domains/active", params={"env": "dev", "at": before})
+            assert response.status_code == 200
+            versions = [d["version"] for d in response.json() if d["name"] == name]
+            assert versions == ["2025-02-01-00-00-00"]
+            now = (datetime.now(timezone.utc) + timedelta(seconds=1)).isoformat()
+            response = requests.get(f"{api_url}/domains/active", params={"env": "dev", "at": now})
+            versions = [d["version"] for d in response.json() if d["name"] == name]
+            assert versions == ["2025-02-02-00-00-00"]
+        finally:
+            requests.delete(f"{api_url}/domains/{name}")
+
+
+class TestDomainsLookupAPI:
+    """Test batch active domain lookup."""
+
+    def test_lookup_active_domains(self, api_url):
+        """POST /domains/active/lookup - found and missing keys."""
+        response = requests.post(
+            f"{api_url}/domains/active/lookup",
+            json=[
+                {"name": "webapp", "env": "dev"},
+                {"name": "services"},
+                {"name": "webapp", "env": "prod"},
+            ],
+        )
+        assert response.status_code == 200
+        data = response.json()
+        assert data["results"]["webapp:dev"]["version"] == "2025-01-02-19-45-15"
+        assert data["results"]["services:dev"]["version"] == "2025-01-01-17-55-48"
+        assert data["results"]["webapp:prod"] is None
+        assert data["missing"] == ["webapp:prod"]
+
+
+class TestSearchAPI:
+    """Test ranked search over image and domain names."""
+
+    def test_search_ranking(self, api_url):
+        """GET /search - prefix matches before substring matches."""
+        response = requests.get(f"{api_url}/search", params={"q": "Service"})
+        assert response.status_code == 200
+        data = response.json()
+        assert data["total"] == 2
+        assert data["items"] == [
+            {"type": "domain", "name": "services", "match": "prefix"},
+            {"type": "image", "name": "api-service", "match": "substring"},
+        ]
+
+    def test_search_type_and_pagination(self, api_url):
+        """GET /search - type filter, exact match and paging."""
+        response = requests.get(f"{api_url}/search", params={"q": "end", "type": "image"})
+        assert response.status_code == 200
+        assert [item["name"] for item in response.json()["items"]] == ["backend", "frontend"]
+
+        response = requests.get(f"{api_url}/search", params={"q": "webapp", "type": "domain"})
+        assert response.json()["items"] == [{"type": "domain", "name": "webapp", "match": "exact"}]
+
+        response = requests.get(f"{api_url}/search", params={"q": "e", "limit": 2, "offset": 1})
+        data = response.json()
+        assert data["total"] == 6
+        assert len(data["items"]) == 2
+
+    def test_search_invalid(self, api_url):
+        """GET /search - empty query and unknown type are rejected."""
+        assert requests.get(f"{api_url}/search", params={"q": ""}).status_code == 422
+        assert requests.get(f"{api_url}/search", params={"q": "a", "type": "job"}).status_code == 422
+
+
+class TestSnapshotAPI:
+    """Test catalog snapshot download."""
+
+    def test_download_snapshot(self, api_url):
+        """GET /snapshot - compressed archive with the row counts of every table."""
+        response = requests.get(f"{api_url}/snapshot")
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/gzip"
+        with tarfile.open(fileobj=io.BytesIO(response.content), mode="r:gz") as tar:
+            info = json.load(tar.extractfile("snapshot.json"))
+        assert info["dialect"] in ("sqlite", "postgresql")
+        assert info["tables"]["images"] == len(requests.get(f"{api_url}/images/list/versions").json())
+        assert info["tables"]["domains"] == len(requests.get(f"{api_url}/domains/list").json())
+
+
+class TestAuditAPI:
+    """Test the audit log of mutations."""
+
+    def test_mutation_is_audited(self, api_url):
+        """PUT /domains/tested with X-Actor is recorded with the actor."""
+        response = requests.put(
+            f"{api_url}/domains/tested",
+            json={"name": "webapp", "version": "2025-01-01-18-30-00", "tested": True},
+            headers={"X-Actor": "audit-test"},
+        )
+        assert response.status_code == 200
+        data = wait_for_audit(api_url, actor="audit-test", entity="webapp")
+        assert len(data["items"]) == 1
+        event = data["items"][0]
+        assert event["action"] == "set_tested"
+        assert event["entity_type"] == "domain"
+        assert event["version"] == "2025-01-01-18-30-00"
+        assert event["details"] == {"tested": True}
+
+    def test_audit_pagination(self, api_url):
+        """GET /audit pages through events newest first with a cursor."""
+        first = requests.get(f"{api_url}/audit", params={"entity_type": "image", "limit": 2}).json()
+        assert len(first["items"]) == 2
+        assert first["next_cursor"] == first["items"][-1]["id"]
+        second = requests.get(
+            f"{api_url}/audit", params={"entity_type": "image", "limit": 2, "cursor": first["next_cursor"]}
+        ).json()
+        ids = [event["id"] for event in first["items"] + second["items"]]
+        assert ids == sorted(ids, reverse=True)
+        assert len(set(ids)) == len(ids)
+
+    def test_audit_time_range(self, api_url):
+        """GET /audit with a time range in the future returns no events."""
+        response = requests.get(f"{api_url}/audit", params={"since": "2999-01-01T00:00:00Z"})
+        assert response.status_code == 200
+        assert response.json() == {"items": [], "next_cursor": None}
+
+
 class TestDomainsListAPI:
     """Test Domains list endpoints."""
 
@@ -100,6 +440,46 @@ class TestDomainsListAPI:
             assert d["name"] == "webapp"
             assert isinstance(d["images"], list)
 
+    def test_concurrent_identical_requests(self, api_url):
+        """Concurrent identical GET /domains/active requests all get the same response, most of them coalesced."""
+        stats_url = f"{api_url.removesuffix('/v1')}/stats"
+        before = requests.get(stats_url).json()
+        with ThreadPoolExecutor(max_workers=20) as pool:
+            responses = list(pool.map(
+                lambda _: requests.get(f"{api_url}/domains/active", params={"env": "prod"}), range(200)
+            ))
+        assert {r.status_code for r in responses} == {200}
+        assert len({r.content for r in responses}) == 1
+        if before["workers"] > 1:
+            pytest.skip("the counters are per worker process, and requests are spread over the workers")
+        after = requests.get(stats_url).json()
+        executed = after["coalescing"]["executed"] - before["coalescing"]["executed"]
+        coalesced = after["coalescing"]["coalesced"] - before["coalescing"]["coalesced"]
+        assert coalesced > 0
+        # The /stats request itself is not coalesced
+        assert executed + coalesced == len(responses)
+
+    def test_errors_not_coalesced(self, api_url):
+        """Concurrent identical GET requests that fail run one by one instead of sharing the error."""
+        stats_url = f"{api_url.removesuffix('/v1')}/stats"
+        before = requests.get(stats_url).json()
+        with ThreadPoolExecutor(max_workers=20) as pool:
+            responses = list(pool.map(
+                lambda _: requests.get(f"{api_url}/domains/nonexistent/current", params={"env": "prod"}), range(100)
+            ))
+        assert {r.status_code for r in responses} == {404}
+        if before["workers"] > 1:
+            pytest.skip("the counters are per worker process, and requests are spread over the workers")
+        after = requests.get(stats_url).json()
+        assert after["coalescing"]["coalesced"] == before["coalescing"]["coalesced"]
+        assert after["coalescing"]["executed"] - before["coalescing"]["executed"] == len(responses)
+
+    def test_get_domain_latest(self, api_url):
+        """GET /domains/{domain_name}?latest=1 - newest webapp version."""
+        response = requests.get(f"{api_url}/domains/webapp", params={"latest": 1})
+        assert response.status_code == 200
+        assert [d["version"] for d in response.json()] == ["2025-01-03-20-12-33"]
+
     def test_get_domain_by_name_services(self, api_url):
         """GET /domains/{domain_name} - get services domain versions."""
         response = requests.get(f"{api_url}/domains/services")
@@ -168,6 +548,22 @@ class TestDomainsListAPI:
         # Version may vary, just verify it's a valid version
         assert "version" in data[0]
 
+    def test_get_image_version_domains(self, api_url):
+        """GET /images/{image_name}/{version}/domains - same domain versions as scanning /domains/list."""
+        domains = requests.get(f"{api_url}/domains/list").json()
+        for name, version in (("frontend", "2025-01-02-11-22-45"), ("worker", "2025-01-01-15-25-06")):
+            expected = {
+                (d["name"], d["version"], d["deployed"], d["active"])
+                for d in domains
+                if any(img["name"] == name and img["version"] == version for img in d["images"])
+            }
+            response = requests.get(f"{api_url}/images/{name}/{version}/domains")
+            assert response.status_code == 200
+            assert {(d["name"], d["version"], d["deployed"], d["active"]) for d in response.json()} == expected
+
+        response = requests.get(f"{api_url}/images/frontend/1999-01-01-00-00-00/domains")
+        assert response.status_code == 404
+
 
 class TestDomainsUpdateAPI:
     """Test Domains update endpoints."""
@@ -278,6 +674,82 @@ class TestDomainsUpdateAPI:
             # The promoted version becomes active in target environment
             # Implementation may deactivate all other versions or only target environment versions
 
+    def test_current_state_after_promote(self, api_url):
+        """GET /domains/{domain_name}/current - promoted version is current in staging."""
+        response = requests.get(f"{api_url}/domains/webapp/current", params={"env": "staging"})
+        assert response.status_code == 200
+        data = response.json()
+        assert data["version"] == "2025-01-01-18-30-00"
+        assert "frontend:2025-01-02-11-22-45" in data["images"]
+
+    def test_manifest_after_promote(self, api_url):
+        """GET /manifests/{env} - cached manifest with ETag, refreshed on change."""
+        # With several workers, let every worker refresh its cached manifests after the promotion
+        time.sleep(0.5)
+        response = wait_for_manifest(api_url, "staging", lambda m: "webapp" in m["domains"])
+        assert response.status_code == 200
+        webapp = response.json()["domains"]["webapp"]
+        assert webapp["version"] == "2025-01-01-18-30-00"
+        assert webapp["images"]["frontend"] == "2025-01-02-11-22-45"
+        etag = response.headers["ETag"]
+
+        # Content-hash ETags are the same in every worker once they have refreshed
+        deadline = time.time() + 5
+        while True:
+            response = requests.get(f"{api_url}/manifests/staging", params={"format": "json"}, headers={"If-None-Match": etag})
+            if response.status_code == 304 or time.time() > deadline:
+                break
+            time.sleep(0.1)
+        assert response.status_code == 304
+
+        response = requests.get(f"{api_url}/manifests/staging", params={"domain": "webapp"})
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/yaml")
+        assert '"frontend": "2025-01-02-11-22-45"' in response.text
+        assert requests.get(f"{api_url}/manifests/staging", params={"domain": "services"}).status_code == 404
+
+        # Changing the domain renders a new manifest
+        requests.put(f"{api_url}/domains/tested", json={"name": "webapp", "version": "2025-01-01-18-30-00", "tested": True})
+        response = wait_for_manifest(api_url, "staging", lambda m: m["domains"].get("webapp", {}).get("tested"))
+        assert response.status_code == 200
+        assert response.headers["ETag"] != etag
+        assert response.json()["domains"]["webapp"]["tested"] is True
+
+    def test_diff_environments(self, api_url):
+        """GET /domains/diff - active domains differ between staging and dev."""
+        response = requests.get(f"{api_url}/domains/diff", params={"from_env": "staging", "to_env": "dev"})
+        assert response.status_code == 200
+        diffs = {d["name"]: d for d in response.json()["domains"]}
+        # services is only active in dev
+        assert diffs["services"]["from_version"] is None
+        assert diffs["services"]["to_version"] == "2025-01-01-17-55-48"
+        assert diffs["webapp"]["from_version"] == "2025-01-01-18-30-00"
+        assert diffs["webapp"]["to_version"] == "2025-01-02-19-45-15"
+        assert [img["name"] for img in diffs["webapp"]["removed"]] == ["backend", "frontend"]
+
+        response = requests.get(f"{api_url}/domains/diff", params={"from_env": "staging", "to_env": "staging"})
+        assert response.json()["domains"] == []
+
+    def test_diff_domain_versions(self, api_url):
+        """GET /domains/{domain_name}/diff - compare two versions of a domain."""
+        response = requests.get(
+            f"{api_url}/domains/webapp/diff", params={"from": "2025-01-01-18-30-00", "to": "2025-01-03-20-12-33"}
+        )
+        assert response.status_code == 200
+        data = response.json()
+        assert data["added"] == [] and data["removed"] == []
+        assert data["changed"] == [
+            {"name": "backend", "from_version": "2025-01-02-14-08-55", "to_version": "2025-01-03-16-52-27",
+             "from_tested": True, "to_tested": True},
+            {"name": "frontend", "from_version": "2025-01-02-11-22-45", "to_version": "2025-01-03-09-33-12",
+             "from_tested": True, "to_tested": True},
+        ]
+
+        response = requests.get(
+            f"{api_url}/domains/webapp/diff", params={"from": "2025-01-01-18-30-00", "to": "2099-01-01-00-00-00"}
+        )
+        assert response.status_code == 404
+
     def test_set_promoted_domain_tested(self, api_url):
         """PUT /domains/tested - set promoted domain as tested again."""
         response = requests.put(
@@ -334,6 +806,62 @@ class TestDomainsUpdateAPI:
         assert response.status_code in [200, 404, 400]
 
 
+class TestBackgroundJobs:
+    """Test cascading operations running as background jobs."""
+
+    def test_async_cascade_operations(self, api_url):
+        """PUT rename / DELETE with ?async=true - 202 Accepted and job progress."""
+        requests.post(f"{api_url}/images/create", json={"name": "job-img", "domain": "job-domain"})
+        requests.post(f"{api_url}/images/job-img/create", json={"version": "2025-01-01-10-15-30"})
+        requests.put(f"{api_url}/images/job-img/tested", json={"version": "2025-01-01-10-15-30", "tested": True})
+        response = requests.post(f"{api_url}/domains/job-domain/create", json={"version": "2025-01-01-18-30-00"})
+        assert response.status_code == 201
+
+        # Rename image
+        response = requests.put(f"{api_url}/images/job-img/rename", params={"async": "true"}, json={"name": "job-img-2"})
+        assert response.status_code == 202
+        assert response.headers["Location"] == f"/v1/jobs/{response.json()['id']}"
+        job = wait_for_job(api_url, response.json()["id"])
+        assert job["status"] == "succeeded", job
+        assert job["operation"] == "rename_image"
+        assert job["processed"] == job["total"]
+        assert [img["name"] for img in job["result"]] == ["job-img-2"]
+        response = requests.get(f"{api_url}/domains/job-domain/active")
+        assert response.json()[0]["images"] == [{"name": "job-img-2", "version": "2025-01-01-10-15-30", "tested": True}]
+
+        # Rename domain
+        response = requests.put(f"{api_url}/domains/job-domain/rename", params={"async": "true"}, json={"name": "job-domain-2"})
+        assert response.status_code == 202
+        job = wait_for_job(api_url, response.json()["id"])
+        assert job["status"] == "succeeded", job
+        assert all(d["name"] == "job-domain-2" for d in job["result"])
+        response = requests.get(f"{api_url}/images/job-img-2/list")
+        assert all(img["domain"] == "job-domain-2" for img in response.json())
+
+        # Delete image
+        response = requests.delete(f"{api_url}/images/job-img-2", params={"async": "true"})
+        assert response.status_code == 202
+        job = wait_for_job(api_url, response.json()["id"])
+        assert job["status"] == "succeeded", job
+        assert job["result"] == {"deleted": "job-img-2", "versions_removed": 1}
+        response = requests.get(f"{api_url}/domains/job-domain-2/active")
+        assert response.json()[0]["images"] == []
+
+        assert requests.delete(f"{api_url}/domains/job-domain-2").status_code == 200
+
+    def test_async_operation_not_found(self, api_url):
+        """DELETE /images/{image_name}?async=true - job fails for unknown image."""
+        response = requests.delete(f"{api_url}/images/nonexistent", params={"async": "true"})
+        assert response.status_code == 202
+        job = wait_for_job(api_url, response.json()["id"])
+        assert job["status"] == "failed"
+
+    def test_get_job_not_found(self, api_url):
+        """GET /jobs/{job_id} - job not found."""
+        response = requests.get(f"{api_url}/jobs/nonexistent")
+        assert response.status_code == 404
+
+
 class TestDeleteDomainVersion:
     """Test deleting a single domain version."""
 
@@ -0,0 +1,63 @@
+"""
+Test 05: Admission control - requests beyond the read and write budgets get 429 with Retry-After.
+Runs its own server with tiny budgets on a temporary SQLite database, next to the one under test,
+so it needs the server dependencies (requirements.txt of the image) installed locally.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import requests
+from conftest import local_server
+
+
+@pytest.fixture(scope="module")
+def limited_url(tmp_path_factory):
+    """URL of a server admitting one read at a time with no queue, and one write at a time waiting at most 10 ms."""
+    with local_server(
+        tmp_path_factory.mktemp("admission") / "vm.db",
+        ADMISSION_READ_LIMIT="1",
+        ADMISSION_READ_QUEUE="0",
+        ADMISSION_WRITE_LIMIT="1",
+        ADMISSION_WRITE_QUEUE="64",
+        ADMISSION_QUEUE_TIMEOUT="0.01",
+    ) as url:
+        yield url
+
+
+def _assert_rejected(responses):
+    statuses = {r.status_code for r in responses}
+    assert 429 in statuses, statuses
+    for response in responses:
+        if response.status_code == 429:
+            assert int(response.headers["Retry-After"]) >= 1
+            assert "retry later" in response.json()["detail"]
+
+
+class TestAdmission:
+    """Test requests beyond the admission budgets."""
+
+    def test_reads_rejected_when_queue_full(self, limited_url):
+        """GET /v1/... beyond the read limit with no queue is rejected at once."""
+        # Distinct queries: identical concurrent reads would be coalesced and take a single slot
+        with ThreadPoolExecutor(max_workers=20) as pool:
+            responses = list(pool.map(
+                lambda i: requests.get(f"{limited_url}/v1/search", params={"q": f"admission-{i}"}), range(100)
+            ))
+        _assert_rejected(responses)
+        assert {r.status_code for r in responses} <= {200, 429}
+        stats = requests.get(f"{limited_url}/stats").json()["admission"]["read"]
+        assert stats["rejected"] == sum(r.status_code == 429 for r in responses)
+
+    def test_writes_rejected_after_queue_timeout(self, limited_url):
+        """POST /v1/... waiting longer than the queue timeout for the write slot is rejected."""
+        def _create(i):
+            return requests.post(f"{limited_url}/v1/images/create", json={"name": f"admission-{i}", "domain": "admission"})
+
+        with ThreadPoolExecutor(max_workers=20) as pool:
+            responses = list(pool.map(_create, range(60)))
+        _assert_rejected(responses)
+        assert {r.status_code for r in responses} <= {201, 429}
+        stats = requests.get(f"{limited_url}/stats").json()["admission"]["write"]
+        assert stats["timed_out"] == sum(r.status_code == 429 for r in responses)
+        assert stats["rejected"] == 0
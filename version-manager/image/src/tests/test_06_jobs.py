@@ -0,0 +1,72 @@
+"""
+Test 06: Background jobs - a full queue leaves no job behind, and jobs of stopped servers are failed.
+Runs its own servers on a temporary SQLite database, like test_05_admission.py.
+"""
+
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import requests
+from conftest import local_server
+
+
+def _jobs(db_path):
+    with sqlite3.connect(db_path) as conn:
+        return dict(conn.execute("SELECT id, status FROM jobs").fetchall())
+
+
+class TestJobs:
+    """Test the job queue bound and the recovery of interrupted jobs."""
+
+    def test_full_queue_creates_no_job(self, tmp_path):
+        """PUT /images/{image_name}/rename?async=true - rejected submits don't leave pending jobs."""
+        db_path = tmp_path / "vm.db"
+        names = [f"job-img-{i}" for i in range(30)]
+        with local_server(db_path, JOB_WORKERS="1", JOB_QUEUE_SIZE="2") as url:
+            for name in names:
+                requests.post(f"{url}/v1/images/create", json={"name": name, "domain": "jobs"})
+
+            with ThreadPoolExecutor(max_workers=len(names)) as pool:
+                responses = list(pool.map(
+                    lambda name: requests.put(
+                        f"{url}/v1/images/{name}/rename", params={"async": "true"}, json={"name": f"{name}-renamed"}
+                    ),
+                    names,
+                ))
+            assert {r.status_code for r in responses} <= {202, 503}
+            assert any(r.status_code == 503 for r in responses)
+            for response in responses:
+                if response.status_code == 503:
+                    assert response.headers["Retry-After"]
+            accepted = {r.json()["id"] for r in responses if r.status_code == 202}
+            assert set(_jobs(db_path)) == accepted
+
+    def test_stale_jobs_failed_at_startup(self, tmp_path):
+        """Jobs left pending or running by a stopped server are failed when a server starts."""
+        db_path = tmp_path / "vm.db"
+        with local_server(db_path):
+            pass
+
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        old = now - timedelta(hours=1)
+        with sqlite3.connect(db_path) as conn:
+            conn.executemany(
+                "INSERT INTO jobs (id, operation, params, status, processed, created_at, updated_at) "
+                "VALUES (?, 'rename_image', '{}', ?, 0, ?, ?)",
+                [
+                    ("stale-running", "running", old, old),
+                    ("stale-pending", "pending", old, old),
+                    ("live-running", "running", old, now),
+                    ("done", "succeeded", old, old),
+                ],
+            )
+
+        with local_server(db_path) as url:
+            jobs = {job_id: requests.get(f"{url}/v1/jobs/{job_id}").json() for job_id in _jobs(db_path)}
+        assert jobs["stale-running"]["status"] == "failed"
+        assert jobs["stale-pending"]["status"] == "failed"
+        assert "stopped" in jobs["stale-running"]["error"]
+        # Refreshed recently: another server is running it
+        assert jobs["live-running"]["status"] == "running"
+        assert jobs["done"]["status"] == "succeeded"
@@ -41,3 +41,45 @@ const api = {
     }
 };
 
+// Server-side search: debounced, returns {names, total} with the ranked matching names, or null when the filter is empty.
+// Pages are fetched one after the other until all matches are loaded; names holds those loaded so far.
+const SEARCH_DEBOUNCE_MS = 250;
+// Largest page the search API returns
+const SEARCH_PAGE_SIZE = 100;
+
+const useSearch = (filter, type) => {
+    const [matches, setMatches] = React.useState(null);
+
+    React.useEffect(() => {
+        const q = filter.trim();
+        if (!q) {
+            setMatches(null);
+            return;
+        }
+        let cancelled = false;
+        const timer = setTimeout(async () => {
+            const names = [];
+            try {
+                let total = Infinity;
+                while (names.length < total) {
+                    const data = await api.get(
+                        `/search?q=${encodeURIComponent(q)}&type=${type}&limit=${SEARCH_PAGE_SIZE}&offset=${names.length}`
+                    );
+                    if (cancelled) return;
+                    names.push(...data.items.map(item => item.name));
+                    // Matches deleted since the first page would leave the total out of reach
+                    total = data.items.length < SEARCH_PAGE_SIZE ? names.length : data.total;
+                    setMatches({ names: [...names], total });
+                }
+            } catch (err) {
+                console.error('Error searching:', err);
+            }
+        }, SEARCH_DEBOUNCE_MS);
+        return () => {
+            cancelled = true;
+            clearTimeout(timer);
+        };
+    }, [filter, type]);
+
+    return matches;
+};
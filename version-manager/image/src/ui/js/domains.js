@@ -75,9 +75,11 @@ const DomainsList = ({ onSelectDomain, onDataChange }) => {
         }
     };
 
-    const filteredDomains = domains.filter(d => 
-        d.name.toLowerCase().includes(filter.toLowerCase())
-    );
+    const searchMatches = useSearch(filter, 'domain');
+    const domainsByName = React.useMemo(() => new Map(domains.map(d => [d.name, d])), [domains]);
+    const filteredDomains = searchMatches === null
+        ? domains
+        : searchMatches.names.map(name => domainsByName.get(name)).filter(Boolean);
 
     return (
         <div>
@@ -94,6 +96,9 @@ const DomainsList = ({ onSelectDomain, onDataChange }) => {
                     value={filter}
                     onChange={(e) => setFilter(e.target.value)}
                 />
+                {searchMatches && searchMatches.names.length < searchMatches.total && (
+                    <span className="text-muted">Loading matches: {searchMatches.names.length} of {searchMatches.total}</span>
+                )}
             </div>
 
             <div className="card">
@@ -150,9 +150,11 @@ const ImagesList = ({ onSelectImage }) => {
         }
     };
 
-    const filteredImages = images.filter(img => 
-        img.name.toLowerCase().includes(filter.toLowerCase())
-    );
+    const searchMatches = useSearch(filter, 'image');
+    const imagesByName = React.useMemo(() => new Map(images.map(img => [img.name, img])), [images]);
+    const filteredImages = searchMatches === null
+        ? images
+        : searchMatches.names.map(name => imagesByName.get(name)).filter(Boolean);
 
     return (
         <div>
@@ -169,6 +171,9 @@ const ImagesList = ({ onSelectImage }) => {
                     value={filter}
                     onChange={(e) => setFilter(e.target.value)}
                 />
+                {searchMatches && searchMatches.names.length < searchMatches.total && (
+                    <span className="text-muted">Loading matches: {searchMatches.names.length} of {searchMatches.total}</span>
+                )}
             </div>
 
             <div className="card">
@@ -97,23 +97,19 @@ def create_domains():
     """Create all test domain versions."""
     print("\nCreating domain versions...")
     for domain in TEST_DOMAINS:
-        # Check if domain already exists
-        response = requests.get(f"{BASE_URL}/domains/{domain['name']}")
-        if response.status_code == 200:
-            existing_domains = response.json()
-            if any(d["version"] == domain["version"] and d.get("deployed") == "dev" for d in existing_domains):
-                print(f"  ⏭️  Domain {domain['name']} version {domain['version']} already exists, skipping")
-                continue
-        
+        # Creation is idempotent: an existing version is returned unchanged
+        headers = {"Idempotency-Key": f"load-domain-{domain['name']}-{domain['version']}"}
         response = requests.post(
             f"{BASE_URL}/domains/{domain['name']}/create",
             json={"version": domain["version"]},
+            headers=headers,
         )
         # Retry once on 500 error
         if response.status_code == 500:
             response = requests.post(
                 f"{BASE_URL}/domains/{domain['name']}/create",
                 json={"version": domain["version"]},
+                headers=headers,
             )
         
         if response.status_code == 201: